@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+
+# ---------- moteur d'agrégation vectorisé ----------
+# Une métrique = (opération, colonne[, paramètre]) :
+#   "wmean"     : moyenne pondérée par `weight`
+#   "wmedian"   : médiane pondérée (tri par x puis cumul des poids)
+#   "wquantile" : quantile pondéré, paramètre q dans [0,1]
+#   "wsum"      : somme des poids (colonne None) ou de x * poids
+#   "mean", "median", "sum" : équivalents non pondérés (comme pandas)
+#   "hmedian"   : médiane non pondérée d'un histogramme (`weight` = effectif de chaque x)
+#
+# Exemple :
+#   aggregate(df, "annee", {
+#       "taux_dinsertion_moy": ("wmean", "taux_dinsertion"),
+#       "salaire_median": ("wmedian", "salaire_net_median_des_emplois_a_temps_plein"),
+#       "n": ("wsum", None),
+#   })
+
+DEFAULT_WEIGHT = "nombre_de_reponses"
+
+
+def group_codes(df: pd.DataFrame, by, dropna: bool = True) -> tuple[np.ndarray, pd.DataFrame]:
+    """Code entier du groupe de chaque ligne (-1 si clé manquante) + table des clés triées."""
+    by = [by] if isinstance(by, str) else list(by)
+    gb = df.groupby(by, sort=True, dropna=dropna, observed=True)
+    codes = gb.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    keys = gb.size().index.to_frame(index=False)
+    return codes, keys
+
+
+def _as_float(df: pd.DataFrame, col) -> np.ndarray:
+    return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _weights(df: pd.DataFrame, weight) -> np.ndarray:
+    if weight is None or weight not in df.columns:
+        return np.ones(len(df), dtype=np.float64)
+    return np.nan_to_num(_as_float(df, weight), nan=0.0)
+
+
+def _segments(c: np.ndarray, n_groups: int) -> tuple[np.ndarray, np.ndarray]:
+    """Début et taille de chaque segment dans un tableau de codes trié."""
+    starts = np.searchsorted(c, np.arange(n_groups), side="left")
+    counts = np.bincount(c, minlength=n_groups)
+    return starts, counts
+
+
+def _wmean(codes, x, w, n_groups):
+    m = (codes >= 0) & ~np.isnan(x) & (w > 0)
+    num = np.bincount(codes[m], weights=x[m] * w[m], minlength=n_groups)
+    den = np.bincount(codes[m], weights=w[m], minlength=n_groups)
+    out = np.full(n_groups, np.nan)
+    np.divide(num, den, out=out, where=den > 0)
+    return out
+
+
+def _wquantile(codes, x, w, n_groups, q):
+    out = np.full(n_groups, np.nan)
+    m = (codes >= 0) & ~np.isnan(x) & (w > 0)
+    if not m.any():
+        return out
+    c, x, w = codes[m], x[m], w[m]
+
+    # un seul tri (groupe, x), puis poids cumulés sur l'ensemble des segments
+    order = np.lexsort((x, c))
+    c, x, w = c[order], x[order], w[order]
+    cw = np.cumsum(w)
+
+    starts, counts = _segments(c, n_groups)
+    present = counts > 0
+    ends = starts + counts - 1
+    base = np.where(starts > 0, cw[np.maximum(starts - 1, 0)], 0.0)
+    total = np.where(present, cw[np.minimum(ends, len(cw) - 1)], 0.0) - base
+
+    # premier x dont le poids cumulé (dans son groupe) atteint q * total
+    idx = np.searchsorted(cw, base + q * total, side="left")
+    idx = np.clip(idx, starts, ends)
+    out[present] = x[idx[present]]
+    return out
+
+
+def _mean(codes, x, n_groups):
+    m = (codes >= 0) & ~np.isnan(x)
+    s = np.bincount(codes[m], weights=x[m], minlength=n_groups)
+    k = np.bincount(codes[m], minlength=n_groups)
+    out = np.full(n_groups, np.nan)
+    np.divide(s, k, out=out, where=k > 0)
+    return out
+
+
+def _median(codes, x, n_groups, k=None):
+    """Médiane style pandas (moyenne des deux valeurs centrales) ; k = effectif de chaque x."""
+    out = np.full(n_groups, np.nan)
+    k = np.ones(len(x)) if k is None else k
+    m = (codes >= 0) & ~np.isnan(x) & (k > 0)
+    if not m.any():
+        return out
+    c, x, k = codes[m], x[m], k[m]
+    order = np.lexsort((x, c))
+    c, x, k = c[order], x[order], k[order]
+    ck = np.cumsum(k)
+
+    starts, counts = _segments(c, n_groups)
+    present = counts > 0
+    ends = starts + counts - 1
+    base = np.where(starts > 0, ck[np.maximum(starts - 1, 0)], 0.0)
+    total = np.where(present, ck[np.minimum(ends, len(ck) - 1)], 0.0) - base
+
+    # rangs (0-based) des deux valeurs centrales, puis position dans les segments
+    lo = np.searchsorted(ck, base + (total - 1) // 2 + 1, side="left")
+    hi = np.searchsorted(ck, base + total // 2 + 1, side="left")
+    lo, hi = np.clip(lo, starts, ends), np.clip(hi, starts, ends)
+    out[present] = (x[lo[present]] + x[hi[present]]) / 2.0
+    return out
+
+
+def _sum(codes, x, n_groups):
+    m = codes >= 0
+    return np.bincount(codes[m], weights=np.nan_to_num(x[m], nan=0.0), minlength=n_groups)
+
+
+def aggregate(df: pd.DataFrame, by, metrics: dict, weight=DEFAULT_WEIGHT) -> pd.DataFrame:
+    """
+    Agrège `df` par `by` en une passe NumPy (codes de groupe + bincount / tri segmenté).
+    Retourne une ligne par groupe (clés triées), colonnes = clés puis métriques.
+    """
+    codes, keys = group_codes(df, by)
+    n_groups = len(keys)
+    w = _weights(df, weight)
+
+    out = keys
+    cache = {}
+    for name, spec in metrics.items():
+        op, col, *param = spec
+        x = None
+        if col is not None:
+            if col not in cache:
+                cache[col] = _as_float(df, col)
+            x = cache[col]
+
+        if op == "wmean":
+            vals = _wmean(codes, x, w, n_groups)
+        elif op == "wmedian":
+            vals = _wquantile(codes, x, w, n_groups, 0.5)
+        elif op == "wquantile":
+            vals = _wquantile(codes, x, w, n_groups, float(param[0]))
+        elif op == "wsum":
+            vals = _sum(codes, w if x is None else x * w, n_groups)
+        elif op == "mean":
+            vals = _mean(codes, x, n_groups)
+        elif op == "median":
+            vals = _median(codes, x, n_groups)
+        elif op == "hmedian":
+            vals = _median(codes, x, n_groups, k=w)
+        elif op == "sum":
+            vals = _sum(codes, x, n_groups)
+        else:
+            raise ValueError(f"Opération d'agrégation inconnue: {op!r} ({name})")
+        out[name] = vals
+
+    return out
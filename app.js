@@ -4,6 +4,13 @@ async function fetchJSON(url) {
   return await res.json();
 }
 
+// Données de la page : bundle inline (#page-data) sinon une seule requête /api/bundle/<page>
+async function pageData(page, params = "") {
+  const inline = document.getElementById("page-data");
+  if (inline) return JSON.parse(inline.textContent);
+  return await fetchJSON(`/api/bundle/${page}${params}`);
+}
+
 function pct(x) {
   return x == null ? null : x * 100;
 }
@@ -45,7 +52,7 @@ function renderTable(containerId, columns, rows) {
 
 /* ------------------ INDEX ------------------ */
 async function renderIndex() {
-  const data = await fetchJSON("/api/by_year");
+  const { by_year: data } = await pageData("index");
   const sorted = data.filter(d => d.annee != null).sort((a, b) => a.annee - b.annee);
 
   const years = sorted.map(d => d.annee);
@@ -76,7 +83,7 @@ async function renderIndex() {
 
 /* ------------------ DOMAINES ------------------ */
 async function renderDomaines() {
-  const raw = await fetchJSON("/api/by_domaine");
+  const { by_domaine: raw } = await pageData("domaines");
 
   const topN = 12;
   const byInsertion = [...raw].sort((a, b) => (b.taux_dinsertion_moy ?? 0) - (a.taux_dinsertion_moy ?? 0)).slice(0, topN);
@@ -155,9 +162,18 @@ async function renderDomaines() {
 
 /* ------------------ ACADEMIES ------------------ */
 async function renderAcademies() {
-  const academies = await fetchJSON("/api/by_academie");
-  const regions = await fetchJSON("/api/by_region");
-  const geo = await fetchJSON("/static/geo/regions.geojson");
+  // Géométries simplifiées (TopoJSON) avec les indicateurs by_region déjà joints
+  const requested = new URLSearchParams(location.search).get("detail");
+  const detail = requested || (window.innerWidth < 700 ? "low" : "medium");
+  let { by_academie: academies, regions_geo: topo } = await pageData("academies", `?detail=${detail}`);
+  // bundle inline rendu avec le ?detail= de la page, medium par défaut : contours allégés à part sur petit écran
+  if (document.getElementById("page-data") && detail !== (requested || "medium")) {
+    topo = await fetchJSON(`/api/regions_geo?detail=${detail}`);
+  }
+  const geo = topojson.feature(topo, topo.objects.regions);
+  const regions = geo.features
+    .map(f => ({ region: f.properties.nom, ...f.properties }))
+    .filter(r => r.taux_dinsertion_moy != null);
 
   Plotly.newPlot(
     "map_regions",
@@ -196,8 +212,7 @@ async function renderAcademies() {
 
 /* ------------------ GENRE ------------------ */
 async function renderGenre() {
-  const byDomaine = await fetchJSON("/api/genre_by_domaine");
-  const byYear = await fetchJSON("/api/genre_by_year");
+  const { genre_by_domaine: byDomaine, genre_by_year: byYear } = await pageData("genre");
 
   const topN = 12;
   const top = [...byDomaine].sort((a, b) => (b.taux_dinsertion_moy ?? 0) - (a.taux_dinsertion_moy ?? 0)).slice(0, topN);
@@ -283,7 +298,7 @@ async function renderGenre() {
 
 /* ------------------ EQUITE (boursiers) ------------------ */
 async function renderEquite() {
-  const byDomaine = await fetchJSON("/api/equite_by_domaine");
+  const { equite_by_domaine: byDomaine } = await pageData("equite");
   const topN = 12;
   const top = [...byDomaine].sort((a, b) => (b.taux_dinsertion_moy ?? 0) - (a.taux_dinsertion_moy ?? 0)).slice(0, topN);
 
@@ -330,11 +345,7 @@ async function renderEquite() {
 
 /* ------------------ CONCLUSION ------------------ */
 async function renderConclusion() {
-  const [byYear, byDomaine, byAcademie] = await Promise.all([
-    fetchJSON("/api/by_year"),
-    fetchJSON("/api/by_domaine"),
-    fetchJSON("/api/by_academie")
-  ]);
+  const { by_year: byYear, by_domaine: byDomaine, by_academie: byAcademie } = await pageData("conclusion");
 
   const setText = (id, text) => {
     const el = document.getElementById(id);
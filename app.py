@@ -1,192 +1,661 @@
-from flask import Flask, render_template, jsonify
+from flask import Flask, Response, render_template, jsonify, request, g
+from markupsafe import Markup
 from pathlib import Path
+import gzip
 import json
-from functools import lru_cache
-import pandas as pd
+import os
+import sys
+import threading
+import time
 
 app = Flask(__name__, template_folder="templates", static_folder="static")
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
-PROCESSED_DIR = PROJECT_ROOT / "data" / "processed"
-
-ACADEMY_COORDS = {
-    # coordonnées approximatives (chefs-lieux d’académie)
-    "Aix-Marseille": (43.2965, 5.3698),
-    "Amiens": (49.8941, 2.2958),
-    "Besançon": (47.2378, 6.0241),
-    "Bordeaux": (44.8378, -0.5792),
-    "Clermont-Ferrand": (45.7772, 3.0870),
-    "Corse": (41.9192, 8.7386),
-    "Créteil": (48.7904, 2.4556),
-    "Dijon": (47.3220, 5.0415),
-    "Grenoble": (45.1885, 5.7245),
-    "Guadeloupe": (16.2410, -61.5330),
-    "Guyane": (4.9224, -52.3135),
-    "Lille": (50.6292, 3.0573),
-    "Limoges": (45.8336, 1.2611),
-    "Lyon": (45.7640, 4.8357),
-    "Martinique": (14.6161, -61.0588),
-    "Mayotte": (-12.7800, 45.2270),
-    "Montpellier": (43.6108, 3.8767),
-    "Nancy-Metz": (48.6921, 6.1844),
-    "Nantes": (47.2184, -1.5536),
-    "Nice": (43.7102, 7.2620),
-    "Normandie": (49.1829, -0.3707),
-    "Orléans-Tours": (47.9029, 1.9093),
-    "Paris": (48.8566, 2.3522),
-    "Poitiers": (46.5802, 0.3404),
-    "Reims": (49.2583, 4.0317),
-    "Rennes": (48.1173, -1.6778),
-    "Réunion": (-20.8789, 55.4481),
-    "Strasbourg": (48.5734, 7.7521),
-    "Toulouse": (43.6047, 1.4442),
-    "Versailles": (48.8049, 2.1204),
-}
-
+PROCESSED_DIR = Path(os.environ.get("PROCESSED_DIR", PROJECT_ROOT / "data" / "processed"))
+REGIONS_GEOJSON = Path(app.static_folder) / "geo" / "regions.geojson"
+# données de la page injectées dans le HTML (bundle) : aucun appel API au chargement
+INLINE_BUNDLES = os.environ.get("INLINE_BUNDLES", "1") != "0"
+# PRELOAD_TABLES=1 : cube et dataset chargés avec chaque version (pandas importé au démarrage)
+PRELOAD_TABLES = os.environ.get("PRELOAD_TABLES", "0") == "1"
+# = etl.geo.DEFAULT_LEVEL (sans importer numpy)
+DEFAULT_GEO_LEVEL = "medium"
+# = etl.aggregate.DEFAULT_WEIGHT
+DEFAULT_WEIGHT = "nombre_de_reponses"
+
+# le moteur d'agrégation vit dans etl/ (partagé avec le pipeline)
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+# Démarrage léger : stdlib + Flask seulement. Les endpoints statiques sont servis depuis les
+# sorties JSON de l'ETL (dont api/<endpoint>.json) ; pandas / pyarrow / numpy ne sont importés
+# (imports locaux) qu'à la première requête dynamique (agrégation, lignes, calcul de repli).
+from cache import TTLCache
+from responses import (ARROW_MIMETYPE, PreparedResponse, cached_json, prepare, response_format, send_payload,
+                       send_prepared, clear_prepared, table_to_arrow)
+from datastore import DataStore, StaleSnapshot
+from etl.manifest import API_DIR, MANIFEST_NAME, read_manifest
+from etl.instrument import REGISTRY, begin_phases, end_phases, phase, rss_detail, server_timing
 
-@lru_cache(maxsize=16)
+def _records(df) -> list[dict]:
+    from etl.endpoints import records
+    return records(df)
+
+
+def _load_tables(processed_dir: Path) -> dict:
+    """
+    Cube et dataset propre d'une version, mappés (Arrow IPC écrit par l'ETL) : un seul
+    exemplaire en mémoire pour tous les workers du serveur.
+    """
+    import pandas as pd
+    from etl.cube import build_cube, compact_cube, frame_bytes, map_cube, CUBE_DIMS, CUBE_MEASURES
+    from etl.dataset import current_generation, open_clean, read_clean
+    from etl.load import ACADEMY_TO_REGION
+    from etl.ranking import RankIndex
+
+    clean = open_clean(processed_dir, mmap=True)
+    # table de service compacte, partagée en lecture par toutes les requêtes (copy-on-write)
+    cube = map_cube(processed_dir)
+    source = "mappé"
+    if cube is None:
+        # sorties d'une ETL antérieure : copie privée du cube
+        cells_path = processed_dir / "cube.parquet"
+        sketch_path = processed_dir / "cube_sketch.parquet"
+        if cells_path.exists() and sketch_path.exists():
+            raw_cube = (pd.read_parquet(cells_path), pd.read_parquet(sketch_path))
+        else:
+            # seules les colonnes du cube sont lues
+            columns = CUBE_DIMS + CUBE_MEASURES + [DEFAULT_WEIGHT]
+            raw_cube = build_cube(read_clean(clean, columns=columns), ACADEMY_TO_REGION)
+        cube = compact_cube(*raw_cube)
+        source = "en mémoire"
+    rss = rss_detail() or {}
+    mo = lambda key: rss[key] / 2**20 if key in rss else float("nan")
+    print(f"[data] cube {source} : {len(cube[0])} cellules + {len(cube[1])} lignes de sketch, "
+          f"{frame_bytes(*cube) / 2**20:.2f} Mo ; RSS processus : privé {mo('anon'):.0f} Mo, "
+          f"fichiers mappés {mo('file'):.0f} Mo")
+    # index de classement écrits par l'ETL avec la génération ; sinon calculés sur la table
+    gen_dir = current_generation(processed_dir)
+    ranking = RankIndex.open(gen_dir) if gen_dir is not None else None
+    if ranking is None:
+        ranking = RankIndex.build(clean.to_table(), gen_dir.name if gen_dir is not None else "clean.parquet")
+    return {"clean": clean, "cube": cube, "ranking": ranking}
+
+
+class _Tables:
+    """
+    Tables d'une version, chargées une fois à la première requête qui en a besoin.
+    `version` : version du manifest lue avec les JSON du snapshot. Les tables ne sont gardées
+    que si le manifest n'a pas changé avant et après leur lecture (comme DataStore._load) ;
+    sinon les fichiers sont ceux d'une ETL plus récente : StaleSnapshot, rien n'est chargé.
+    """
+
+    def __init__(self, processed_dir: Path, version: str):
+        self.processed_dir = processed_dir
+        self.version = version
+        self._value = None
+        self._lock = threading.Lock()
+
+    def _check(self) -> None:
+        if store.probe()[0] != self.version:
+            store.maybe_refresh(force=True)
+            raise StaleSnapshot(f"version {self.version} remplacée sur disque pendant le chargement des tables")
+
+    def get(self) -> dict:
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    t0 = time.perf_counter()
+                    self._check()
+                    value = _load_tables(self.processed_dir)
+                    self._check()
+                    self._value = value
+                    print(f"[data] tables chargées en {time.perf_counter() - t0:.2f}s (pandas/pyarrow)")
+        return self._value
+
+
+def _load_processed(processed_dir: Path) -> dict:
+    """
+    Charge une version de data/processed avec la stdlib seule : JSON de l'ETL (rollups,
+    géométries) et sorties pré-calculées des endpoints (api/<nom>.json).
+    Cube et dataset propre : à la demande (_Tables), ou tout de suite si PRELOAD_TABLES ;
+    liés à la version du manifest lue ici (DataStore._load relit tout si elle change).
+    """
+    version = store.probe()[0]
+    rollups = {}
+    for path in sorted(processed_dir.glob("*.json")):
+        if path.name != MANIFEST_NAME:
+            with open(path, "r", encoding="utf-8") as f:
+                rollups[path.name] = json.load(f)
+    api = {}
+    for path in sorted((processed_dir / API_DIR).glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            api[path.stem] = json.load(f)
+    tables = _Tables(processed_dir, version)
+    if PRELOAD_TABLES:
+        tables.get()
+    return {"json": rollups, "api": api, "tables": tables}
+
+
+store = DataStore(PROCESSED_DIR, _load_processed, poll_interval=float(os.environ.get("DATA_POLL_SECONDS", "5")))
+
+def data_version() -> str:
+    with phase("data"):  # premier appel : chargement du snapshot
+        return store.version
+
 def read_json(filename: str):
-    path = PROCESSED_DIR / filename
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    with phase("data"):
+        return store.current().data["json"][filename]
+
+def read_table(columns=None, annee=None, limit=None, strict=False, **members):
+    """
+    Table Arrow du dataset propre : projection + filtres poussés au lecteur parquet (partitions
+    élaguées), lecture arrêtée après `limit` lignes ; strict : ValueError sur une colonne inconnue.
+    """
+    from etl.dataset import read_clean_table
+    with phase("data"):
+        return read_clean_table(store.current().data["tables"].get()["clean"], columns=columns, annee=annee,
+                                limit=limit, strict=strict, **members)
 
-@lru_cache(maxsize=4)
-def read_parquet():
-    path = PROCESSED_DIR / "clean.parquet"
-    return pd.read_parquet(path)
+def read_rows(columns=None, annee=None, limit=None, **members):
+    """read_table en DataFrame."""
+    table = read_table(columns=columns, annee=annee, limit=limit, **members)
+    with phase("data"):
+        return table.to_pandas()
 
+def read_cube():
+    """Cube d'agrégats écrit par l'ETL (reconstruit depuis clean.parquet s'il manque)."""
+    with phase("data"):
+        return store.current().data["tables"].get()["cube"]
+
+def prerendered(name: str):
+    """Sortie de /api/<name> pré-calculée par l'ETL ; sinon calculée sur le cube (import de pandas)."""
+    with phase("data"):
+        data = store.current().data
+        if name in data["api"]:
+            return data["api"][name]
+    from etl.endpoints import ENDPOINTS
+    return ENDPOINTS[name](read_cube(), data["json"])
+
+# --- Instrumentation : latence par endpoint, phases data/agg/serialize (Server-Timing) ---
+REGISTRY.describe("http_request_duration_seconds", "histogram", "Latence des requêtes par endpoint")
+REGISTRY.describe("http_requests_total", "counter", "Requêtes par endpoint et statut")
+REGISTRY.describe("http_request_phase_seconds_total", "counter",
+                  "Temps cumulé par phase (data, agg, serialize) et par endpoint")
+REGISTRY.describe("cache_hits_total", "counter", "Succès de cache")
+REGISTRY.describe("cache_misses_total", "counter", "Échecs de cache")
+REGISTRY.describe("cache_hit_ratio", "gauge", "Taux de succès du cache")
+REGISTRY.describe("cache_entries", "gauge", "Entrées en cache")
+REGISTRY.describe("data_version_info", "gauge", "Version des données servies")
+REGISTRY.describe("data_loaded_timestamp_seconds", "gauge", "Horodatage du chargement des données")
+
+@app.errorhandler(StaleSnapshot)
+def _stale_snapshot(e):
+    # nouvelle version publiée, en cours de chargement : rien n'est mis en cache sous l'ancienne
+    resp = jsonify({"error": "données en cours de mise à jour, réessayer"})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = "1"
+    return resp
+
+@app.before_request
+def _start_timing():
+    g.request_start = time.perf_counter()
+    begin_phases()
+
+@app.after_request
+def _record_timing(resp):
+    start = g.pop("request_start", None)
+    if start is None:
+        return resp
+    total = time.perf_counter() - start
+    phases = end_phases()
+    endpoint = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    REGISTRY.observe("http_request_duration_seconds", total, endpoint=endpoint)
+    REGISTRY.inc("http_requests_total", endpoint=endpoint, status=str(resp.status_code))
+    for name, seconds in phases.items():
+        REGISTRY.inc("http_request_phase_seconds_total", seconds, endpoint=endpoint, phase=name)
+    resp.headers["Server-Timing"] = server_timing(phases, total)
+    return resp
+
+@app.before_request
+def _refresh_data():
+    store.maybe_refresh()
+
+
+def render_page(page: str):
+    """
+    Template de la page, avec son bundle de données inline si INLINE_BUNDLES.
+    Page rendue et compressée une fois par version (elle porte le TopoJSON des académies...).
+    """
+    if not INLINE_BUNDLES:
+        return render_template(f"{page}.html", page_data=None)
+    key = (data_version(), "page", page, tuple(request.args.get(a) for a in BUNDLE_ARGS))
+    cached = bundle_cache.get(key)
+    if cached is None:
+        prepared = page_bundle(page)
+        if not isinstance(prepared, PreparedResponse):
+            # paramètre invalide : page sans données, app.js affichera l'erreur du bundle
+            return render_template(f"{page}.html", page_data=None)
+        html = render_template(f"{page}.html", page_data=_script_json(prepared.body)).encode("utf-8")
+        cached = (html, gzip.compress(html, compresslevel=6, mtime=0))
+        bundle_cache.set(key, cached)
+    html, html_gz = cached
+    # corps choisi selon Accept-Encoding : Vary sur les deux variantes (caches partagés)
+    if not request.accept_encodings["gzip"]:
+        resp = Response(html, mimetype="text/html")
+    else:
+        resp = Response(html_gz, mimetype="text/html")
+        resp.headers["Content-Encoding"] = "gzip"
+    resp.vary.add("Accept-Encoding")
+    return resp
 
 @app.route("/")
 def index():
-    return render_template("index.html")
+    return render_page("index")
 
 @app.route("/domaines")
 def domaines():
-    return render_template("domaines.html")
+    return render_page("domaines")
 
 @app.route("/academies")
 def academies():
-    return render_template("academies.html")
+    return render_page("academies")
 
 @app.route("/genre")
 def genre():
-    return render_template("genre.html")
+    return render_page("genre")
 
 @app.route("/equite")
 def equite():
-    return render_template("equite.html")
+    return render_page("equite")
 
 @app.route("/conclusion")
 def conclusion():
-    return render_template("conclusion.html")
+    return render_page("conclusion")
 
 # --- API (le front fetch ces endpoints) ---
 @app.route("/api/by_year")
+@cached_json(data_version)
 def api_by_year():
-    return jsonify(read_json("by_year.json"))
+    return read_json("by_year.json")
 
 @app.route("/api/by_domaine")
+@cached_json(data_version)
 def api_by_domaine():
-    df = read_parquet()
-    if "domaine" not in df.columns:
-        return jsonify([])
-    df = df.copy()
-    df["n_effectif"] = df["nombre_de_reponses"].fillna(0)
-    df["salaire_x_n"] = df["salaire_net_median_des_emplois_a_temps_plein"] * df["n_effectif"]
-    agg = df.groupby("domaine").agg(
-        taux_dinsertion_moy=("taux_dinsertion", "mean"),
-        salaire_median=("salaire_net_median_des_emplois_a_temps_plein", "median"),
-        salaire_moyen_num=("salaire_x_n", "sum"),
-        salaire_moyen_den=("n_effectif", "sum"),
-        n=("nombre_de_reponses", "sum")
-    )
-    agg["salaire_moyen"] = agg.apply(
-        lambda r: (r["salaire_moyen_num"] / r["salaire_moyen_den"]) if r["salaire_moyen_den"] else None,
-        axis=1
-    )
-    agg = agg.drop(columns=["salaire_moyen_num", "salaire_moyen_den"])
-    agg = agg.reset_index()
-    agg = agg.astype(object).where(pd.notnull(agg), None)
-    return jsonify(agg.to_dict(orient="records"))
-
+    return prerendered("by_domaine")
+
 @app.route("/api/by_academie")
+@cached_json(data_version)
 def api_by_academie():
-    return jsonify(read_json("by_academie.json"))
+    return read_json("by_academie.json")
 
 @app.route("/api/genre_by_domaine")
+@cached_json(data_version)
 def api_genre_by_domaine():
-    df = read_parquet().copy()
-    if "domaine" not in df.columns or "femmes" not in df.columns:
-        return jsonify([])
-    df["n_effectif"] = df["nombre_de_reponses"].fillna(0)
-    df["salaire_x_n"] = df["salaire_net_median_des_emplois_a_temps_plein"] * df["n_effectif"]
-    agg = df.groupby("domaine").agg(
-        taux_dinsertion_moy=("taux_dinsertion", "mean"),
-        part_femmes=("femmes", "mean"),
-        n=("nombre_de_reponses", "sum"),
-        salaire_median=("salaire_net_median_des_emplois_a_temps_plein", "median"),
-        salaire_moyen_num=("salaire_x_n", "sum"),
-        salaire_moyen_den=("n_effectif", "sum")
-    )
-    agg["salaire_moyen"] = agg.apply(
-        lambda r: (r["salaire_moyen_num"] / r["salaire_moyen_den"]) if r["salaire_moyen_den"] else None,
-        axis=1
-    )
-    agg = agg.drop(columns=["salaire_moyen_num", "salaire_moyen_den"]).reset_index()
-    agg = agg.astype(object).where(pd.notnull(agg), None)
-    return jsonify(agg.to_dict(orient="records"))
+    return prerendered("genre_by_domaine")
 
 @app.route("/api/genre_by_year")
+@cached_json(data_version)
 def api_genre_by_year():
-    df = read_parquet().copy()
-    if "annee" not in df.columns or "femmes" not in df.columns:
-        return jsonify([])
-    agg = (
-        df.groupby("annee")
-        .agg({
-            "taux_dinsertion": "mean",
-            "femmes": "mean",
-            "nombre_de_reponses": "sum"
-        })
-        .reset_index()
-        .rename(columns={
-            "taux_dinsertion": "taux_dinsertion_moy",
-            "femmes": "part_femmes",
-            "nombre_de_reponses": "n"
-        })
-    )
-    agg = agg.astype(object).where(pd.notnull(agg), None)
-    return jsonify(agg.to_dict(orient="records"))
+    return prerendered("genre_by_year")
 
 @app.route("/api/equite_by_domaine")
+@cached_json(data_version)
 def api_equite_by_domaine():
-    df = read_parquet().copy()
-    if "domaine" not in df.columns or "de_diplomes_boursiers" not in df.columns:
-        return jsonify([])
-    df["n_effectif"] = df["nombre_de_reponses"].fillna(0)
-    agg = df.groupby("domaine").agg(
-        taux_dinsertion_moy=("taux_dinsertion", "mean"),
-        part_boursiers=("de_diplomes_boursiers", "mean"),
-        n=("nombre_de_reponses", "sum"),
-        salaire_median=("salaire_net_median_des_emplois_a_temps_plein", "median")
-    ).reset_index()
-    agg = agg.astype(object).where(pd.notnull(agg), None)
-    return jsonify(agg.to_dict(orient="records"))
-
+    return prerendered("equite_by_domaine")
+
 @app.route("/api/academies_map")
-def api_academies_map():
-    data = read_json("by_academie.json")
-    out = []
-    for r in data:
-        name = r.get("academie")
-        if name in ACADEMY_COORDS:
-            lat, lon = ACADEMY_COORDS[name]
-            out.append({**r, "lat": lat, "lon": lon})
-    return jsonify(out)
+@cached_json(data_version)
+def api_academies_map():
+    return prerendered("academies_map")
 
 @app.route("/api/by_region")
+@cached_json(data_version)
 def api_by_region():
-    return jsonify(read_json("by_region.json"))
+    return read_json("by_region.json")
+
+@app.route("/api/regions_geo")
+@cached_json(data_version, query_args=("detail",))
+def api_regions_geo():
+    """TopoJSON simplifié des régions (detail=low|medium|high), propriétés by_region pré-jointes."""
+    detail = request.args.get("detail", DEFAULT_GEO_LEVEL)
+    rollups = store.current().data["json"]
+    name = f"regions_{detail}.topo.json"
+    if name in rollups:
+        return rollups[name]
+    from etl.geo import GEO_LEVELS, build_topology, topology_level, region_properties
+    if detail not in GEO_LEVELS:
+        return jsonify({"error": f"detail inconnu: {detail!r} ({', '.join(GEO_LEVELS)})"}), 400
+    # sorties antérieures à l'étape géométrie : calcul à la volée (mis en cache par version)
+    with open(REGIONS_GEOJSON, "r", encoding="utf-8") as f:
+        features = json.load(f)["features"]
+    tolerance, quantum = GEO_LEVELS[detail]
+    props = region_properties(rollups.get("by_region.json", []))
+    return topology_level(features, build_topology(features), tolerance, quantum, props)
+
+# --- Bundles : toutes les données d'une page en une réponse ---
+# page -> endpoints /api/<nom> dont la page a besoin (clés du bundle)
+PAGE_BUNDLES = {
+    "index": ("by_year",),
+    "domaines": ("by_domaine",),
+    "academies": ("by_academie", "regions_geo"),
+    "genre": ("genre_by_domaine", "genre_by_year"),
+    "equite": ("equite_by_domaine",),
+    "conclusion": ("by_year", "by_domaine", "by_academie"),
+}
+# paramètres des endpoints repris par le bundle (regions_geo : detail)
+BUNDLE_ARGS = ("detail",)
+
+bundle_cache = TTLCache(maxsize=64, ttl=600)
+store.on_swap(bundle_cache.clear)
+
+
+def page_bundle(page: str):
+    """
+    Bundle d'une page, sérialisé et compressé une fois par version de données.
+    Les vues /api/* sont appelées sans leur cache de réponse (__wrapped__) ;
+    une erreur d'une vue (detail inconnu...) est renvoyée telle quelle.
+    """
+    key = (data_version(), page, tuple(request.args.get(a) for a in BUNDLE_ARGS))
+    prepared = bundle_cache.get(key)
+    if prepared is None:
+        payload = {}
+        for name in PAGE_BUNDLES[page]:
+            part = app.view_functions[f"api_{name}"].__wrapped__()
+            if isinstance(part, (Response, tuple)):
+                return part
+            payload[name] = part
+        prepared = prepare(payload)
+        bundle_cache.set(key, prepared)
+    return prepared
+
+
+def _script_json(body: bytes) -> Markup:
+    # JSON sûr dans <script> : "<", ">", "&" n'apparaissent que dans des chaînes, échappés en \uXXXX
+    text = body.decode("utf-8").replace("<", "\\u003c").replace(">", "\\u003e").replace("&", "\\u0026")
+    return Markup(text)
+
+
+@app.route("/api/bundle/<page>")
+def api_bundle(page):
+    """/api/bundle/academies?detail=low : données de la page (clés = noms des endpoints /api/*)."""
+    if page not in PAGE_BUNDLES:
+        return jsonify({"error": f"page inconnue: {page!r} ({', '.join(PAGE_BUNDLES)})"}), 404
+    if request.args.get("format", "json") != "json":
+        # plusieurs réponses de formes différentes : ?format= sur les endpoints /api/<nom>
+        return jsonify({"error": "format=json seulement pour les bundles"}), 400
+    prepared = page_bundle(page)
+    if not isinstance(prepared, PreparedResponse):
+        return prepared
+    return send_prepared(prepared)
+
+# --- Agrégation générique (filtres + group-by sur le cube) ---
+AGG_METRICS = {
+    "taux_dinsertion_moy": ("wmean", "taux_dinsertion"),
+    "taux_emploi_moy": ("wmean", "taux_d_emploi"),
+    "salaire_median": ("wmedian", "salaire_net_median_des_emplois_a_temps_plein"),
+    "salaire_moyen": ("wmean", "salaire_net_median_des_emplois_a_temps_plein"),
+    "part_femmes": ("wmean", "femmes"),
+    "part_boursiers": ("wmean", "de_diplomes_boursiers"),
+    "n": ("wsum", None),
+}
+AGG_DEFAULT_METRICS = ["taux_dinsertion_moy", "salaire_median", "n"]
+AGG_FILTER_DIMS = ["academie", "domaine", "region", "situation"]
+
+agg_cache = TTLCache(maxsize=512, ttl=600)
+
+# nouvelle version des données -> caches dérivés purgés en même temps
+store.on_swap(agg_cache.clear)
+store.on_swap(clear_prepared)
+
+
+def _csv_arg(name: str) -> list[str]:
+    return [v.strip() for raw in request.args.getlist(name) for v in raw.split(",") if v.strip()]
+
+
+def _int_arg(name: str):
+    raw = request.args.get(name)
+    if raw in (None, ""):
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        raise ValueError(f"{name} doit être un entier: {raw!r}")
+
+
+def _aggregate_query() -> tuple:
+    """Lit et normalise la requête /api/aggregate (sert aussi de clé de cache)."""
+    from etl.cube import CUBE_DIMS
+    by = _csv_arg("by") or ["annee"]
+    metrics = _csv_arg("metrics") or AGG_DEFAULT_METRICS
+    bad = [d for d in by if d not in CUBE_DIMS] + [m for m in metrics if m not in AGG_METRICS]
+    if bad:
+        raise ValueError(f"Dimensions/métriques inconnues: {bad}")
+    members = tuple((d, tuple(sorted(set(_csv_arg(d))))) for d in AGG_FILTER_DIMS)
+    # dimensions absentes du cube chargé (ex. region sans table académie -> région)
+    cells = read_cube()[0]
+    missing = [d for d in by + [d for d, values in members if values] if d not in cells.columns]
+    if missing:
+        raise ValueError(f"Dimensions absentes du cube: {missing}")
+
+    sort = request.args.get("sort") or None
+    if sort is not None and sort.lstrip("-") not in by + metrics:
+        raise ValueError(f"Tri impossible sur {sort!r}")
+    limit = _int_arg("limit")
+    if limit is not None and limit < 0:
+        raise ValueError("limit doit être positif")
+
+    annee = (_int_arg("annee_min"), _int_arg("annee_max"))
+    return (tuple(by), tuple(metrics), annee, members, sort, limit)
+
+
+def _run_aggregate(query: tuple) -> list[dict]:
+    from etl.cube import rollup, slice_cube
+    by, metrics, annee, members, sort, limit = query
+    cube = read_cube()
+    with phase("agg"):
+        cells, sketch = slice_cube(*cube, annee=annee, **dict(members))
+        agg = rollup(cells, sketch, list(by), {m: AGG_METRICS[m] for m in metrics})
+        if sort is not None:
+            agg = agg.sort_values(sort.lstrip("-"), ascending=not sort.startswith("-"), na_position="last")
+        if limit is not None:
+            agg = agg.head(limit)
+    return _records(agg)
+
+
+@app.route("/api/aggregate")
+def api_aggregate():
+    """
+    /api/aggregate?by=domaine,annee&metrics=taux_dinsertion_moy,n
+        &annee_min=2015&annee_max=2020&academie=Lyon&domaine=...&sort=-n&limit=10&format=columnar
+    """
+    try:
+        query = _aggregate_query()
+        fmt = response_format()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    key = (data_version(), query, fmt)
+    prepared = agg_cache.get(key)
+    status = "HIT"
+    if prepared is None:
+        prepared = prepare(_run_aggregate(query), fmt)
+        agg_cache.set(key, prepared)
+        status = "MISS"
+    resp = send_prepared(prepared)
+    resp.headers["X-Cache"] = status
+    return resp
+
+@app.route("/api/aggregate/stats")
+def api_aggregate_stats():
+    return jsonify(agg_cache.stats())
+
+# --- Lignes détaillées (projection + filtres poussés au dataset partitionné) ---
+RECORDS_MAX = 5000
+
+@app.route("/api/records")
+def api_records():
+    """/api/records?annee=2018&domaine=...&academie=...&columns=discipline,taux_dinsertion&limit=100&format=arrow"""
+    try:
+        annee = (_int_arg("annee_min"), _int_arg("annee_max"))
+        if _int_arg("annee") is not None:
+            annee = (_int_arg("annee"), _int_arg("annee"))
+        limit = _int_arg("limit")
+        if limit is not None and limit <= 0:
+            raise ValueError("limit doit être strictement positif")
+        limit = min(limit or RECORDS_MAX, RECORDS_MAX)
+        fmt = response_format()
+        columns = _csv_arg("columns") or None
+        members = {d: request.args.getlist(d) for d in AGG_FILTER_DIMS if d != "region"}
+        table = read_table(columns=columns, annee=annee, limit=limit, strict=True, **members)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if fmt == "arrow":
+        # flux IPC directement depuis la table lue : types du dataset conservés (sans passer par pandas)
+        with phase("serialize"):
+            return Response(table_to_arrow(table), mimetype=ARROW_MIMETYPE)
+    with phase("data"):
+        rows = table.to_pandas()
+    return send_payload(_records(rows), fmt)
+
+# --- Classements paginés (index triés pré-calculés, curseur) ---
+RANKING_MAX = 500
+RANKING_FIELDS = ["annee", "academie", "etablissement", "domaine", "discipline", "situation"]
+
+def _ranking_query(index) -> tuple:
+    """Lit et valide la requête /api/ranking."""
+    from etl.ranking import decode_cursor, filters_key, RANK_FILTER_DIMS
+    metric = request.args.get("metric") or "taux_dinsertion"
+    if metric not in index.orders:
+        raise ValueError(f"metric inconnue: {metric!r} ({', '.join(index.orders)})")
+    order = request.args.get("order") or "desc"
+    if order not in ("asc", "desc"):
+        raise ValueError("order doit valoir asc ou desc")
+    limit = _int_arg("limit")
+    limit = 50 if limit is None else limit
+    if not 0 < limit <= RANKING_MAX:
+        raise ValueError(f"limit doit être entre 1 et {RANKING_MAX}")
+    raw = request.args.get("min_n")
+    try:
+        min_n = float(raw) if raw not in (None, "") else None
+    except ValueError:
+        raise ValueError(f"min_n doit être un nombre: {raw!r}")
+
+    filters = {}
+    for dim in RANK_FILTER_DIMS:
+        values = request.args.getlist(dim)
+        if dim != "annee" and values:
+            filters[dim] = index.allowed(dim, values)
+    lo, hi = _int_arg("annee_min"), _int_arg("annee_max")
+    if _int_arg("annee") is not None:
+        lo = hi = _int_arg("annee")
+    if lo is not None or hi is not None:
+        filters["annee"] = index.year_codes(lo, hi)
+
+    after, offset = None, 0
+    token = request.args.get("cursor")
+    if token:
+        generation, cursor_metric, descending, cursor_filters, value, row, offset = decode_cursor(token)
+        if generation != index.generation:
+            raise ValueError("curseur périmé : nouvelle version des données, reprendre sans cursor")
+        if cursor_metric != metric or descending != (order == "desc"):
+            raise ValueError("curseur d'un autre classement (metric / order)")
+        if cursor_filters != filters_key(filters, min_n):
+            raise ValueError("curseur d'un autre classement (filtres / min_n)")
+        after = (value, row)
+    return metric, order == "desc", filters, min_n, limit, after, offset
+
+@app.route("/api/ranking")
+def api_ranking():
+    """
+    /api/ranking?metric=taux_dinsertion&academie=Lyon&annee_min=2018&min_n=30&limit=50
+        &order=desc&columns=discipline,etablissement&cursor=<next_cursor de la page précédente>
+    Lignes du dataset propre classées par `metric` ; top-K et page suivante sans tri de la table.
+    format=columnar|arrow : s'applique à `items` (arrow : metric, order, next_cursor en métadonnées).
+    """
+    from etl.ranking import encode_cursor, filters_key, RANK_WEIGHT
+    tables = store.current().data["tables"].get()
+    index = tables["ranking"]
+    try:
+        metric, descending, filters, min_n, limit, after, offset = _ranking_query(index)
+        fmt = response_format()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with phase("agg"):
+        rows, more = index.query(metric, filters, min_n, limit, descending, after)
+    clean = tables["clean"]
+    columns = list(dict.fromkeys((_csv_arg("columns") or RANKING_FIELDS) + [metric, RANK_WEIGHT]))
+    columns = [c for c in columns if c in clean.schema.names]
+    with phase("data"):
+        items = clean.take(rows, columns=columns).to_pylist() if len(rows) else []
+    for rank, item in enumerate(items, start=offset + 1):
+        item["rang"] = rank
+    cursor = None
+    if more:
+        last = int(rows[-1])
+        cursor = encode_cursor(index.generation, metric, descending, filters_key(filters, min_n),
+                               float(index.keys[metric][last]), last, offset + len(rows))
+    return send_payload({"metric": metric, "order": "desc" if descending else "asc", "items": items,
+                         "next_cursor": cursor}, fmt, rows_key="items")
+
+# --- Facteurs associés à l'insertion (corrélations pondérées, calculées par l'ETL) ---
+# = etl.factors.FACTOR_SLICES (sans importer pandas)
+FACTOR_SLICES = ("annee", "domaine")
+
+def factor_report() -> dict:
+    """api/factors.json de la version courante ; sinon calculé sur le dataset propre."""
+    data = store.current().data
+    if "factors" in data["api"]:
+        return data["api"]["factors"]
+    from etl.factors import factor_report as compute, FACTOR_COLS
+    rows = read_rows(columns=list(FACTOR_SLICES) + FACTOR_COLS + [DEFAULT_WEIGHT])
+    with phase("agg"):
+        return compute(rows)
+
+@app.route("/api/factors")
+@cached_json(data_version, query_args=("by",))
+def api_factors():
+    """
+    /api/factors?by=annee|domaine : corrélations pondérées (nombre_de_reponses) entre colonnes
+    numériques, pentes simple et partielle de taux_dinsertion sur chaque colonne ; une tranche
+    par valeur de `by` (table entière sans `by`).
+    """
+    by = request.args.get("by") or "all"
+    if by not in ("all",) + FACTOR_SLICES:
+        return jsonify({"error": f"by inconnu: {by!r} ({', '.join(FACTOR_SLICES)})"}), 400
+    report = factor_report()
+    return {"cible": report["cible"], "poids": report["poids"], "variables": report["variables"],
+            "by": None if by == "all" else by, "slices": report["slices"].get(by, [])}
+
+@app.route("/metrics")
+def metrics():
+    """Métriques au format texte Prometheus (latences, phases, caches, dernière exécution ETL)."""
+    for cache, ttl_cache in (("aggregate", agg_cache), ("bundle", bundle_cache)):
+        stats = ttl_cache.stats()
+        REGISTRY.set("cache_hits_total", stats["hits"], cache=cache)
+        REGISTRY.set("cache_misses_total", stats["misses"], cache=cache)
+        REGISTRY.set("cache_entries", stats["size"], cache=cache)
+    for cache in ("aggregate", "bundle", "prepared"):
+        hits = REGISTRY.value("cache_hits_total", cache=cache)
+        total = hits + REGISTRY.value("cache_misses_total", cache=cache)
+        REGISTRY.set("cache_hit_ratio", hits / total if total else 0.0, cache=cache)
+
+    snap = store.current()
+    REGISTRY.clear("data_version_info")
+    REGISTRY.set("data_version_info", 1, version=snap.version)
+    REGISTRY.set("data_loaded_timestamp_seconds", snap.loaded_at)
+    # mesures de la dernière ETL, jointes au manifest par run.py
+    for name, s in ((read_manifest(store.processed_dir) or {}).get("etl") or {}).items():
+        REGISTRY.set("etl_stage_duration_seconds", s["duration_s"], stage=name)
+        if s.get("rows") is not None:
+            REGISTRY.set("etl_stage_rows", s["rows"], stage=name)
+        if s.get("rss_bytes") is not None:
+            REGISTRY.set("etl_stage_rss_bytes", s["rss_bytes"], stage=name)
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/data_version")
+def api_data_version():
+    snap = store.current()
+    return jsonify({"version": snap.version, "created_at": snap.created_at, "loaded_at": snap.loaded_at})
 
 if __name__ == "__main__":
     app.run(debug=True)
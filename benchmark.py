@@ -0,0 +1,399 @@
+"""
+Banc de mesure ETL + API sur données synthétiques (etl/synthetic.py).
+
+    python -m etl.benchmark                         # échelles 1x, 10x, 100x
+    python -m etl.benchmark --scales 1 10 --save-baseline
+    python -m etl.benchmark --workdir data/bench    # réutilise les CSV générés
+
+Pour chaque échelle : durée (wall) et pic de RSS de chaque étape ETL, puis latences
+des endpoints /api/* via le client de test Flask (requêtes concurrentes), dans un
+processus séparé (mémoire du serveur mesurée seule). Les résultats sont comparés
+à une référence enregistrée ; code de sortie 1 en cas de régression.
+"""
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timezone
+import argparse
+import gc
+import io
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+from etl.synthetic import write_raw_csv
+from etl.extract import extract
+from etl.transform import transform
+from etl.load import load, build_by_region
+from etl.geo import build_regions_geo
+from etl.manifest import write_manifest
+from etl.instrument import rss_bytes
+from etl.parallel import resolve_workers
+from etl.pipeline import Pipeline
+from etl.run import etl_stages
+from etl.stream import stream_etl
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_BASELINE = Path(__file__).with_name("bench_baseline.json")
+DEFAULT_SCALES = [1, 10, 100]
+
+SAMPLE_SECONDS = 0.01
+
+API_HEADERS = {"Accept-Encoding": "gzip"}
+# nom -> URL ; {i} = numéro de requête (clé de cache différente à chaque appel)
+API_ENDPOINTS = {
+    "by_year": "/api/by_year",
+    "by_domaine": "/api/by_domaine",
+    "by_academie": "/api/by_academie",
+    "by_region": "/api/by_region",
+    "genre_by_domaine": "/api/genre_by_domaine",
+    "genre_by_year": "/api/genre_by_year",
+    "equite_by_domaine": "/api/equite_by_domaine",
+    "academies_map": "/api/academies_map",
+    "regions_geo": "/api/regions_geo?detail=medium",
+    "aggregate": "/api/aggregate?by=domaine,annee&metrics=taux_dinsertion_moy,salaire_median,n",
+    "aggregate_miss": "/api/aggregate?by=academie,situation&annee_min=2012&limit={i}",
+    "records": "/api/records?annee=2018&columns=academie,domaine,taux_dinsertion&limit=500",
+    "records_columnar": "/api/records?annee=2018&columns=academie,domaine,taux_dinsertion&limit=500&format=columnar",
+    "records_arrow": "/api/records?annee=2018&columns=academie,domaine,taux_dinsertion&limit=500&format=arrow",
+    "factors": "/api/factors?by=annee",
+    "ranking": "/api/ranking?metric=taux_dinsertion&academie=Lyon&annee_min=2018&min_n=30&limit=50",
+    "bundle_academies": "/api/bundle/academies?detail=medium",
+    "page_academies": "/academies",
+}
+
+# démarrage à froid : URLs servies dans l'ordre par un processus neuf
+COLD_START_URLS = ("/api/genre_by_domaine", "/academies")
+# modules lourds dont on vérifie l'absence après la première réponse (mode léger)
+HEAVY_MODULES = ("pandas", "pyarrow", "numpy")
+# interpréteur neuf : n'importe ni ce module (numpy) ni etl.*, seulement l'application
+_COLD_START_SCRIPT = """
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+from app import app
+t1 = time.perf_counter()
+client = app.test_client()
+firsts = [client.get(url).status_code for url in sys.argv[3].split(",")]
+t2 = time.perf_counter()
+print(json.dumps({
+    "import_s": t1 - t0, "first_response_s": t2 - t1, "wall_s": t2 - t0, "status": firsts,
+    "heavy_modules": [m for m in sys.argv[2].split(",") if m in sys.modules],
+}))
+"""
+
+# métrique comparée -> écart absolu en dessous duquel on parle de bruit
+COMPARE_KEYS = {"wall_s": 0.005, "peak_rss_mb": 5.0, "p95_ms": 2.0}
+DEFAULT_TOLERANCE = 0.25
+
+
+def _rss_mb() -> float:
+    rss = rss_bytes()
+    return rss / 2 ** 20 if rss is not None else float("nan")
+
+
+@contextmanager
+def measure(results: dict, name: str, quiet: bool = True):
+    """Chronomètre le bloc et échantillonne le RSS en tâche de fond ; résultat dans results[name]."""
+    gc.collect()
+    start_rss = _rss_mb()
+    peak = [start_rss]
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(SAMPLE_SECONDS):
+            peak[0] = max(peak[0], _rss_mb())
+
+    sampler = threading.Thread(target=sample, name="bench-rss", daemon=True)
+    sampler.start()
+    out = io.StringIO() if quiet else sys.stdout
+    t0 = time.perf_counter()
+    try:
+        with redirect_stdout(out):
+            yield
+    finally:
+        wall = time.perf_counter() - t0
+        stop.set()
+        sampler.join()
+        peak[0] = max(peak[0], _rss_mb())
+        results[name] = {
+            "wall_s": round(wall, 4),
+            "peak_rss_mb": round(peak[0], 1),
+            "rss_delta_mb": round(peak[0] - start_rss, 1),
+        }
+
+
+def bench_etl(scale: float, workdir: Path, seed: int = 0, workers: int = 1) -> tuple[dict, Path, int]:
+    """Étapes de l'ETL sur le CSV synthétique de l'échelle `scale`. Retourne (mesures, sorties, lignes)."""
+    root = Path(workdir) / f"x{scale:g}"
+    raw_path = root / "raw" / f"synthetic-x{scale:g}-s{seed}.csv"
+    out_dir = root / "processed"
+    cache_dir = root / "cache"
+
+    stages = {}
+    if not raw_path.exists():
+        with measure(stages, "generate"):
+            write_raw_csv(raw_path, scale, seed)
+    for d in (out_dir, cache_dir):
+        if d.exists():
+            shutil.rmtree(d)
+
+    with measure(stages, "extract"):
+        df = extract(raw_path)
+    del df
+    with measure(stages, "extract_typed"):
+        df = extract(raw_path, typed=True, cache_dir=cache_dir)
+    del df
+    with measure(stages, "extract_typed_cached"):
+        df = extract(raw_path, typed=True, cache_dir=cache_dir)
+    with measure(stages, "transform"):
+        data = transform(df, workers=workers)
+    del df
+    rows = len(data)
+    with measure(stages, "load"):
+        load(data, out_dir, workers=workers)
+    del data
+    with measure(stages, "build_by_region"):
+        build_by_region(out_dir)
+    geojson_path = PROJECT_ROOT / "web" / "static" / "geo" / "regions.geojson"
+    if geojson_path.exists():
+        with measure(stages, "regions_geo"):
+            build_regions_geo(geojson_path, out_dir / "by_region.json", out_dir, workers=workers)
+    write_manifest(out_dir)
+
+    # graphe d'étapes de run.py : exécution complète (cache vide) puis relance sans changement
+    if geojson_path.exists():
+        pipe_dir, stage_cache = root / "pipeline", root / "stages"
+        for d in (pipe_dir, stage_cache):
+            if d.exists():
+                shutil.rmtree(d)
+        pipe_dir.mkdir(parents=True)
+        for name in ("pipeline_cold", "pipeline_noop"):
+            with measure(stages, name):
+                Pipeline(etl_stages(raw_path, pipe_dir, geojson_path, workers), pipe_dir, stage_cache,
+                         workers=workers).run()
+
+    # ETL en flux (etl/stream.py) : mêmes sorties, mémoire de travail bornée par la taille des blocs
+    stream_dir = root / "stream"
+    if stream_dir.exists():
+        shutil.rmtree(stream_dir)
+    with measure(stages, "stream"):
+        stream_etl([raw_path], stream_dir, geojson_path if geojson_path.exists() else None, workers=workers)
+    return stages, out_dir, rows
+
+
+def _api_worker(processed_dir: str, concurrency: int, n_requests: int) -> dict:
+    """Exécuté dans un processus neuf : l'application lit `processed_dir` (variable PROCESSED_DIR)."""
+    os.environ["PROCESSED_DIR"] = processed_dir
+    os.environ.setdefault("DATA_POLL_SECONDS", "3600")
+    web_dir = str(PROJECT_ROOT / "web")
+    if web_dir not in sys.path:
+        sys.path.insert(0, web_dir)
+
+    results = {}
+    with measure(results, "import"):
+        from app import app
+    client = app.test_client()
+    with measure(results, "first_load"):
+        client.get("/api/data_version")
+
+    for name, url in API_ENDPOINTS.items():
+        t0 = time.perf_counter()
+        first = client.get(url.format(i=0), headers=API_HEADERS)
+        cold_ms = (time.perf_counter() - t0) * 1000
+
+        def run(offset):
+            c = app.test_client()
+            latencies, errors = [], 0
+            for i in range(offset, n_requests, concurrency):
+                t = time.perf_counter()
+                resp = c.get(url.format(i=i + 1), headers=API_HEADERS)
+                latencies.append(time.perf_counter() - t)
+                errors += resp.status_code >= 400
+            return latencies, errors
+
+        with measure(results, name):
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                parts = list(pool.map(run, range(concurrency)))
+        lat = np.array([x for p, _ in parts for x in p]) * 1000
+        results[name].update({
+            "cold_ms": round(cold_ms, 2),
+            "p50_ms": round(float(np.percentile(lat, 50)), 2),
+            "p95_ms": round(float(np.percentile(lat, 95)), 2),
+            "p99_ms": round(float(np.percentile(lat, 99)), 2),
+            "rps": round(len(lat) / results[name]["wall_s"], 1),
+            "errors": int(sum(e for _, e in parts)) + (first.status_code >= 400),
+            "bytes": len(first.data),
+        })
+    return results
+
+
+def bench_api(processed_dir: Path, concurrency: int = 8, n_requests: int = 200) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        return pool.submit(_api_worker, str(processed_dir), concurrency, n_requests).result()
+
+
+def bench_cold_start(processed_dir: Path) -> dict:
+    """
+    Délai jusqu'à la première réponse d'un processus serveur neuf (import de l'application,
+    chargement des données, premières requêtes), en mode léger puis avec PRELOAD_TABLES=1.
+    """
+    results = {}
+    for name, preload in (("light", "0"), ("preload", "1")):
+        env = {**os.environ, "PROCESSED_DIR": str(processed_dir), "DATA_POLL_SECONDS": "3600",
+               "PRELOAD_TABLES": preload}
+        proc = subprocess.run(
+            [sys.executable, "-c", _COLD_START_SCRIPT, str(PROJECT_ROOT / "web"),
+             ",".join(HEAVY_MODULES), ",".join(COLD_START_URLS)],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        m = json.loads(proc.stdout.strip().splitlines()[-1])
+        results[name] = {
+            "wall_s": round(m["wall_s"], 4),
+            "import_s": round(m["import_s"], 4),
+            "first_response_s": round(m["first_response_s"], 4),
+            "errors": sum(code >= 400 for code in m["status"]),
+            "heavy_modules": m["heavy_modules"],
+        }
+    return results
+
+
+def run_benchmarks(scales, workdir: Path, seed: int = 0, concurrency: int = 8,
+                   n_requests: int = 200, api: bool = True, workers: int = 1) -> dict:
+    results = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": seed,
+            "concurrency": concurrency,
+            "requests": n_requests,
+            "workers": workers,
+        },
+        "scales": {},
+    }
+    for scale in scales:
+        print(f"[bench] x{scale:g} : ETL...", flush=True)
+        stages, out_dir, rows = bench_etl(scale, workdir, seed, workers)
+        entry = {"rows": rows, "etl": stages}
+        if api:
+            print(f"[bench] x{scale:g} : API...", flush=True)
+            entry["api"] = bench_api(out_dir, concurrency, n_requests)
+            entry["cold_start"] = bench_cold_start(out_dir)
+        results["scales"][f"{scale:g}"] = entry
+    return results
+
+
+def compare(current: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list[str]:
+    """Régressions (hausse relative > tolerance ET au-delà du bruit absolu) par rapport à la référence."""
+    regressions = []
+    for scale, entry in current["scales"].items():
+        base_entry = baseline.get("scales", {}).get(scale)
+        if base_entry is None:
+            continue
+        for section in ("etl", "api", "cold_start"):
+            for name, metrics in entry.get(section, {}).items():
+                base = base_entry.get(section, {}).get(name, {})
+                for key, noise in COMPARE_KEYS.items():
+                    if key not in metrics or key not in base:
+                        continue
+                    now, before = metrics[key], base[key]
+                    if now - before > noise and now > before * (1 + tolerance):
+                        regressions.append(
+                            f"x{scale} {section}/{name} {key}: {before} -> {now} "
+                            f"(+{(now / before - 1) * 100 if before else float('inf'):.0f}%)"
+                        )
+    return regressions
+
+
+def _print_report(results: dict, baseline: dict | None) -> None:
+    def ref(scale, section, name, key):
+        if baseline is None:
+            return ""
+        before = baseline.get("scales", {}).get(scale, {}).get(section, {}).get(name, {}).get(key)
+        return f"{before:>10}" if before is not None else f"{'-':>10}"
+
+    for scale, entry in results["scales"].items():
+        print(f"\n=== x{scale} ({entry['rows']} lignes) ===")
+        print(f"{'étape ETL':<24}{'wall_s':>10}{'réf':>10}{'pic RSS Mo':>12}{'réf':>10}")
+        for name, m in entry["etl"].items():
+            print(f"{name:<24}{m['wall_s']:>10}{ref(scale, 'etl', name, 'wall_s'):>10}"
+                  f"{m['peak_rss_mb']:>12}{ref(scale, 'etl', name, 'peak_rss_mb'):>10}")
+        if "api" in entry:
+            print(f"{'endpoint':<24}{'cold_ms':>10}{'p50_ms':>10}{'p95_ms':>10}{'réf':>10}{'req/s':>10}{'err':>6}")
+            for name, m in entry["api"].items():
+                if "p95_ms" not in m:
+                    print(f"{name:<24}{m['wall_s'] * 1000:>10.1f}  (pic RSS {m['peak_rss_mb']} Mo)")
+                    continue
+                print(f"{name:<24}{m['cold_ms']:>10}{m['p50_ms']:>10}{m['p95_ms']:>10}"
+                      f"{ref(scale, 'api', name, 'p95_ms'):>10}{m['rps']:>10}{m['errors']:>6}")
+        if "cold_start" in entry:
+            print(f"{'démarrage à froid':<24}{'import_s':>10}{'1re rép.':>10}{'wall_s':>10}{'réf':>10}"
+                  f"  modules lourds")
+            for name, m in entry["cold_start"].items():
+                print(f"{name:<24}{m['import_s']:>10}{m['first_response_s']:>10}{m['wall_s']:>10}"
+                      f"{ref(scale, 'cold_start', name, 'wall_s'):>10}  {', '.join(m['heavy_modules']) or '-'}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks ETL + API sur données synthétiques")
+    parser.add_argument("--scales", type=float, nargs="+", default=DEFAULT_SCALES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", type=Path, default=None,
+                        help="dossier de travail (CSV synthétiques réutilisés) ; défaut : temporaire")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requêtes par endpoint")
+    parser.add_argument("--workers", type=int, default=1, help="workers de l'ETL (0 = un par cœur)")
+    parser.add_argument("--no-api", action="store_true")
+    parser.add_argument("--output", type=Path, default=None, help="écrit les résultats JSON")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="remplace la référence")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        workdir = args.workdir if args.workdir is not None else Path(tmp)
+        results = run_benchmarks(args.scales, workdir, args.seed, args.concurrency,
+                                 args.requests, api=not args.no_api,
+                                 workers=resolve_workers(args.workers))
+
+    baseline = None
+    if args.baseline.exists() and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    _print_report(results, baseline)
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n[bench] référence enregistrée : {args.baseline}")
+        return 0
+    if baseline is None:
+        print(f"\n[bench] pas de référence ({args.baseline}) : --save-baseline pour l'enregistrer")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n❌ {len(regressions)} régression(s) (tolérance {args.tolerance:.0%}) :")
+        for line in regressions:
+            print(" -", line)
+        return 1
+    print("\n✅ pas de régression par rapport à la référence")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+import math
+import warnings
+import numpy as np
+import pandas as pd
+
+from etl.aggregate import DEFAULT_WEIGHT, group_codes, _as_float, _segments, _weights
+
+# ---------- intervalles de confiance bootstrap, tous les groupes en une passe ----------
+# Bootstrap de Poisson : chaque réplique donne à chaque ligne un poids aléatoire Poisson(1)
+# (équivalent au tirage avec remise pour des effectifs grands, sans tirer groupe par groupe),
+# tiré par table de la fonction de répartition inverse sur des entiers 16 bits, par bloc de
+# BLOCK_ROWS lignes avec la graine (seed, réplique, bloc).
+# Les répliques sont traitées par lots : matrice (répliques x lignes) de poids, lignes triées
+# une fois par (groupe[, x]), puis pour chaque lot :
+#   "wmean"               : sommes par segment de groupe (np.add.reduceat) ;
+#   "wmedian"/"wquantile" : poids cumulés de toutes les répliques, un seul searchsorted.
+# Graine fixe : mêmes poids de réplique pour une ligne quel que soit le regroupement ou le
+# découpage de la table en blocs de lecture (StreamIntervals, ETL en flux), sorties identiques
+# d'une exécution à l'autre. "mean" / "median" : même calcul avec un poids de 1 par ligne.
+#
+# Exemple :
+#   intervals(df, "annee", {"taux_dinsertion_moy": ("wmean", "taux_dinsertion")})
+#   -> annee, taux_dinsertion_moy_ic_bas, taux_dinsertion_moy_ic_haut
+
+N_BOOT = 500
+LEVEL = 0.95
+SEED = 0
+# taille d'un lot de répliques : répliques x lignes (bornes la mémoire, ~16 Mo par matrice)
+CHUNK_CELLS = 1 << 21
+# lignes par bloc de tirage : poids d'une ligne indépendants du découpage de la table
+BLOCK_ROWS = 1 << 14
+# pas par histogramme de quantile (StreamIntervals) : au-delà, le pas double
+# (état <= répliques x groupes x MAX_BINS flottants, quelle que soit la plage des valeurs)
+MAX_BINS = 512
+
+# Poisson(1) par fonction de répartition inverse : entier uniforme 16 bits -> effectif
+_POISSON_CDF = np.cumsum([math.exp(-1.0) / math.factorial(k) for k in range(16)])
+_POISSON_TABLE = np.searchsorted(_POISSON_CDF, (np.arange(1 << 16) + 0.5) / (1 << 16)).astype(np.uint8)
+
+
+def _poisson_weights(rng: np.random.Generator, shape) -> np.ndarray:
+    """Poids de bootstrap Poisson(1) (uint8)."""
+    return _POISSON_TABLE[rng.integers(0, 1 << 16, size=shape, dtype=np.uint16)]
+
+
+def _replicate_weights(seed: int, r0: int, b: int, start: int, stop: int) -> np.ndarray:
+    """Poids (uint8, b x lignes) des répliques [r0, r0 + b) pour les lignes [start, stop)."""
+    out = np.empty((b, stop - start), dtype=np.uint8)
+    if stop <= start:
+        return out
+    for k in range(start // BLOCK_ROWS, (stop - 1) // BLOCK_ROWS + 1):
+        lo, hi = max(start, k * BLOCK_ROWS), min(stop, (k + 1) * BLOCK_ROWS)
+        for i in range(b):
+            # bloc entier tiré (suite identique quel que soit le découpage), table lue dans `out`
+            draws = np.random.default_rng((seed, r0 + i, k)).integers(0, 1 << 16, size=BLOCK_ROWS, dtype=np.uint16)
+            np.take(_POISSON_TABLE, draws[lo - k * BLOCK_ROWS:hi - k * BLOCK_ROWS], out=out[i, lo - start:hi - start])
+    return out
+
+
+def _boot_wmean(c, x, w, n_groups):
+    """c trié par groupe ; w : lot de poids b x n dans le même ordre -> statistique b x n_groups."""
+    starts, counts = _segments(c, n_groups)
+    present = counts > 0
+    out = np.full((len(w), n_groups), np.nan)
+    if not present.any():
+        return out
+    num = np.add.reduceat(w * x, starts[present], axis=1)
+    den = np.add.reduceat(w, starts[present], axis=1)
+    vals = np.full(num.shape, np.nan)
+    np.divide(num, den, out=vals, where=den > 0)
+    out[:, present] = vals
+    return out
+
+
+def _boot_wquantile(c, x, w, n_groups, q):
+    """c, x triés par (groupe, x) ; w : lot de poids b x n dans le même ordre."""
+    b, n = w.shape
+    starts, counts = _segments(c, n_groups)
+    ends = starts + counts - 1
+    # poids cumulés sur toutes les répliques à la suite : un seul searchsorted pour le lot
+    cw = np.cumsum(w.ravel())
+    offsets = np.arange(b)[:, None] * n
+    s, e = offsets + starts, offsets + ends
+    present = counts > 0
+    base = np.where(s > 0, cw[np.maximum(s - 1, 0)], 0.0)
+    total = np.where(present, cw[np.clip(e, 0, len(cw) - 1)], 0.0) - base
+    pos = np.clip(np.searchsorted(cw, base + q * total, side="left"), s, e)
+    out = x[np.clip(pos - offsets, 0, n - 1)]
+    out[~present | (total <= 0)] = np.nan
+    return out
+
+
+def _plan(name: str, spec: tuple) -> tuple:
+    """(opération, colonne, quantile ou None pour une moyenne)."""
+    op, col, *param = spec
+    if op in ("wmean", "mean"):
+        return op, col, None
+    if op in ("wmedian", "median"):
+        return op, col, 0.5
+    if op == "wquantile":
+        return op, col, float(param[0])
+    raise ValueError(f"Opération sans intervalle bootstrap: {op!r} ({name})")
+
+
+def _bounds(stats: np.ndarray, level: float) -> tuple[np.ndarray, np.ndarray]:
+    """Percentiles (1 - level) / 2 et (1 + level) / 2 des répliques (NaN : groupe sans valeur)."""
+    alpha = (1.0 - level) / 2.0
+    with warnings.catch_warnings():
+        # groupes sans valeur : intervalle NaN (null en JSON), sans avertissement
+        warnings.simplefilter("ignore", RuntimeWarning)
+        lo, hi = np.nanquantile(stats, [alpha, 1.0 - alpha], axis=0)
+    return lo, hi
+
+
+def intervals(df: pd.DataFrame, by, metrics: dict, weight=DEFAULT_WEIGHT, n_boot: int = N_BOOT,
+              level: float = LEVEL, seed: int = SEED) -> pd.DataFrame:
+    """
+    Intervalles de confiance (percentiles bootstrap, niveau `level`) des métriques de `metrics`
+    (mêmes spécifications que aggregate : wmean, wmedian, wquantile, mean, median).
+    Retourne une ligne par groupe (clés triées comme aggregate) : <nom>_ic_bas, <nom>_ic_haut.
+    """
+    codes, keys = group_codes(df, by)
+    n_groups = len(keys)
+    w0 = _weights(df, weight)
+    ones = np.ones(len(df))
+
+    # préparation par métrique : lignes retenues, ordre de tri (quantiles), poids de base
+    plans = []
+    for name, spec in metrics.items():
+        op, col, q = _plan(name, spec)
+        x = _as_float(df, col)
+        base = ones if op in ("mean", "median") else w0
+        rows = np.flatnonzero((codes >= 0) & ~np.isnan(x) & (base > 0))
+        rows = rows[np.lexsort((x[rows], codes[rows])) if q is not None else np.argsort(codes[rows], kind="stable")]
+        plans.append((name, q, rows, codes[rows], x[rows], base[rows], np.empty((n_boot, n_groups))))
+
+    chunk = max(1, CHUNK_CELLS // max(len(df), 1))
+    for r0 in range(0, n_boot, chunk):
+        b = min(chunk, n_boot - r0)
+        # poids de réplique de toutes les lignes : partagés par les métriques du lot
+        poisson = _replicate_weights(seed, r0, b, 0, len(df))
+        for name, q, rows, c, x, base, stats in plans:
+            w = np.take(poisson, rows, axis=1) * base
+            if q is None:
+                stats[r0:r0 + b] = _boot_wmean(c, x, w, n_groups)
+            else:
+                stats[r0:r0 + b] = _boot_wquantile(c, x, w, n_groups, q)
+
+    out = keys
+    for name, *_, stats in plans:
+        out[f"{name}_ic_bas"], out[f"{name}_ic_haut"] = _bounds(stats, level)
+    return out
+
+
+class StreamIntervals:
+    """
+    intervals() accumulé bloc par bloc (ETL en flux, etl/stream.py) : les lignes sont numérotées
+    dans l'ordre d'arrivée, donc mêmes poids de réplique que intervals() sur la table entière.
+    État borné par le nombre de groupes, pas de lignes :
+      "wmean" / "mean"           : sommes pondérées par réplique et groupe ;
+      quantiles                  : histogramme par réplique et groupe, valeur arrondie au pas
+                                   de `steps` (comme le sketch du cube : exact si les valeurs
+                                   tombent sur le pas, sinon erreur <= pas / 2) ; plage limitée
+                                   à MAX_BINS pas : au-delà le pas double, pas voisins fusionnés
+                                   (erreur <= pas final).
+    `groupings` : nom -> (by, metrics) ; les regroupements d'un même flux partagent les tirages.
+    """
+
+    def __init__(self, groupings: dict, weight=DEFAULT_WEIGHT, n_boot: int = N_BOOT, level: float = LEVEL,
+                 seed: int = SEED, steps: dict | None = None):
+        self.weight, self.n_boot, self.level, self.seed = weight, n_boot, level, seed
+        self.rows = 0
+        self.groupings = {}
+        for gname, (by, metrics) in groupings.items():
+            by = [by] if isinstance(by, str) else list(by)
+            plans = {}
+            for name, spec in metrics.items():
+                op, col, q = _plan(name, spec)
+                step = (steps or {}).get(col)
+                step = float(step) if step is not None else None
+                if q is not None and step is None:
+                    raise ValueError(f"Pas d'histogramme pour le quantile de {col!r} ({name})")
+                # moyenne : [num, den] (répliques x groupes) ; quantile : [hist, k0, K]
+                state = [np.zeros((n_boot, 0)), np.zeros((n_boot, 0))] if q is None else [np.zeros((n_boot, 0)), 0, 0]
+                plans[name] = {"op": op, "col": col, "q": q, "step": step, "state": state}
+            self.groupings[gname] = {"by": by, "keys": {}, "plans": plans}
+
+    def _global_codes(self, grouping: dict, df: pd.DataFrame) -> np.ndarray:
+        """Codes du bloc -> numéros de groupe globaux (nouveaux groupes ajoutés en fin)."""
+        codes, keys = group_codes(df, grouping["by"])
+        index = grouping["keys"]
+        mapping = np.array([index.setdefault(k, len(index)) for k in keys.itertuples(index=False, name=None)],
+                           dtype=np.int64)
+        return np.where(codes >= 0, mapping[np.maximum(codes, 0)] if len(mapping) else -1, -1)
+
+    @staticmethod
+    def _grow(arr: np.ndarray, n_groups: int, k0: int = 0, K: int = 1, new_k0: int = 0, new_K: int = 1):
+        """Agrandit un état (répliques x groupes x K aplati) à n_groups groupes et [new_k0, new_k0 + new_K)."""
+        if arr.shape[1] == n_groups * new_K and (k0, K) == (new_k0, new_K):
+            return arr
+        out = np.zeros((arr.shape[0], n_groups, new_K))
+        if arr.size and K:
+            old = arr.reshape(arr.shape[0], -1, K)
+            out[:, :old.shape[1], k0 - new_k0:k0 - new_k0 + K] = old
+        return out.reshape(arr.shape[0], -1)
+
+    @staticmethod
+    def _coarsen(hist: np.ndarray, n_groups: int, k0: int, K: int) -> tuple[np.ndarray, int, int]:
+        """Histogramme au pas double : pas k -> (k + 1) // 2 (arrondi au demi supérieur)."""
+        new_k0 = (k0 + 1) // 2
+        new_K = (k0 + K) // 2 - new_k0 + 1
+        out = np.zeros((hist.shape[0], n_groups, new_K))
+        idx = (np.arange(k0, k0 + K) + 1) // 2 - new_k0
+        np.add.at(out, (slice(None), slice(None), idx), hist.reshape(hist.shape[0], n_groups, K))
+        return out.reshape(hist.shape[0], -1), new_k0, new_K
+
+    def update(self, df: pd.DataFrame) -> None:
+        """Ajoute un bloc de lignes (à la suite des précédents)."""
+        start, n = self.rows, len(df)
+        self.rows += n
+        if n == 0:
+            return
+        w0 = _weights(df, self.weight)
+        ones = np.ones(n)
+
+        # préparation : lignes retenues triées par cellule (groupe[, pas]), début des segments
+        plans = []
+        for grouping in self.groupings.values():
+            codes = self._global_codes(grouping, df)
+            n_groups = len(grouping["keys"])
+            for plan in grouping["plans"].values():
+                x = _as_float(df, plan["col"])
+                base = ones if plan["op"] in ("mean", "median") else w0
+                rows = np.flatnonzero((codes >= 0) & ~np.isnan(x) & (base > 0))
+                state = plan["state"]
+                if plan["q"] is None:
+                    state[0] = self._grow(state[0], n_groups)
+                    state[1] = self._grow(state[1], n_groups)
+                    cells = codes[rows]
+                else:
+                    # valeurs infinies hors histogramme (pas de plage finie)
+                    rows = rows[np.isfinite(x[rows])]
+                    while True:
+                        k = np.round(x[rows] / plan["step"]).astype(np.int64)
+                        hist, k0, K = state
+                        # plage de pas [lo, hi) : celle de l'état étendue à celle du bloc
+                        bounds = ([k0, k0 + K] if K else []) + ([int(k.min()), int(k.max()) + 1] if len(k) else [])
+                        if not bounds or max(bounds) - min(bounds) <= MAX_BINS:
+                            break
+                        plan["step"] *= 2
+                        if K:
+                            n_old = hist.shape[1] // K
+                            state[:] = self._coarsen(hist, n_old, k0, K)
+                    if bounds:
+                        lo, hi = min(bounds), max(bounds)
+                        state[:] = [self._grow(hist, n_groups, k0, K, lo, hi - lo), lo, hi - lo]
+                    cells = codes[rows] * state[2] + (k - state[1])
+                order = np.argsort(cells, kind="stable")
+                rows, cells = rows[order], cells[order]
+                starts = np.flatnonzero(np.r_[True, np.diff(cells) != 0]) if len(cells) else cells
+                xw = x[rows] * base[rows] if plan["q"] is None else None
+                plans.append((plan, rows, base[rows], xw, starts, cells[starts]))
+
+        chunk = max(1, CHUNK_CELLS // n)
+        for r0 in range(0, self.n_boot, chunk):
+            b = min(chunk, self.n_boot - r0)
+            poisson = _replicate_weights(self.seed, r0, b, start, start + n)
+            for plan, rows, base, xw, starts, cells in plans:
+                if not len(rows):
+                    continue
+                p = np.take(poisson, rows, axis=1)
+                state = plan["state"]
+                if xw is None:
+                    state[0][r0:r0 + b, cells] += np.add.reduceat(p * base, starts, axis=1)
+                else:
+                    state[0][r0:r0 + b, cells] += np.add.reduceat(p * xw, starts, axis=1)
+                    state[1][r0:r0 + b, cells] += np.add.reduceat(p * base, starts, axis=1)
+
+    def result(self, gname: str) -> pd.DataFrame:
+        """Même sortie que intervals() : une ligne par groupe (clés triées), <nom>_ic_bas / _ic_haut."""
+        grouping = self.groupings[gname]
+        by = grouping["by"]
+        keys = pd.DataFrame(list(grouping["keys"]), columns=by)
+        order = keys.sort_values(by, kind="stable").index.to_numpy() if len(keys) else np.empty(0, dtype=np.int64)
+        out = keys.iloc[order].reset_index(drop=True)
+        n_groups = len(keys)
+        for name, plan in grouping["plans"].items():
+            state = plan["state"]
+            if plan["q"] is None:
+                num, den = (self._grow(a, n_groups) for a in state)
+                stats = np.full(num.shape, np.nan)
+                np.divide(num, den, out=stats, where=den > 0)
+            else:
+                hist, k0, K = state
+                hist = self._grow(hist, n_groups, k0, max(K, 1), k0, max(K, 1)).reshape(self.n_boot, n_groups, -1)
+                # premier pas dont le poids cumulé (dans son groupe) atteint q * total
+                cum = np.cumsum(hist, axis=2)
+                total = cum[:, :, -1] if cum.shape[2] else np.zeros(hist.shape[:2])
+                idx = (cum < plan["q"] * total[:, :, None]).sum(axis=2)
+                stats = (k0 + idx) * plan["step"]
+                stats[total <= 0] = np.nan
+            out[f"{name}_ic_bas"], out[f"{name}_ic_haut"] = _bounds(stats[:, order], self.level)
+        return out
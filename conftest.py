@@ -0,0 +1,15 @@
+import pytest
+
+from etl.synthetic import generate_raw
+
+
+@pytest.fixture
+def fallback_csv(tmp_path):
+    """CSV synthétique dont la lecture typée échoue (taux "> 95") avec un "ns" dans nombre_de_reponses."""
+    raw = generate_raw(0.01, seed=0).astype(str)
+    raw.loc[0, "taux_dinsertion"] = "> 95"
+    raw.loc[1, "nombre_de_reponses"] = "ns"
+    path = tmp_path / "raw" / "m.csv"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    raw.to_csv(path, sep=";", index=False, encoding="utf-8")
+    return path
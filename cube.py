@@ -0,0 +1,242 @@
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from etl.aggregate import aggregate, group_codes, DEFAULT_WEIGHT
+from etl.dataset import map_ipc, write_ipc
+
+# ---------- cube d'agrégats ----------
+# Grain le plus fin : annee x domaine x academie x situation (region = attribut de l'académie).
+# Chaque cellule porte des statistiques partielles additives :
+#   <col>__sw  : somme des poids (x renseigné, poids > 0)
+#   <col>__swx : somme des x * poids
+#   <col>__cnt : nombre de x renseignés
+#   <col>__sx  : somme des x
+#   n_w        : somme des poids (toutes lignes), rows : nombre de lignes
+# Les médianes passent par un sketch : histogramme (valeur arrondie au pas, poids, effectif),
+# fusionnable par simple somme. Pas de 10 EUR pour le salaire -> exact sur les données actuelles,
+# sinon erreur <= pas / 2. Deux cubes de lignes disjointes se fusionnent (merge_cube) : c'est
+# l'état partiel de l'ETL en flux (etl/stream.py), un cube par bloc de lecture.
+
+CUBE_DIMS = ["annee", "domaine", "academie", "region", "situation"]
+
+CUBE_MEASURES = [
+    "taux_dinsertion",
+    "taux_d_emploi",
+    "femmes",
+    "de_diplomes_boursiers",
+    "salaire_net_median_des_emplois_a_temps_plein",
+]
+
+SKETCH_STEPS = {
+    "salaire_net_median_des_emplois_a_temps_plein": 10.0,
+}
+
+# Cube compact en Arrow IPC non compressé (cellules, sketch), mappé par le serveur
+CUBE_IPC_FILES = ("cube.arrow", "cube_sketch.arrow")
+
+
+def _float(df: pd.DataFrame, col: str) -> np.ndarray:
+    if col not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def build_cube(data: pd.DataFrame, region_map: dict | None = None,
+               weight: str = DEFAULT_WEIGHT) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Matérialise le cube (cellules + sketch des médianes) à partir des données propres."""
+    dims = pd.DataFrame({d: data[d] for d in CUBE_DIMS if d in data.columns})
+    if "region" not in dims.columns and "academie" in dims.columns and region_map is not None:
+        dims["region"] = data["academie"].map(region_map)
+    dim_cols = list(dims.columns)
+
+    w = np.nan_to_num(_float(data, weight), nan=0.0)
+    parts = {"n_w": w, "rows": np.ones(len(data))}
+    for col in CUBE_MEASURES:
+        x = _float(data, col)
+        ok = ~np.isnan(x)
+        okw = ok & (w > 0)
+        xz = np.where(ok, x, 0.0)
+        parts[f"{col}__sw"] = np.where(okw, w, 0.0)
+        parts[f"{col}__swx"] = np.where(okw, xz * w, 0.0)
+        parts[f"{col}__cnt"] = ok.astype(np.float64)
+        parts[f"{col}__sx"] = xz
+
+    # une seule passe groupby/somme au grain fin (clés manquantes conservées)
+    frame = pd.concat([dims.reset_index(drop=True), pd.DataFrame(parts)], axis=1)
+    cells = frame.groupby(dim_cols, dropna=False, observed=True, sort=True).sum().reset_index()
+
+    sketches = []
+    for col, step in SKETCH_STEPS.items():
+        x = _float(data, col)
+        ok = ~np.isnan(x)
+        sk = dims[ok].reset_index(drop=True)
+        sk["value"] = np.round(x[ok] / step) * step
+        sk["w"] = np.where(w[ok] > 0, w[ok], 0.0)
+        sk["cnt"] = 1.0
+        sk = sk.groupby(dim_cols + ["value"], dropna=False, observed=True, sort=True).sum().reset_index()
+        sk.insert(0, "metric", col)
+        sketches.append(sk)
+    sketch = pd.concat(sketches, ignore_index=True) if sketches else pd.DataFrame()
+
+    return cells, sketch
+
+
+def merge_cube(cube: tuple | None, other: tuple) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Somme cellule par cellule de deux cubes (cells, sketch) construits sur des lignes disjointes :
+    même cube que build_cube sur les lignes réunies, à l'ordre des sommes flottantes près.
+    """
+    if cube is None:
+        return other
+    cells = pd.concat([cube[0], other[0]], ignore_index=True)
+    dim_cols = [c for c in cells.columns if c in CUBE_DIMS]  # ordre de build_cube (region ajoutée en fin)
+    cells = cells.groupby(dim_cols, dropna=False, observed=True, sort=True).sum().reset_index()
+
+    sketches = []
+    for metric in SKETCH_STEPS:
+        parts = [sk[sk["metric"] == metric] for sk in (cube[1], other[1]) if len(sk)]
+        if not parts:
+            continue
+        sk = pd.concat(parts, ignore_index=True).drop(columns="metric")
+        sk = sk.groupby(dim_cols + ["value"], dropna=False, observed=True, sort=True).sum().reset_index()
+        sk.insert(0, "metric", metric)
+        sketches.append(sk)
+    sketch = pd.concat(sketches, ignore_index=True) if sketches else pd.DataFrame()
+    return cells, sketch
+
+
+def rollup(cells: pd.DataFrame, sketch: pd.DataFrame, by, metrics: dict) -> pd.DataFrame:
+    """
+    Même contrat que aggregate() (ops wmean, mean, wsum, sum, wmedian, median)
+    mais en sommant les cellules du cube, sans relire les lignes.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    codes, keys = group_codes(cells, by)
+    n_groups = len(keys)
+    m = codes >= 0
+
+    def total(name):
+        return np.bincount(codes[m], weights=cells[name].to_numpy()[m], minlength=n_groups)
+
+    def ratio(num, den):
+        out = np.full(n_groups, np.nan)
+        np.divide(num, den, out=out, where=den > 0)
+        return out
+
+    out = keys
+    for name, spec in metrics.items():
+        op, col, *_ = spec
+        if op == "wsum" and col is None:
+            out[name] = total("n_w")
+            continue
+        if op == "sum" and col == DEFAULT_WEIGHT:
+            out[name] = total("n_w")
+            continue
+        if col not in CUBE_MEASURES:
+            raise ValueError(f"Colonne absente du cube: {col!r} ({name})")
+
+        if op == "wmean":
+            out[name] = ratio(total(f"{col}__swx"), total(f"{col}__sw"))
+        elif op == "mean":
+            out[name] = ratio(total(f"{col}__sx"), total(f"{col}__cnt"))
+        elif op == "wsum":
+            out[name] = total(f"{col}__swx")
+        elif op == "sum":
+            out[name] = total(f"{col}__sx")
+        elif op in ("wmedian", "median"):
+            if col not in SKETCH_STEPS:
+                raise ValueError(f"Pas de sketch de médiane pour {col!r} ({name})")
+            sk = sketch[sketch["metric"] == col]
+            sk_op, sk_w = ("wmedian", "w") if op == "wmedian" else ("hmedian", "cnt")
+            med = aggregate(sk, by, {name: (sk_op, "value")}, weight=sk_w)
+            out[name] = keys.merge(med, on=by, how="left")[name].to_numpy()
+        else:
+            raise ValueError(f"Opération non supportée par le cube: {op!r} ({name})")
+
+    return out
+
+
+def _compact(df: pd.DataFrame) -> pd.DataFrame:
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if col == "metric" or (col in CUBE_DIMS and not pd.api.types.is_numeric_dtype(s)):
+            # dictionnaire : codes entiers + libellés uniques, catégories triées (ordre des groupby inchangé)
+            out[col] = s.astype("category")
+        elif pd.api.types.is_integer_dtype(s):
+            out[col] = pd.to_numeric(s, downcast="integer")
+        elif pd.api.types.is_float_dtype(s):
+            x = s.to_numpy()
+            x32 = x.astype(np.float32)
+            # float32 seulement si sans perte (effectifs, sommes de poids entiers, taux arrondis...)
+            out[col] = x32 if np.array_equal(x32.astype(np.float64), x, equal_nan=True) else x
+        else:
+            out[col] = s
+    return pd.DataFrame(out, index=df.index, copy=False)
+
+
+def compact_cube(cells: pd.DataFrame, sketch: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Représentation de service du cube, sans perte : dimensions en catégories (dictionnaire),
+    entiers et flottants réduits au plus petit type qui restitue exactement les valeurs.
+    Les rollups calculés dessus sont identiques à ceux du cube brut.
+    """
+    return _compact(cells), _compact(sketch) if len(sketch) else sketch
+
+
+def _ipc_table(df: pd.DataFrame) -> pa.Table:
+    # NaN gardés comme valeurs (pas de masque de nullité) : colonnes numériques relues sans copie
+    return pa.table({
+        c: pa.array(df[c]) if isinstance(df[c].dtype, pd.CategoricalDtype)
+        else pa.array(df[c].to_numpy(), from_pandas=False)
+        for c in df.columns
+    })
+
+
+def write_cube_ipc(cells: pd.DataFrame, sketch: pd.DataFrame, out_dir: Path) -> list[Path]:
+    """Écrit le cube compact (compact_cube) en cube.arrow / cube_sketch.arrow."""
+    return [
+        write_ipc(_ipc_table(df), Path(out_dir) / name)
+        for df, name in zip(compact_cube(cells, sketch), CUBE_IPC_FILES)
+    ]
+
+
+def map_cube(out_dir: Path) -> tuple[pd.DataFrame, pd.DataFrame] | None:
+    """
+    Cube compact adossé aux fichiers mappés : les colonnes numériques sont des vues sur les
+    pages du fichier (partagées par tous les processus), seuls les codes des dimensions sont
+    copiés (1 octet par ligne). None si l'ETL ne les a pas écrits.
+    """
+    paths = [Path(out_dir) / name for name in CUBE_IPC_FILES]
+    if not all(p.exists() for p in paths):
+        return None
+    return tuple(map_ipc(p).to_pandas(split_blocks=True) for p in paths)
+
+
+def frame_bytes(*frames: pd.DataFrame) -> int:
+    """Empreinte mémoire (libellés compris) de DataFrames."""
+    return int(sum(f.memory_usage(deep=True, index=True).sum() for f in frames))
+
+
+def slice_cube(cells: pd.DataFrame, sketch: pd.DataFrame, annee: tuple | None = None,
+               **members) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Restreint le cube : annee=(min, max) bornes incluses (None = ouvert), dim=[valeurs...]."""
+    def mask(df):
+        m = np.ones(len(df), dtype=bool)
+        if annee is not None:
+            lo, hi = annee
+            if lo is not None:
+                m &= (df["annee"] >= lo).to_numpy()
+            if hi is not None:
+                m &= (df["annee"] <= hi).to_numpy()
+        for dim, values in members.items():
+            if values:
+                m &= df[dim].isin(values).to_numpy()
+        return m
+
+    def take(df):
+        m = mask(df)
+        return df if m.all() else df[m]  # sans filtre : le cube partagé, pas de copie
+
+    return take(cells), take(sketch) if len(sketch) else sketch
@@ -0,0 +1,211 @@
+from pathlib import Path
+import shutil
+import time
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from etl.ranking import write_rank_index
+
+# ---------- dataset propre partitionné (Hive) ----------
+# data/processed/clean/<génération>/annee=2018/part-0.parquet
+# Chaque écriture crée une génération immuable ; clean/CURRENT pointe sur la dernière.
+# Un lecteur qui a ouvert une génération n'est donc jamais touché par l'ETL suivante.
+# Chaque génération porte aussi _clean.arrow : la même table en Arrow IPC non compressé,
+# mappée en mémoire par le serveur (pages partagées entre workers via le cache de pages),
+# et les index de classement de /api/ranking (etl/ranking.py) sur les mêmes numéros de ligne.
+# write_clean_stream : même génération écrite lot par lot (ETL en flux, etl/stream.py).
+
+CLEAN_DIR = "clean"
+CURRENT_FILE = "CURRENT"
+PARTITION_COLS = ["annee"]
+# Tri dans chaque partition : statistiques de row-groups sélectives sur ces colonnes
+SORT_COLS = ["domaine", "academie"]
+ROWS_PER_GROUP = 64_000
+# en flux : le writer garde un row-group en cours par partition ouverte (mémoire bornée par
+# partitions x STREAM_ROWS_PER_GROUP lignes)
+STREAM_ROWS_PER_GROUP = 16_384
+KEEP_GENERATIONS = 2
+# préfixe "_" : ignoré par la découverte des fichiers parquet du dataset
+IPC_FILE = "_clean.arrow"
+
+
+def write_ipc(table: pa.Table, path: Path) -> Path:
+    """
+    Fichier Arrow IPC non compressé, écrit à côté puis renommé : un processus qui a mappé
+    l'ancien fichier garde ses pages (jamais réécrit en place).
+    """
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with pa.OSFile(str(tmp), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    tmp.replace(path)
+    return path
+
+
+def map_ipc(path: Path) -> pa.Table:
+    """Table adossée à un mmap du fichier : aucune copie, pages partagées entre processus."""
+    return pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+
+
+def _new_generation(out_dir: Path) -> Path:
+    """Dossier de génération ; noms triés dans l'ordre de création (nanosecondes dans la seconde)."""
+    root = Path(out_dir) / CLEAN_DIR
+    ns = time.time_ns()
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(ns // 10**9))
+    return root / f"{stamp}-{ns % 10**9:09d}-{uuid.uuid4().hex[:6]}"
+
+
+def _write_partitions(data, schema: pa.Schema, gen_dir: Path, partition_cols,
+                      rows_per_group: int = ROWS_PER_GROUP) -> None:
+    """Partitions parquet Hive d'une table ou d'un flux de RecordBatch (consommé une fois)."""
+    part_schema = pa.schema([schema.field(c) for c in partition_cols])
+    ds.write_dataset(
+        data,
+        gen_dir,
+        schema=schema,
+        format="parquet",
+        partitioning=ds.partitioning(part_schema, flavor="hive"),
+        basename_template="part-{i}.parquet",
+        max_rows_per_group=rows_per_group,
+        min_rows_per_group=min(rows_per_group, 1024),
+        file_options=ds.ParquetFileFormat().make_write_options(write_statistics=True),
+        existing_data_behavior="error",
+    )
+
+
+def _publish(gen_dir: Path, schema: pa.Schema, partition_cols, keep: int) -> None:
+    """Schéma de relecture, bascule de clean/CURRENT sur la génération, anciennes générations purgées."""
+    # schéma complet (ordre des colonnes, types, colonnes de partition) pour la relecture ;
+    # préfixe "_" : ignoré par la découverte des fichiers du dataset
+    meta = dict(schema.metadata or {})
+    meta[b"partition_cols"] = ",".join(partition_cols).encode()
+    pa.ipc.new_file(gen_dir / "_schema.arrow", schema.with_metadata(meta)).close()
+
+    root = gen_dir.parent
+    tmp = root / (CURRENT_FILE + ".tmp")
+    tmp.write_text(gen_dir.name, encoding="utf-8")
+    tmp.replace(root / CURRENT_FILE)
+
+    # la génération publiée n'est jamais purgée, quel que soit l'ordre des noms
+    others = sorted(p for p in root.iterdir() if p.is_dir() and p.name != gen_dir.name)
+    for old in others[:len(others) - (keep - 1)] if keep > 0 else []:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def write_clean_dataset(data: pd.DataFrame, out_dir: Path, partition_cols=PARTITION_COLS,
+                        keep: int = KEEP_GENERATIONS) -> Path:
+    """Écrit une nouvelle génération partitionnée et bascule clean/CURRENT dessus."""
+    gen_dir = _new_generation(out_dir)
+    sort_cols = [c for c in list(partition_cols) + SORT_COLS if c in data.columns]
+    table = pa.Table.from_pandas(data.sort_values(sort_cols, kind="stable"), preserve_index=False)
+    _write_partitions(table, table.schema, gen_dir, partition_cols)
+    write_ipc(table, gen_dir / IPC_FILE)
+    write_rank_index(table, gen_dir)
+    _publish(gen_dir, table.schema, partition_cols, keep)
+    return gen_dir
+
+
+def write_clean_stream(batches, schema: pa.Schema, out_dir: Path, partition_cols=PARTITION_COLS,
+                       keep: int = KEEP_GENERATIONS, rank_index: bool = True) -> Path:
+    """
+    Génération écrite à partir d'un flux de RecordBatch (ETL en flux) : chaque lot part dans les
+    partitions parquet et s'ajoute à _clean.arrow au fil de l'eau, sans table entière en mémoire.
+    Lignes dans l'ordre du flux (le tri par SORT_COLS revient à l'appelant, lot par lot).
+    Les index de classement sont calculés ensuite sur _clean.arrow mappé (tri de toutes les
+    lignes en mémoire) ; rank_index=False : pas d'index, /api/ranking les calcule au chargement.
+    """
+    gen_dir = _new_generation(out_dir)
+    gen_dir.parent.mkdir(parents=True, exist_ok=True)
+    # à côté de la génération : write_dataset exige un dossier de destination vide
+    tmp = gen_dir.with_name(gen_dir.name + IPC_FILE + ".tmp")
+    with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        def tee():
+            for batch in batches:
+                writer.write_batch(batch)
+                yield batch
+        _write_partitions(tee(), schema, gen_dir, partition_cols, STREAM_ROWS_PER_GROUP)
+    tmp.replace(gen_dir / IPC_FILE)
+    if rank_index:
+        write_rank_index(map_ipc(gen_dir / IPC_FILE), gen_dir)
+    _publish(gen_dir, schema, partition_cols, keep)
+    return gen_dir
+
+
+def current_generation(out_dir: Path) -> Path | None:
+    pointer = Path(out_dir) / CLEAN_DIR / CURRENT_FILE
+    if not pointer.exists():
+        return None
+    return pointer.parent / pointer.read_text(encoding="utf-8").strip()
+
+
+def open_clean(out_dir: Path, mmap: bool = False) -> ds.Dataset:
+    """
+    Dataset de la génération courante (repli : ancien clean.parquet monolithique).
+    mmap=True : table Arrow mappée (_clean.arrow) si présente ; mêmes lignes, même ordre,
+    projection et filtres sans décompression ni copie privée de la table entière.
+    """
+    gen_dir = current_generation(out_dir)
+    if gen_dir is None:
+        return ds.dataset(Path(out_dir) / "clean.parquet", format="parquet")
+    if mmap and (gen_dir / IPC_FILE).exists():
+        return ds.dataset(map_ipc(gen_dir / IPC_FILE))
+    schema = pa.ipc.open_file(gen_dir / "_schema.arrow").schema
+    part_cols = schema.metadata[b"partition_cols"].decode().split(",")
+    part_schema = pa.schema([schema.field(c) for c in part_cols])
+    return ds.dataset(
+        gen_dir, format="parquet", schema=schema,
+        partitioning=ds.partitioning(part_schema, flavor="hive"),
+    )
+
+
+def clean_filter(annee=None, **members):
+    """
+    Expression pyarrow poussée au lecteur : annee = valeur ou (min, max) bornes incluses,
+    dim=[valeurs...] pour les autres colonnes. Les partitions hors filtre ne sont pas ouvertes.
+    """
+    expr = None
+
+    def _and(e):
+        nonlocal expr
+        expr = e if expr is None else expr & e
+
+    if annee is not None:
+        if isinstance(annee, (tuple, list)):
+            lo, hi = annee
+            if lo is not None:
+                _and(ds.field("annee") >= lo)
+            if hi is not None:
+                _and(ds.field("annee") <= hi)
+        else:
+            _and(ds.field("annee") == annee)
+    for col, values in members.items():
+        if values:
+            _and(ds.field(col).isin(list(values)))
+    return expr
+
+
+def read_clean_table(source, columns=None, annee=None, limit: int | None = None, strict: bool = False,
+                     **members) -> pa.Table:
+    """
+    Table Arrow du dataset propre, projection (`columns`) et filtres poussés au lecteur ;
+    `limit` : lecture arrêtée après `limit` lignes (premières lignes dans l'ordre du dataset).
+    Colonnes absentes de `columns` ignorées (strict=True : ValueError qui les liste).
+    """
+    dataset = source if isinstance(source, ds.Dataset) else open_clean(source)
+    if columns is not None:
+        unknown = [c for c in columns if c not in dataset.schema.names]
+        if strict and unknown:
+            raise ValueError(f"Colonnes inconnues: {unknown}")
+        columns = [c for c in columns if c in dataset.schema.names]
+    expr = clean_filter(annee, **members)
+    if limit is not None:
+        return dataset.head(limit, columns=columns, filter=expr)
+    return dataset.to_table(columns=columns, filter=expr)
+
+
+def read_clean(source, columns=None, annee=None, limit: int | None = None, **members) -> pd.DataFrame:
+    """read_clean_table en DataFrame."""
+    return read_clean_table(source, columns=columns, annee=annee, limit=limit, **members).to_pandas()
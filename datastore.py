@@ -0,0 +1,110 @@
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from etl.manifest import read_manifest
+
+
+class StaleSnapshot(RuntimeError):
+    """Fichiers sur disque d'une version plus récente que le snapshot servi (ETL republiée)."""
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """Jeu de données complet d'une version : jamais modifié, seulement remplacé."""
+    version: str
+    data: dict
+    created_at: str | None = None
+    loaded_at: float = field(default_factory=time.time)
+
+
+def stat_version(processed_dir: Path) -> str:
+    """Version de repli sans manifest : signature (nom, taille, mtime) des fichiers."""
+    sig = []
+    if processed_dir.exists():
+        for entry in sorted(os.scandir(processed_dir), key=lambda e: e.name):
+            if entry.is_file():
+                st = entry.stat()
+                sig.append(f"{entry.name}:{st.st_size}:{st.st_mtime_ns}")
+    return hashlib.sha256("|".join(sig).encode()).hexdigest()[:16]
+
+
+class DataStore:
+    """
+    Données servies par l'API, versionnées par le manifest de l'ETL.
+    - current() : snapshot courant (chargé à la première demande) ;
+    - maybe_refresh() : à appeler à chaque requête ; au plus une sonde du manifest
+      toutes les `poll_interval` secondes, rechargement en tâche de fond si la version change,
+      puis bascule atomique (simple affectation) et purge des caches dérivés (on_swap).
+    Une requête en cours garde la référence du snapshot qu'elle a lu : jamais de données partielles.
+    """
+
+    def __init__(self, processed_dir: Path, loader, poll_interval: float = 5.0):
+        self.processed_dir = Path(processed_dir)
+        self.loader = loader
+        self.poll_interval = poll_interval
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._loading = False
+        self._last_check = time.monotonic()
+        self._listeners = []
+
+    def on_swap(self, fn) -> None:
+        self._listeners.append(fn)
+
+    def probe(self) -> tuple[str, str | None]:
+        manifest = read_manifest(self.processed_dir)
+        if manifest is not None:
+            return manifest["version"], manifest.get("created_at")
+        return stat_version(self.processed_dir), None
+
+    def _load(self, retries: int = 3) -> Snapshot:
+        for _ in range(retries):
+            version, created_at = self.probe()
+            data = self.loader(self.processed_dir)
+            # l'ETL a republié pendant la lecture : on recommence
+            if self.probe()[0] == version:
+                break
+        return Snapshot(version=version, data=data, created_at=created_at)
+
+    def current(self) -> Snapshot:
+        snap = self._snapshot
+        if snap is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = self._load()
+                snap = self._snapshot
+        return snap
+
+    @property
+    def version(self) -> str:
+        return self.current().version
+
+    def maybe_refresh(self, force: bool = False) -> None:
+        """force : sonde sans attendre `poll_interval` (snapshot reconnu périmé)."""
+        now = time.monotonic()
+        if self._snapshot is None or self._loading or (not force and now - self._last_check < self.poll_interval):
+            return
+        self._last_check = now
+        if self.probe()[0] == self._snapshot.version:
+            return
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=self._reload, name="datastore-reload", daemon=True).start()
+
+    def _reload(self) -> None:
+        try:
+            snap = self._load()
+            self._snapshot = snap
+            for fn in self._listeners:
+                fn()
+            print(f"[data] version {snap.version} chargée")
+        except Exception as e:  # on garde la version courante
+            print(f"⚠️ WARNING: rechargement des données impossible: {e}")
+        finally:
+            self._loading = False
@@ -0,0 +1,150 @@
+from pathlib import Path
+import json
+import pandas as pd
+
+from etl.cube import compact_cube, map_cube, rollup
+from etl.instrument import phase
+from etl.manifest import API_DIR
+
+# ---------- sorties des endpoints statiques de l'API ----------
+# Pré-calculées par l'ETL dans api/<nom>.json : le serveur les sert sans importer pandas.
+# Le serveur appelle les mêmes fonctions à la volée si ces fichiers manquent (ETL antérieure).
+# Signature commune : fn(cube, rollups) avec cube = (cells, sketch) compact,
+# rollups = {nom de fichier: contenu} des JSON de data/processed.
+
+ACADEMY_COORDS = {
+    # coordonnées approximatives (chefs-lieux d’académie)
+    "Aix-Marseille": (43.2965, 5.3698),
+    "Amiens": (49.8941, 2.2958),
+    "Besançon": (47.2378, 6.0241),
+    "Bordeaux": (44.8378, -0.5792),
+    "Clermont-Ferrand": (45.7772, 3.0870),
+    "Corse": (41.9192, 8.7386),
+    "Créteil": (48.7904, 2.4556),
+    "Dijon": (47.3220, 5.0415),
+    "Grenoble": (45.1885, 5.7245),
+    "Guadeloupe": (16.2410, -61.5330),
+    "Guyane": (4.9224, -52.3135),
+    "Lille": (50.6292, 3.0573),
+    "Limoges": (45.8336, 1.2611),
+    "Lyon": (45.7640, 4.8357),
+    "Martinique": (14.6161, -61.0588),
+    "Mayotte": (-12.7800, 45.2270),
+    "Montpellier": (43.6108, 3.8767),
+    "Nancy-Metz": (48.6921, 6.1844),
+    "Nantes": (47.2184, -1.5536),
+    "Nice": (43.7102, 7.2620),
+    "Normandie": (49.1829, -0.3707),
+    "Orléans-Tours": (47.9029, 1.9093),
+    "Paris": (48.8566, 2.3522),
+    "Poitiers": (46.5802, 0.3404),
+    "Reims": (49.2583, 4.0317),
+    "Rennes": (48.1173, -1.6778),
+    "Réunion": (-20.8789, 55.4481),
+    "Strasbourg": (48.5734, 7.7521),
+    "Toulouse": (43.6047, 1.4442),
+    "Versailles": (48.8049, 2.1204),
+}
+
+
+def records(df: pd.DataFrame) -> list[dict]:
+    with phase("serialize"):
+        df = df.astype(object).where(pd.notnull(df), None)
+        return df.to_dict(orient="records")
+
+
+def _rollup_records(cube: tuple, by: str, metrics: dict) -> list[dict]:
+    cells, sketch = cube
+    if by not in cells.columns:
+        return []
+    with phase("agg"):
+        agg = rollup(cells, sketch, by, metrics)
+    return records(agg)
+
+
+def _with_intervals(rows: list[dict], rollup: list[dict], by: str) -> list[dict]:
+    """
+    Ajoute à rows, sur `by`, les intervalles bootstrap du rollup écrit par l'ETL (<m>_ic_bas /
+    <m>_ic_haut) ; les valeurs de rows ne sont pas modifiées.
+    """
+    extra = {r.get(by): {c: v for c, v in r.items() if c.endswith(("_ic_bas", "_ic_haut"))} for r in rollup}
+    return [{**r, **extra.get(r.get(by), {})} for r in rows]
+
+
+def by_domaine(cube: tuple, rollups: dict) -> list[dict]:
+    rows = _rollup_records(cube, "domaine", {
+        "taux_dinsertion_moy": ("mean", "taux_dinsertion"),
+        "salaire_median": ("median", "salaire_net_median_des_emplois_a_temps_plein"),
+        "salaire_moyen": ("wmean", "salaire_net_median_des_emplois_a_temps_plein"),
+        "n": ("sum", "nombre_de_reponses"),
+    })
+    return _with_intervals(rows, rollups.get("by_domaine.json", []), "domaine")
+
+
+def genre_by_domaine(cube: tuple, rollups: dict) -> list[dict]:
+    return _rollup_records(cube, "domaine", {
+        "taux_dinsertion_moy": ("mean", "taux_dinsertion"),
+        "part_femmes": ("mean", "femmes"),
+        "n": ("sum", "nombre_de_reponses"),
+        "salaire_median": ("median", "salaire_net_median_des_emplois_a_temps_plein"),
+        "salaire_moyen": ("wmean", "salaire_net_median_des_emplois_a_temps_plein"),
+    })
+
+
+def genre_by_year(cube: tuple, rollups: dict) -> list[dict]:
+    return _rollup_records(cube, "annee", {
+        "taux_dinsertion_moy": ("mean", "taux_dinsertion"),
+        "part_femmes": ("mean", "femmes"),
+        "n": ("sum", "nombre_de_reponses"),
+    })
+
+
+def equite_by_domaine(cube: tuple, rollups: dict) -> list[dict]:
+    return _rollup_records(cube, "domaine", {
+        "taux_dinsertion_moy": ("mean", "taux_dinsertion"),
+        "part_boursiers": ("mean", "de_diplomes_boursiers"),
+        "n": ("sum", "nombre_de_reponses"),
+        "salaire_median": ("median", "salaire_net_median_des_emplois_a_temps_plein"),
+    })
+
+
+def academies_map(cube: tuple, rollups: dict) -> list[dict]:
+    out = []
+    for r in rollups["by_academie.json"]:
+        name = r.get("academie")
+        if name in ACADEMY_COORDS:
+            lat, lon = ACADEMY_COORDS[name]
+            out.append({**r, "lat": lat, "lon": lon})
+    return out
+
+
+# endpoint /api/<nom> -> calcul ; by_year, by_academie, by_region et regions_geo sont
+# déjà des sorties de l'ETL servies telles quelles
+ENDPOINTS = {
+    "by_domaine": by_domaine,
+    "genre_by_domaine": genre_by_domaine,
+    "genre_by_year": genre_by_year,
+    "equite_by_domaine": equite_by_domaine,
+    "academies_map": academies_map,
+}
+
+
+def write_endpoints(out_dir: Path) -> list[Path]:
+    """Écrit api/<nom>.json pour chaque endpoint de ENDPOINTS (à partir du cube et des rollups écrits)."""
+    out_dir = Path(out_dir)
+    cube = map_cube(out_dir) or compact_cube(
+        pd.read_parquet(out_dir / "cube.parquet"), pd.read_parquet(out_dir / "cube_sketch.parquet")
+    )
+    rollups = {}
+    for name in ("by_academie.json", "by_domaine.json"):
+        with open(out_dir / name, "r", encoding="utf-8") as f:
+            rollups[name] = json.load(f)
+    api_dir = out_dir / API_DIR
+    api_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for name, fn in ENDPOINTS.items():
+        path = api_dir / f"{name}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(fn(cube, rollups), f, ensure_ascii=False, separators=(",", ":"))
+        paths.append(path)
+    return paths
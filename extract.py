@@ -1,5 +1,114 @@
 from pathlib import Path
+import csv
+import hashlib
+import json
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
 
-def extract(raw_path: Path) -> pd.DataFrame:
-    return pd.read_csv(raw_path, sep=";", low_memory=False, encoding="utf-8")
\ No newline at end of file
+from etl.transform import NUMERIC_COLS, DROP_COLS, ALIASES
+
+# Valeurs lues comme NaN (défauts pandas + sentinelle "ns" = non significatif)
+NULL_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null", "ns",
+]
+
+
+def _header(raw_path: Path) -> list[str]:
+    with open(raw_path, "r", encoding="utf-8-sig", newline="") as f:
+        return next(csv.reader(f, delimiter=";"))
+
+
+def _file_hash(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def raw_schema(columns: list[str]) -> tuple[list[str], dict]:
+    """
+    Schéma déclaré à partir de NUMERIC_COLS / DROP_COLS :
+    colonnes à lire (sans les colonnes inutiles) + types float64 des numériques.
+    """
+    include, types = [], {}
+    for raw in columns:
+        name = raw.strip()
+        name = ALIASES.get(name, name)
+        if name in DROP_COLS:
+            continue
+        include.append(raw)
+        if name in NUMERIC_COLS:
+            types[raw] = pa.float64()
+    return include, types
+
+
+def schema_key(include: list[str], types: dict) -> str:
+    """
+    Empreinte de la lecture typée : sortie de raw_schema + NULL_VALUES. Entre dans la clé du
+    cache parquet : changer NUMERIC_COLS, DROP_COLS, ALIASES ou NULL_VALUES l'invalide.
+    """
+    raw = json.dumps([include, {c: str(t) for c, t in types.items()}, NULL_VALUES],
+                     ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _read_typed(raw_path: Path, include: list[str], types: dict) -> pa.Table:
+    read = pv.ReadOptions(use_threads=True, encoding="utf8")
+    parse = pv.ParseOptions(delimiter=";")
+    convert = pv.ConvertOptions(
+        column_types=types,
+        include_columns=include,
+        null_values=NULL_VALUES,
+        strings_can_be_null=True,
+        decimal_point=",",
+    )
+    try:
+        return pv.read_csv(raw_path, read_options=read, parse_options=parse, convert_options=convert)
+    except pa.ArrowInvalid as e:
+        # valeur inattendue (colonne numérique ou type inféré d'une autre colonne) : tout en texte,
+        # puis numériques convertis par transform._to_num, autres colonnes retypées une à une
+        print(f"⚠️ WARNING: lecture typée impossible ({e}), repli sur colonnes texte")
+        convert.column_types = {c: pa.string() for c in include}
+        table = pv.read_csv(raw_path, read_options=read, parse_options=parse, convert_options=convert)
+        columns = [col if name in types else _retype(col) for name, col in zip(table.column_names, table.columns)]
+        return pa.table(columns, names=table.column_names)
+
+
+def _retype(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Colonne texte hors NUMERIC_COLS : int64 ou float64 si toutes ses valeurs s'y convertissent, sinon texte."""
+    for t in (pa.int64(), pa.float64()):
+        try:
+            return column.cast(t)
+        except pa.ArrowInvalid:
+            pass
+    return column
+
+
+def extract(raw_path: Path, typed: bool = False, cache_dir: Path | None = None) -> pd.DataFrame:
+    """
+    typed=False : lecture pandas historique (tout en texte, converti par transform).
+    typed=True  : lecture pyarrow multithread, colonnes inutiles ignorées, numériques
+                  parsés directement (virgule décimale, "ns" -> NaN). La table brute est
+                  mise en cache en parquet sous `cache_dir`, clé = hash du CSV + schema_key.
+    """
+    if not typed:
+        return pd.read_csv(raw_path, sep=";", low_memory=False, encoding="utf-8")
+
+    raw_path = Path(raw_path)
+    cache_dir = Path(cache_dir) if cache_dir is not None else raw_path.parent.parent / "cache"
+    include, types = raw_schema(_header(raw_path))
+    cache_path = cache_dir / f"{raw_path.stem}-{_file_hash(raw_path)[:16]}-{schema_key(include, types)}.parquet"
+
+    if cache_path.exists():
+        return pq.read_table(cache_path).to_pandas()
+
+    table = _read_typed(raw_path, include, types)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(".tmp")
+    pq.write_table(table, tmp_path)
+    tmp_path.replace(cache_path)
+    return table.to_pandas()
@@ -0,0 +1,159 @@
+from pathlib import Path
+import json
+import numpy as np
+import pandas as pd
+
+from etl.aggregate import DEFAULT_WEIGHT, group_codes, _as_float, _weights
+from etl.manifest import API_DIR
+from etl.transform import NUMERIC_COLS
+
+# ---------- facteurs associés à l'insertion : corrélations pondérées par tranche ----------
+# Une passe sur la table : pour chaque cellule annee x domaine, matrice de Gram pondérée
+# (poids = nombre_de_reponses) de [présence, x, x²] x [présence, x] sur les colonnes numériques.
+# Ces moments s'additionnent : une tranche (table entière, une année, un domaine) = somme de
+# cellules, et les moments de blocs de lignes disjoints se fusionnent (merge_moments, ETL en
+# flux). Chaque paire de colonnes utilise les lignes où les deux sont renseignées.
+# Par tranche :
+#   corrélations  : matrice des corrélations pondérées (ordre de `variables`) ;
+#   facteurs      : pour chaque colonne, corrélation et pente de taux_dinsertion (régression
+#                   simple), pente partielle (régression multiple sur toutes les colonnes,
+#                   résolue sur les corrélations par paires) et poids des lignes utilisées.
+
+TARGET = "taux_dinsertion"
+FACTOR_COLS = [c for c in NUMERIC_COLS if c != DEFAULT_WEIGHT]
+FACTOR_SLICES = ("annee", "domaine")
+FACTORS_FILE = "factors.json"
+# lignes traitées par bloc (matrices n x 3p temporaires)
+CHUNK_ROWS = 1 << 16
+# seuil relatif des valeurs singulières ignorées (colonnes quasi colinéaires : salaires net/brut...)
+RCOND = 1e-6
+VAR_EPS = 1e-12
+
+
+def moment_center(df: pd.DataFrame, cols: list, weight=DEFAULT_WEIGHT) -> np.ndarray:
+    """Moyenne pondérée de chaque colonne (lignes de poids > 0), 0 si la colonne est vide."""
+    w = _weights(df, weight)
+    center = np.zeros(len(cols))
+    for i, c in enumerate(cols):
+        x = _as_float(df, c)
+        m = (w > 0) & ~np.isnan(x)
+        if m.any():
+            center[i] = np.average(x[m], weights=w[m])
+    return center
+
+
+def cell_moments(df: pd.DataFrame, by, cols: list, weight=DEFAULT_WEIGHT,
+                 center: np.ndarray | None = None) -> tuple[pd.DataFrame, np.ndarray]:
+    """
+    Moments pondérés par cellule de `by` : (clés triées, tableau n_cellules x 3p x 2p).
+    Bloc [a, b] de la matrice d'une cellule : somme de w * A_a * B_b avec A = [présence, x, x²],
+    B = [présence, x] (x centré sur `center`, défaut moment_center(df) : sans effet sur covariances
+    et pentes ; des blocs centrés sur la même valeur ont des moments qui s'additionnent).
+    """
+    codes, keys = group_codes(df, by)
+    p = len(cols)
+    w = _weights(df, weight)
+    center = moment_center(df, cols, weight) if center is None else center
+    xs = [_as_float(df, c) - center[i] for i, c in enumerate(cols)]
+    keep = (codes >= 0) & (w > 0)
+
+    out = np.zeros((len(keys), 3 * p, 2 * p))
+    rows = np.flatnonzero(keep)
+    rows = rows[np.argsort(codes[rows], kind="stable")]
+    for s in range(0, len(rows), CHUNK_ROWS):
+        idx = rows[s:s + CHUNK_ROWS]
+        x = np.column_stack([x[idx] for x in xs])
+        present = ~np.isnan(x)
+        x0 = np.where(present, x, 0.0)
+        right = np.hstack([present, x0])
+        left = np.hstack([right, x0 * x0]) * w[idx][:, None]
+        c = codes[idx]
+        bounds = np.flatnonzero(np.diff(c)) + 1
+        for a, b in zip(np.r_[0, bounds], np.r_[bounds, len(c)]):
+            out[c[a]] += left[a:b].T @ right[a:b]
+    return keys, out
+
+
+def merge_moments(moments: tuple | None, other: tuple) -> tuple[pd.DataFrame, np.ndarray]:
+    """Somme de deux résultats de cell_moments (même centre) : cellules réunies, clés triées."""
+    if moments is None:
+        return other
+    keys = pd.concat([moments[0], other[0]], ignore_index=True)
+    codes, merged = group_codes(keys, list(keys.columns))
+    out = np.zeros((len(merged),) + other[1].shape[1:])
+    np.add.at(out, codes, np.concatenate([moments[1], other[1]]))
+    return merged, out
+
+
+def summarize(g: np.ndarray, cols: list, target: str = TARGET) -> dict:
+    """Corrélations et pentes d'une tranche à partir de ses moments (somme de cellules)."""
+    p = len(cols)
+    W, S, Q, R = g[:p, :p], g[p:2 * p, :p], g[p:2 * p, p:], g[2 * p:, :p]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # moyennes, variances et covariance de chaque paire sur les lignes où les deux sont renseignées
+        mj, mk = S / W, S.T / W
+        cov = Q / W - mj * mk
+        vj, vk = R / W - mj ** 2, R.T / W - mk ** 2
+        # variance dans l'erreur d'arrondi du moment d'ordre 2 : colonne constante sur la tranche
+        vj[~(vj > VAR_EPS * R / W)] = np.nan
+        vk[~(vk > VAR_EPS * R.T / W)] = np.nan
+        corr = np.clip(cov / np.sqrt(vj * vk), -1.0, 1.0)
+        corr[W <= 0] = np.nan
+        slope = cov / vj
+
+    t = cols.index(target)
+    factors = [j for j in range(p) if j != t and np.isfinite(corr[j, t])]
+    partial = np.full(p, np.nan)
+    if factors:
+        rxx = np.nan_to_num(corr[np.ix_(factors, factors)], nan=0.0)
+        np.fill_diagonal(rxx, 1.0)
+        beta = np.linalg.lstsq(rxx, corr[factors, t], rcond=RCOND)[0]
+        sd = np.sqrt(np.diag(vj))
+        partial[factors] = beta * sd[t] / sd[factors]
+
+    def num(v, digits=6):
+        return float(f"{v:.{digits}g}") if np.isfinite(v) else None
+
+    return {
+        "n": num(W[t, t], 12),
+        "correlations": [[num(v, 4) for v in row] for row in corr],
+        "facteurs": [
+            {"variable": cols[j], "n": num(W[j, t], 12), "correlation": num(corr[j, t], 4),
+             "pente": num(slope[j, t]), "pente_partielle": num(partial[j])}
+            for j in range(p) if j != t
+        ],
+    }
+
+
+def factor_report(df: pd.DataFrame, cols: list | None = None, slices=FACTOR_SLICES,
+                  weight=DEFAULT_WEIGHT) -> dict:
+    """Rapport complet : table entière ("all") et une entrée par valeur de chaque dimension de `slices`."""
+    cols = [c for c in (cols or FACTOR_COLS) if c in df.columns]
+    by = [d for d in slices if d in df.columns]
+    keys, g = cell_moments(df, by, cols, weight)
+    return moments_report(keys, g, cols, by, weight)
+
+
+def moments_report(keys: pd.DataFrame, g: np.ndarray, cols: list, by: list, weight=DEFAULT_WEIGHT) -> dict:
+    """Rapport à partir des moments par cellule (factor_report, ou blocs fusionnés de l'ETL en flux)."""
+    report = {"cible": TARGET, "poids": weight, "variables": cols,
+              "slices": {"all": [summarize(g.sum(axis=0), cols)]}}
+    for dim in by:
+        report["slices"][dim] = [
+            {dim: value.item() if hasattr(value, "item") else value, **summarize(g[idx].sum(axis=0), cols)}
+            for value, idx in sorted(keys.groupby(dim, observed=True).indices.items())
+        ]
+    return report
+
+
+def write_factors(data: pd.DataFrame, out_dir: Path) -> Path:
+    """api/factors.json (servi tel quel par /api/factors)."""
+    return dump_factors(factor_report(data), out_dir)
+
+
+def dump_factors(report: dict, out_dir: Path) -> Path:
+    path = Path(out_dir) / API_DIR / FACTORS_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, separators=(",", ":"))
+    return path
@@ -0,0 +1,242 @@
+from pathlib import Path
+import json
+import numpy as np
+
+from etl.parallel import pmap
+
+# ---------- géométries des régions : niveaux de détail (LOD) ----------
+# GeoJSON pleine résolution -> topologie à arcs partagés (style TopoJSON) :
+#   1) coordonnées entières (pas de 1e-5 degré = précision du fichier source, sans perte) ;
+#   2) anneaux découpés aux jonctions, arcs communs à deux régions stockés une seule fois ;
+#   3) Douglas-Peucker par arc et par niveau : une frontière commune est simplifiée
+#      à l'identique des deux côtés (ni trou ni chevauchement) ;
+#   4) quantification au pas du niveau + encodage delta des arcs ;
+#   5) propriétés de by_region.json pré-jointes sur chaque région.
+
+BASE_UNIT = 1e-5
+
+# niveau -> (tolérance de simplification, pas de quantification), en degrés
+GEO_LEVELS = {
+    "low": (0.02, 0.005),
+    "medium": (0.005, 0.001),
+    "high": (0.001, 0.0002),
+}
+DEFAULT_LEVEL = "medium"
+
+GEO_PROPERTIES = ["taux_dinsertion_moy", "salaire_median", "n"]
+
+
+def _polygons(geometry: dict) -> list:
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    raise ValueError(f"Géométrie non supportée: {geometry['type']}")
+
+
+def build_topology(features: list) -> tuple[list, list, np.ndarray]:
+    """
+    Retourne (arcs, shapes, origin) :
+      arcs   : tableaux entiers (n, 2), en unités BASE_UNIT relatives à origin ;
+      shapes : par feature, liste de polygones = liste d'anneaux = liste d'index d'arcs
+               (~i = arc i parcouru à l'envers, convention TopoJSON).
+    """
+    rings = []  # (feature, polygone, anneau, points sans point de fermeture)
+    for fi, feat in enumerate(features):
+        for pi, poly in enumerate(_polygons(feat["geometry"])):
+            for ri, ring in enumerate(poly):
+                pts = np.rint(np.asarray(ring, dtype=np.float64) / BASE_UNIT).astype(np.int64)
+                if len(pts) > 1 and (pts[0] == pts[-1]).all():
+                    pts = pts[:-1]
+                rings.append((fi, pi, ri, pts))
+
+    origin = np.min([r[3].min(axis=0) for r in rings], axis=0)
+
+    # anneaux contenant chaque point
+    owners = {}
+    for k, (*_, pts) in enumerate(rings):
+        for p in map(tuple, pts - origin):
+            owners.setdefault(p, set()).add(k)
+
+    arcs, arc_index = [], {}
+
+    def add_arc(arc: np.ndarray) -> int:
+        key = arc.tobytes()
+        if key in arc_index:
+            return arc_index[key]
+        rkey = arc[::-1].tobytes()
+        if rkey in arc_index:
+            return ~arc_index[rkey]
+        arc_index[key] = len(arcs)
+        arcs.append(arc)
+        return arc_index[key]
+
+    shapes = [[] for _ in features]
+    for fi, pi, ri, pts in rings:
+        pts = pts - origin
+        sets = [owners[p] for p in map(tuple, pts)]
+        n = len(pts)
+        junctions = [
+            i for i in range(n)
+            if len(sets[i]) > 1 and (sets[i] != sets[i - 1] or sets[i] != sets[(i + 1) % n])
+        ]
+        if not junctions:
+            ring_arcs = [add_arc(np.vstack([pts, pts[:1]]))]
+        else:
+            start = junctions[0]
+            rolled = np.roll(pts, -start, axis=0)
+            cuts = [j - start for j in junctions] + [n]
+            ring_arcs = [
+                add_arc(np.vstack([rolled, rolled[:1]])[a:b + 1])
+                for a, b in zip(cuts[:-1], cuts[1:])
+            ]
+        polys = shapes[fi]
+        while len(polys) <= pi:
+            polys.append([])
+        polys[pi].append(ring_arcs)
+    return arcs, shapes, origin
+
+
+def _simplify(pts: np.ndarray, tol: float) -> np.ndarray:
+    """Douglas-Peucker itératif ; extrémités conservées (et point le plus éloigné si arc fermé)."""
+    n = len(pts)
+    if n <= 2 or tol <= 0:
+        return pts
+    p = pts.astype(np.float64)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    if (pts[0] == pts[-1]).all():
+        k = int(np.argmax(((p - p[0]) ** 2).sum(axis=1)))
+        keep[k] = True
+        stack = [(0, k), (k, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        seg = p[b] - p[a]
+        rel = p[a + 1:b] - p[a]
+        L2 = seg @ seg
+        if L2 == 0:
+            d = np.sqrt((rel ** 2).sum(axis=1))
+        else:
+            t = np.clip(rel @ seg / L2, 0.0, 1.0)
+            d = np.sqrt(((rel - t[:, None] * seg) ** 2).sum(axis=1))
+        i = int(np.argmax(d))
+        if d[i] > tol:
+            m = a + 1 + i
+            keep[m] = True
+            stack.append((a, m))
+            stack.append((m, b))
+    return pts[keep]
+
+
+def _ring_points(ring_arcs: list, arcs: list) -> int:
+    """Nombre de points distincts d'un anneau reconstitué (validité après simplification)."""
+    pts = [arcs[i] if i >= 0 else arcs[~i][::-1] for i in ring_arcs]
+    return len(np.unique(np.vstack(pts), axis=0))
+
+
+def topology_level(features: list, topo: tuple, tolerance: float, quantum: float,
+                   properties: dict | None = None) -> dict:
+    """Objet TopoJSON d'un niveau de détail (arcs simplifiés, quantifiés, delta-encodés)."""
+    arcs, shapes, origin = topo
+    k = max(1, int(round(quantum / BASE_UNIT)))
+    tol_units = tolerance / BASE_UNIT
+
+    levelled = []
+    for arc in arcs:
+        q = np.rint(_simplify(arc, tol_units) / k).astype(np.int64)
+        dup = np.r_[False, (q[1:] == q[:-1]).all(axis=1)]
+        dup[-1] = False
+        q = q[~dup]
+        if len(q) < 2:
+            q = np.vstack([q[:1], q[-1:]])
+        levelled.append(q)
+
+    # anneaux dégénérés (petites îles au niveau grossier) retirés, arcs inutilisés élagués
+    geometries, used = [], {}
+    for feat, polys in zip(features, shapes):
+        kept = []
+        for poly in polys:
+            if _ring_points(poly[0], levelled) < 3:
+                continue
+            kept.append([r for r in poly if r is poly[0] or _ring_points(r, levelled) >= 3])
+        if not kept:  # ne jamais perdre une région : premier polygone conservé tel quel
+            kept = [polys[0]]
+        for poly in kept:
+            for ring in poly:
+                for i in ring:
+                    used.setdefault(i if i >= 0 else ~i, len(used))
+        props = dict(feat.get("properties") or {})
+        if properties is not None:
+            props.update(properties.get(props.get("nom"), {}))
+        geometries.append({"kept": kept, "properties": props})
+
+    order = sorted(used, key=used.get)
+    remap = {old: new for new, old in enumerate(order)}
+
+    def ref(i):
+        return remap[i] if i >= 0 else ~remap[~i]
+
+    objects = []
+    for g in geometries:
+        polys = [[[ref(i) for i in ring] for ring in poly] for poly in g["kept"]]
+        if len(polys) == 1:
+            objects.append({"type": "Polygon", "arcs": polys[0], "properties": g["properties"]})
+        else:
+            objects.append({"type": "MultiPolygon", "arcs": polys, "properties": g["properties"]})
+
+    out_arcs = []
+    for old in order:
+        q = levelled[old]
+        delta = np.vstack([q[:1], np.diff(q, axis=0)])
+        out_arcs.append(delta.tolist())
+
+    scale = k * BASE_UNIT
+    return {
+        "type": "Topology",
+        "transform": {
+            "scale": [scale, scale],
+            "translate": [float(origin[0] * BASE_UNIT), float(origin[1] * BASE_UNIT)],
+        },
+        "objects": {"regions": {"type": "GeometryCollection", "geometries": objects}},
+        "arcs": out_arcs,
+    }
+
+
+def region_properties(by_region: list) -> dict:
+    return {r["region"]: {c: r.get(c) for c in GEO_PROPERTIES} for r in by_region}
+
+
+def _level_task(args: tuple) -> dict:
+    return topology_level(*args)
+
+
+def build_regions_geo(geojson_path: Path, by_region_path: Path | None, out_dir: Path,
+                      levels: dict = GEO_LEVELS, workers: int = 1) -> dict:
+    """
+    Étape géométrie hors ligne : écrit regions_<niveau>.topo.json dans out_dir.
+    workers > 1 : un niveau par processus (simplification en Python pur, liée au GIL).
+    """
+    with open(geojson_path, "r", encoding="utf-8") as f:
+        features = json.load(f)["features"]
+    props = None
+    if by_region_path is not None and Path(by_region_path).exists():
+        with open(by_region_path, "r", encoding="utf-8") as f:
+            props = region_properties(json.load(f))
+
+    topo = build_topology(features)
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    outs = pmap(
+        _level_task,
+        [(features, topo, tolerance, quantum, props) for tolerance, quantum in levels.values()],
+        workers, processes=True,
+    )
+    written = {}
+    for level, out in zip(levels, outs):
+        path = Path(out_dir) / f"regions_{level}.topo.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(out, f, ensure_ascii=False, separators=(",", ":"))
+        written[level] = path
+    return written
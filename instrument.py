@@ -0,0 +1,250 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import os
+import sys
+import threading
+import time
+
+# ---------- instrumentation : étapes ETL, latences API, export Prometheus ----------
+# Un registre en mémoire par processus (compteurs, jauges, histogrammes à seaux fixes),
+# rendu au format texte Prometheus par /metrics. Sans dépendance externe.
+
+# secondes ; seaux cumulés "le" (+Inf ajouté au rendu)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def rss_bytes() -> int | None:
+    """RSS courant du processus (Linux) ; repli sur le pic depuis le démarrage, None si indisponible."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return max_rss_bytes()
+
+
+def rss_detail() -> dict | None:
+    """
+    RSS ventilé (Linux) : anon = mémoire privée du processus, file = pages de fichiers mappés
+    (partagées via le cache de pages entre processus qui mappent le même fichier).
+    """
+    fields = {"RssAnon:": "anon", "RssFile:": "file", "RssShmem:": "shmem"}
+    try:
+        with open("/proc/self/status", "r") as f:
+            parts = (line.split() for line in f)
+            return {fields[p[0]]: int(p[1]) * 1024 for p in parts if p and p[0] in fields}
+    except OSError:
+        return None
+
+
+def max_rss_bytes() -> int | None:
+    """Pic de RSS du processus depuis son démarrage."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _le(bound: str) -> str:
+    return f'le="{bound}"'
+
+
+def _num(value: float) -> str:
+    value = float(value)
+    if value != value:
+        return "NaN"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class MetricsRegistry:
+    """Compteurs, jauges et histogrammes étiquetés ; thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}      # nom -> (type, aide)
+        self._values = {}    # (nom, labels) -> valeur (compteur / jauge)
+        self._hists = {}     # (nom, labels) -> [seaux, comptes par seau, somme, total]
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._values[(name, tuple(sorted(labels.items())))] = float(value)
+
+    def observe(self, name: str, value: float, buckets=DEFAULT_BUCKETS, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._hists.get(key)
+            if hist is None:
+                hist = self._hists[key] = [tuple(buckets), [0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(hist[0]):
+                if value <= bound:
+                    hist[1][i] += 1
+                    break
+            hist[2] += value
+            hist[3] += 1
+
+    def clear(self, name: str) -> None:
+        """Retire toutes les séries d'un nom (jauges à étiquettes variables : version...)."""
+        with self._lock:
+            for key in [k for k in self._values if k[0] == name]:
+                del self._values[key]
+
+    def value(self, name: str, **labels) -> float:
+        return self._values.get((name, tuple(sorted(labels.items()))), 0.0)
+
+    def render(self) -> str:
+        """Format d'exposition texte Prometheus (version 0.0.4)."""
+        with self._lock:
+            values = sorted(self._values.items())
+            hists = sorted((k, (b, list(c), s, n)) for k, (b, c, s, n) in self._hists.items())
+        lines, seen = [], set()
+
+        def header(name, default_kind):
+            if name in seen:
+                return
+            seen.add(name)
+            kind, help_text = self._meta.get(name, (default_kind, ""))
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), v in values:
+            header(name, "untyped")
+            lines.append(f"{name}{_labels(labels)} {_num(v)}")
+        for (name, labels), (buckets, counts, total, count) in hists:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, c in zip(buckets, counts):
+                cumulative += c
+                lines.append(f"{name}_bucket{_labels(labels, _le(_num(bound)))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, _le('+Inf'))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {_num(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+REGISTRY.describe("etl_stage_duration_seconds", "gauge", "Durée de la dernière exécution de l'étape ETL")
+REGISTRY.describe("etl_stage_rows", "gauge", "Lignes produites par l'étape ETL")
+REGISTRY.describe("etl_stage_rss_bytes", "gauge", "RSS du processus ETL en fin d'étape")
+
+
+# ---------- étapes ETL ----------
+_stages = {}
+_stages_lock = threading.Lock()
+
+
+@contextmanager
+def stage(name: str, registry: MetricsRegistry = REGISTRY, verbose: bool = True):
+    """
+    Mesure une étape : durée, lignes (à renseigner par l'appelant : info["rows"] = len(df)),
+    RSS à la sortie, variation de RSS et pic du processus. info["cached"] = True : valeur relue
+    du cache de l'étape (pipeline.py) plutôt que recalculée.
+        with stage("transform") as info:
+            data = transform(df)
+            info["rows"] = len(data)
+    """
+    info = {"rows": None, "cached": False}
+    rss0 = rss_bytes()
+    t0 = time.perf_counter()
+    try:
+        yield info
+    finally:
+        duration = time.perf_counter() - t0
+        rss1 = rss_bytes()
+        record = {
+            "duration_s": round(duration, 4),
+            "rows": info["rows"],
+            "rss_bytes": rss1,
+            "rss_delta_bytes": rss1 - rss0 if rss0 is not None and rss1 is not None else None,
+            "max_rss_bytes": max_rss_bytes(),
+            "cached": info["cached"],
+        }
+        with _stages_lock:
+            _stages[name] = record
+        registry.set("etl_stage_duration_seconds", duration, stage=name)
+        if info["rows"] is not None:
+            registry.set("etl_stage_rows", info["rows"], stage=name)
+        if rss1 is not None:
+            registry.set("etl_stage_rss_bytes", rss1, stage=name)
+        if verbose:
+            rows = f", {info['rows']} lignes" if info["rows"] is not None else ""
+            mem = f", RSS {rss1 / 2 ** 20:.0f} Mo" if rss1 is not None else ""
+            cached = " (cache)" if info["cached"] else ""
+            print(f"[etl] {name}: {duration:.3f}s{cached}{rows}{mem}")
+
+
+def stage_report() -> dict:
+    """Mesures des étapes exécutées dans ce processus (écrites dans le manifest par run.py)."""
+    with _stages_lock:
+        return {name: dict(r) for name, r in _stages.items()}
+
+
+def reset_stages() -> None:
+    with _stages_lock:
+        _stages.clear()
+
+
+# ---------- phases d'une requête (accès données / agrégation / sérialisation) ----------
+# Phases exclusives : une phase imbriquée suspend la phase englobante.
+_phases: ContextVar[dict | None] = ContextVar("phases", default=None)
+
+
+def begin_phases() -> None:
+    _phases.set({"totals": {}, "stack": []})
+
+
+def end_phases() -> dict:
+    state = _phases.get()
+    _phases.set(None)
+    return state["totals"] if state is not None else {}
+
+
+@contextmanager
+def phase(name: str):
+    """Chronomètre une phase de la requête courante (sans effet hors requête)."""
+    state = _phases.get()
+    if state is None:
+        yield
+        return
+    totals, stack = state["totals"], state["stack"]
+    now = time.perf_counter()
+    if stack:
+        outer = stack[-1]
+        totals[outer[0]] = totals.get(outer[0], 0.0) + now - outer[1]
+    current = [name, now]
+    stack.append(current)
+    try:
+        yield
+    finally:
+        now = time.perf_counter()
+        stack.pop()
+        totals[name] = totals.get(name, 0.0) + now - current[1]
+        if stack:
+            stack[-1][1] = now
+
+
+def server_timing(phases: dict, total: float) -> str:
+    """Valeur de l'en-tête Server-Timing (durées en ms)."""
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in phases.items()]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
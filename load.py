@@ -1,34 +1,51 @@
 from pathlib import Path
 import pandas as pd
 import numpy as np
+import pyarrow.parquet as pq
+from etl.aggregate import aggregate
+from etl.bootstrap import intervals
+from etl.cube import build_cube, write_cube_ipc
+from etl.manifest import write_manifest
+from etl.endpoints import write_endpoints
+from etl.factors import write_factors
+from etl.dataset import write_clean_dataset, open_clean, read_clean, PARTITION_COLS
+from etl.instrument import stage
+from etl.parallel import run_tasks
+
+# Métriques communes aux rollups by_year / by_domaine / by_academie
+ROLLUP_METRICS = {
+    "taux_dinsertion_moy": ("wmean", "taux_dinsertion"),
+    "taux_emploi_moy": ("wmean", "taux_d_emploi"),
+    "salaire_median": ("wmedian", "salaire_net_median_des_emplois_a_temps_plein"),
+    "n": ("wsum", None),
+}
 
-# ---------- helpers stats ----------
-def wmean(x: pd.Series, w: pd.Series) -> float:
-    x = pd.to_numeric(x, errors="coerce")
-    w = pd.to_numeric(w, errors="coerce").fillna(0)
-    m = x.notna() & w.gt(0)
-    if m.sum() == 0:
-        return float("nan")
-    return float((x[m] * w[m]).sum() / w[m].sum())
-
-def wmedian(x: pd.Series, w: pd.Series) -> float:
-    # médiane pondérée (propre) : tri par x et cumul des poids
-    x = pd.to_numeric(x, errors="coerce")
-    w = pd.to_numeric(w, errors="coerce").fillna(0)
-    m = x.notna() & w.gt(0)
-    if m.sum() == 0:
-        return float("nan")
-
-    df = pd.DataFrame({"x": x[m], "w": w[m]}).sort_values("x")
-    cum = df["w"].cumsum()
-    cutoff = df["w"].sum() / 2.0
-    return float(df.loc[cum >= cutoff, "x"].iloc[0])
+# Intervalles de confiance bootstrap (etl/bootstrap.py) joints aux rollups :
+# <métrique>_ic_bas / <métrique>_ic_haut pour chaque métrique listée
+ROLLUP_INTERVALS = {"metrics": ["taux_dinsertion_moy", "salaire_median"], "n_boot": 500, "level": 0.95, "seed": 0}
+
+# Définition des rollups : fichier -> colonne de regroupement et tri de sortie.
+# Chaque définition entre dans la clé de cache de son étape (pipeline.py) : modifier
+# un rollup ne recalcule que lui.
+ROLLUPS = {
+    "by_year": {"by": "annee", "metrics": ROLLUP_METRICS, "sort": "annee", "ascending": True,
+                "intervals": ROLLUP_INTERVALS},
+    "by_domaine": {"by": "domaine", "metrics": ROLLUP_METRICS, "sort": "taux_dinsertion_moy", "ascending": False,
+                   "intervals": ROLLUP_INTERVALS},
+    "by_academie": {"by": "academie", "metrics": ROLLUP_METRICS, "sort": "taux_dinsertion_moy", "ascending": False,
+                    "intervals": ROLLUP_INTERVALS},
+}
 
-# ---------- main load ----------
-def load(data: pd.DataFrame, out_dir: Path) -> None:
-    out_dir.mkdir(parents=True, exist_ok=True)
+# Agrégat par région (colonnes renommées : n, salaire)
+REGION_METRICS = {
+    "taux_dinsertion_moy": ("wmean", "taux_dinsertion"),
+    "salaire_median": ("wmedian", "salaire"),
+    "n": ("wsum", None),
+}
 
-    # --- Sanity checks (pour rassurer ton prof) ---
+# ---------- sorties (une fonction par fichier, réutilisées par le graphe de run.py) ----------
+def check_data(data: pd.DataFrame) -> None:
+    """Sanity checks (pour rassurer ton prof) : avertissements seulement."""
     # Taux doivent être dans [0,1]
     for c in ["taux_dinsertion", "taux_d_emploi"]:
         if c in data.columns:
@@ -42,53 +59,84 @@ def load(data: pd.DataFrame, out_dir: Path) -> None:
         if neg > 0:
             print(f"⚠️ WARNING: nombre_de_reponses négatif sur {neg} lignes")
 
-    # --- Export dataset nettoyé ---
-    data.to_parquet(out_dir / "clean.parquet", index=False)
-
-    # Poids
-    w = data["nombre_de_reponses"] if "nombre_de_reponses" in data.columns else pd.Series([1]*len(data))
-
-    # --- Agrégats par année (pondérés) ---
-    by_year = (
-        data.groupby("annee", as_index=False)
-            .apply(lambda g: pd.Series({
-                "taux_dinsertion_moy": wmean(g["taux_dinsertion"], g["nombre_de_reponses"]),
-                "taux_emploi_moy": wmean(g["taux_d_emploi"], g["nombre_de_reponses"]),
-                "salaire_median": wmedian(g["salaire_net_median_des_emplois_a_temps_plein"], g["nombre_de_reponses"]),
-                "n": float(pd.to_numeric(g["nombre_de_reponses"], errors="coerce").fillna(0).sum())
-            }))
-            .reset_index(drop=True)
-            .sort_values("annee")
-    )
-    by_year.to_json(out_dir / "by_year.json", orient="records", force_ascii=False)
-
-    # --- Agrégats par domaine (pondérés) ---
-    by_domaine = (
-        data.groupby("domaine", as_index=False)
-            .apply(lambda g: pd.Series({
-                "taux_dinsertion_moy": wmean(g["taux_dinsertion"], g["nombre_de_reponses"]),
-                "taux_emploi_moy": wmean(g["taux_d_emploi"], g["nombre_de_reponses"]),
-                "salaire_median": wmedian(g["salaire_net_median_des_emplois_a_temps_plein"], g["nombre_de_reponses"]),
-                "n": float(pd.to_numeric(g["nombre_de_reponses"], errors="coerce").fillna(0).sum())
-            }))
-            .reset_index(drop=True)
-            .sort_values("taux_dinsertion_moy", ascending=False)
-    )
-    by_domaine.to_json(out_dir / "by_domaine.json", orient="records", force_ascii=False)
-
-    # --- Agrégats par académie (pondérés) ---
-    by_academie = (
-        data.groupby("academie", as_index=False)
-            .apply(lambda g: pd.Series({
-                "taux_dinsertion_moy": wmean(g["taux_dinsertion"], g["nombre_de_reponses"]),
-                "taux_emploi_moy": wmean(g["taux_d_emploi"], g["nombre_de_reponses"]),
-                "salaire_median": wmedian(g["salaire_net_median_des_emplois_a_temps_plein"], g["nombre_de_reponses"]),
-                "n": float(pd.to_numeric(g["nombre_de_reponses"], errors="coerce").fillna(0).sum())
-            }))
-            .reset_index(drop=True)
-            .sort_values("taux_dinsertion_moy", ascending=False)
-    )
-    by_academie.to_json(out_dir / "by_academie.json", orient="records", force_ascii=False)
+
+def with_intervals(data: pd.DataFrame, agg: pd.DataFrame, by, metrics: dict, spec: dict | None,
+                   weight: str = "nombre_de_reponses") -> pd.DataFrame:
+    """Ajoute à `agg` les intervalles bootstrap des métriques listées dans `spec` (None : inchangé)."""
+    if not spec:
+        return agg
+    params = {k: v for k, v in spec.items() if k != "metrics"}
+    ci = intervals(data, by, {m: metrics[m] for m in spec["metrics"]}, weight=weight, **params)
+    return agg.merge(ci, on=by, how="left")
+
+
+def write_rollup(data: pd.DataFrame, out_dir: Path, name: str, spec: dict | None = None) -> Path:
+    """Agrégat pondéré (une passe vectorisée) écrit dans out_dir/<name>.json, intervalles bootstrap joints."""
+    spec = spec or ROLLUPS[name]
+    out = aggregate(data, spec["by"], spec["metrics"])
+    out = with_intervals(data, out, spec["by"], spec["metrics"], spec.get("intervals"))
+    out = out.sort_values(spec["sort"], ascending=spec["ascending"])
+    path = Path(out_dir) / f"{name}.json"
+    out.to_json(path, orient="records", force_ascii=False)
+    return path
+
+
+def write_cube(data: pd.DataFrame, out_dir: Path) -> list[Path]:
+    """
+    Cube d'agrégats (annee x domaine x academie/region x situation) et son sketch, en parquet
+    et en Arrow IPC compact non compressé (mappé par le serveur, partagé entre workers).
+    """
+    return write_cube_files(*build_cube(data, ACADEMY_TO_REGION), out_dir)
+
+
+def write_cube_files(cells: pd.DataFrame, sketch: pd.DataFrame, out_dir: Path) -> list[Path]:
+    """Fichiers du cube (parquet + IPC) ; cube construit en mémoire ou fusionné par l'ETL en flux."""
+    paths = [Path(out_dir) / "cube.parquet", Path(out_dir) / "cube_sketch.parquet"]
+    cells.to_parquet(paths[0], index=False)
+    sketch.to_parquet(paths[1], index=False)
+    return paths + write_cube_ipc(cells, sketch, out_dir)
+
+
+# ---------- main load ----------
+def load(data: pd.DataFrame, out_dir: Path, partition_cols=PARTITION_COLS, workers: int = 1) -> None:
+    """
+    Écrit les sorties de l'ETL dans out_dir. Dataset propre, rollups et cube sont indépendants :
+    exécutés en parallèle si workers > 1 (threads sur le même DataFrame, sorties identiques).
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    check_data(data)
+
+    # --- Export dataset nettoyé (partitionné Hive, par année par défaut) ---
+    def write_dataset():
+        with stage("load.dataset") as info:
+            write_clean_dataset(data, out_dir, partition_cols)
+            info["rows"] = len(data)
+
+    # --- Agrégats par année / domaine / académie (pondérés, une passe vectorisée) ---
+    def write_rollups():
+        with stage("load.rollups"):
+            for name in ROLLUPS:
+                write_rollup(data, out_dir, name)
+
+    # --- Cube d'agrégats (annee x domaine x academie/region x situation) ---
+    def write_cubes():
+        with stage("load.cube") as info:
+            cells_path = write_cube(data, out_dir)[0]
+            info["rows"] = pq.read_metadata(cells_path).num_rows
+
+    # --- Corrélations pondérées des facteurs d'insertion (/api/factors) ---
+    def write_factor_report():
+        with stage("load.factors"):
+            write_factors(data, out_dir)
+
+    run_tasks([write_dataset, write_rollups, write_cubes, write_factor_report], workers)
+
+    # --- Sorties des endpoints statiques (servies sans pandas par le serveur) ---
+    with stage("load.api"):
+        write_endpoints(out_dir)
+
+    # --- Manifest (en dernier : signale une nouvelle version au serveur) ---
+    write_manifest(out_dir)
 
 
 # --- mapping "académie" -> "région" (noms compatibles GeoJSON) ---
@@ -153,55 +201,49 @@ ACADEMY_TO_REGION = {
 }
 
 
-def _pick_col(df, candidates):
+def _pick_col(columns, candidates):
     for c in candidates:
-        if c in df.columns:
+        if c in columns:
             return c
     return None
 
 
-def _wmean(x, w):
-    x = pd.to_numeric(x, errors="coerce")
-    w = pd.to_numeric(w, errors="coerce").fillna(0)
-    m = x.notna() & (w > 0)
-    if m.sum() == 0:
-        return np.nan
-    return float((x[m] * w[m]).sum() / w[m].sum())
+def region_rollup(tmp: pd.DataFrame) -> pd.DataFrame:
+    """Agrégat par région à partir des colonnes academie, n, taux_dinsertion, salaire."""
+    tmp = tmp.assign(region=tmp["academie"].map(ACADEMY_TO_REGION)).dropna(subset=["region"])
+    out = aggregate(tmp, "region", REGION_METRICS, weight="n")
+    out = with_intervals(tmp, out, "region", REGION_METRICS, ROLLUP_INTERVALS, weight="n")
+    return out.sort_values("taux_dinsertion_moy", ascending=False)
 
 
-def _wmedian(x, w):
-    x = pd.to_numeric(x, errors="coerce")
-    w = pd.to_numeric(w, errors="coerce").fillna(0)
-    m = x.notna() & (w > 0)
-    if m.sum() == 0:
-        return np.nan
-    x = x[m].to_numpy()
-    w = w[m].to_numpy()
-    idx = np.argsort(x)
-    x = x[idx]
-    w = w[idx]
-    cw = np.cumsum(w)
-    cut = w.sum() / 2.0
-    return float(x[np.searchsorted(cw, cut)])
+def write_by_region(data: pd.DataFrame, out_dir: Path) -> Path:
+    """by_region.json depuis les données transformées en mémoire (sans relire le dataset propre)."""
+    tmp = data[["academie", "nombre_de_reponses", "taux_dinsertion", "salaire_net_median_des_emplois_a_temps_plein"]]
+    tmp = tmp.rename(columns={"nombre_de_reponses": "n", "salaire_net_median_des_emplois_a_temps_plein": "salaire"})
+    path = Path(out_dir) / "by_region.json"
+    region_rollup(tmp).to_json(path, orient="records", force_ascii=False)
+    return path
 
 
-def build_by_region():
-    clean_path = Path("data/processed/clean.parquet")
-    out_path = Path("data/processed/by_region.json")
+def build_by_region(processed_dir: Path = Path("data/processed")):
+    processed_dir = Path(processed_dir)
+    out_path = processed_dir / "by_region.json"
 
-    df = pd.read_parquet(clean_path)
+    dataset = open_clean(processed_dir)
+    names = dataset.schema.names
 
     # Colonnes "clé" (on détecte selon ton parquet)
-    col_academie = _pick_col(df, ["academie", "Académie", "nom_academie"])
-    col_w = _pick_col(df, ["nombre_de_reponses", "n", "reponses", "nb_reponses"])
-    col_insert = _pick_col(df, ["taux_dinsertion", "taux_d_insertion", "taux_insertion"])
-    col_salary = _pick_col(df, ["salaire_net_median_des_emplois_a_temps_plein", "salaire_median", "salaire_net_median"])
+    col_academie = _pick_col(names, ["academie", "Académie", "nom_academie"])
+    col_w = _pick_col(names, ["nombre_de_reponses", "n", "reponses", "nb_reponses"])
+    col_insert = _pick_col(names, ["taux_dinsertion", "taux_d_insertion", "taux_insertion"])
+    col_salary = _pick_col(names, ["salaire_net_median_des_emplois_a_temps_plein", "salaire_median", "salaire_net_median"])
 
     if not all([col_academie, col_w, col_insert, col_salary]):
         missing = [("academie", col_academie), ("poids(n)", col_w), ("insertion", col_insert), ("salaire", col_salary)]
         raise ValueError(f"Colonnes introuvables: {missing}. Ouvre clean.parquet et vérifie les noms.")
 
-    tmp = df[[col_academie, col_w, col_insert, col_salary]].copy()
+    # projection : seules les 4 colonnes utiles sont lues
+    tmp = read_clean(dataset, columns=[col_academie, col_w, col_insert, col_salary])
     tmp.rename(columns={
         col_academie: "academie",
         col_w: "n",
@@ -209,19 +251,7 @@ def build_by_region():
         col_salary: "salaire"
     }, inplace=True)
 
-    tmp["region"] = tmp["academie"].map(ACADEMY_TO_REGION)
-    tmp = tmp.dropna(subset=["region"])
-
-    by_region = (
-        tmp.groupby("region", as_index=False)
-           .apply(lambda g: pd.Series({
-               "taux_dinsertion_moy": _wmean(g["taux_dinsertion"], g["n"]),
-               "salaire_median": _wmedian(g["salaire"], g["n"]),
-               "n": float(pd.to_numeric(g["n"], errors="coerce").fillna(0).sum())
-           }))
-           .reset_index(drop=True)
-           .sort_values("taux_dinsertion_moy", ascending=False)
-    )
-
+    by_region = region_rollup(tmp)
     by_region.to_json(out_path, orient="records", force_ascii=False)
+    write_manifest(out_path.parent)
     print(f"[OK] by_region: {out_path}")
\ No newline at end of file
@@ -0,0 +1,63 @@
+from pathlib import Path
+from datetime import datetime, timezone
+import hashlib
+import json
+
+MANIFEST_NAME = "manifest.json"
+# sorties pré-calculées des endpoints (etl/endpoints.py), incluses dans la version
+API_DIR = "api"
+
+# Sorties ETL prises en compte dans la version des données
+DATA_SUFFIXES = {".json", ".parquet", ".geojson", ".arrow"}
+
+
+def _sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_manifest(out_dir: Path, etl: dict | None = None) -> dict:
+    """
+    Écrit data/processed/manifest.json : hash de chaque sortie + version globale + horodatage.
+    A appeler APRES l'écriture de toutes les sorties (le serveur recharge quand il change).
+    `etl` : mesures des étapes (instrument.stage_report()), hors calcul de la version.
+    """
+    from etl.dataset import CLEAN_DIR, CURRENT_FILE, current_generation  # pyarrow : côté ETL seulement
+
+    out_dir = Path(out_dir)
+    paths = [
+        p for p in sorted(out_dir.iterdir())
+        if p.is_file() and p.suffix in DATA_SUFFIXES and p.name != MANIFEST_NAME
+    ]
+    # dataset partitionné : pointeur + fichiers de la génération courante seulement
+    gen_dir = current_generation(out_dir)
+    if gen_dir is not None:
+        paths.append(out_dir / CLEAN_DIR / CURRENT_FILE)
+        paths += sorted(p for p in gen_dir.rglob("*") if p.is_file())
+    paths += sorted((out_dir / API_DIR).glob("*.json"))
+    files = {p.relative_to(out_dir).as_posix(): _sha256(p) for p in paths}
+    version = hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()[:16]
+    manifest = {
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "files": files,
+    }
+    if etl is not None:
+        manifest["etl"] = etl
+    tmp = out_dir / (MANIFEST_NAME + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    tmp.replace(out_dir / MANIFEST_NAME)  # remplacement atomique
+    return manifest
+
+
+def read_manifest(out_dir: Path) -> dict | None:
+    path = Path(out_dir) / MANIFEST_NAME
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
@@ -0,0 +1,34 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import os
+
+# ---------- exécution parallèle de l'ETL ----------
+# Threads par défaut : les kernels Arrow, numpy (bincount, tri) et l'écriture parquet relâchent
+# le GIL, et les workers lisent les colonnes en mémoire partagée (aucun DataFrame sérialisé).
+# Processus seulement pour le Python pur (géométries), sur des entrées légères.
+# Résultats rendus dans l'ordre des tâches : sorties identiques à l'exécution en série.
+
+WORKERS_ENV = "ETL_WORKERS"
+
+
+def resolve_workers(workers: int | None = None) -> int:
+    """None -> variable ETL_WORKERS (défaut 1 = série) ; 0 ou négatif -> nombre de cœurs."""
+    if workers is None:
+        workers = int(os.environ.get(WORKERS_ENV, "1"))
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def pmap(fn, items, workers: int = 1, processes: bool = False) -> list:
+    """map ordonné : en série si workers <= 1 ou une seule tâche, sinon sur un pool."""
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        return [fn(x) for x in items]
+    pool_cls = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with pool_cls(max_workers=min(workers, len(items))) as pool:
+        return list(pool.map(fn, items))
+
+
+def run_tasks(tasks: list, workers: int = 1) -> list:
+    """Exécute des callables indépendants (threads) ; résultats dans l'ordre de `tasks`."""
+    return pmap(lambda task: task(), tasks, workers)
@@ -0,0 +1,274 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+import hashlib
+import inspect
+import json
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from etl.instrument import stage as timed_stage
+from etl.parallel import run_tasks
+
+# ---------- graphe d'étapes ETL avec cache adressé par contenu ----------
+# Clé d'une étape = hash(nom, code, paramètres, contenu des fichiers d'entrée, clés des dépendances).
+# Une étape dont la clé n'a pas changé (et dont les sorties sont intactes) n'est pas réexécutée :
+# modifier une seule définition de rollup ne recalcule que ce rollup.
+#   cache/<étape>/<clé>.parquet : valeur d'une étape "frame" (DataFrame intermédiaire)
+#   cache/<étape>/<clé>.json    : sorties d'une étape "files" (chemin -> taille, mtime, sha256)
+
+# A incrémenter pour invalider tout le cache (changement de format des entrées du cache)
+PIPELINE_VERSION = 1
+# Entrées conservées par étape (les plus récemment utilisées)
+KEEP_ENTRIES = 4
+DIGESTS_FILE = "digests.json"
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    Étape du graphe. `fn` reçoit les valeurs des dépendances "frame" (dans l'ordre de `deps` ;
+    une dépendance "files" ordonne l'exécution et entre dans la clé, sans valeur transmise) :
+    - kind="frame" : renvoie un DataFrame, mis en cache en parquet si `persist` ;
+    - kind="files" : écrit ses sorties et renvoie leurs chemins (fichiers ou dossiers).
+    `code` : modules / fonctions dont le source entre dans la clé (en plus de `fn`) ;
+    `params` : définition sérialisable en JSON ; `inputs` : fichiers externes hachés.
+    """
+    name: str
+    fn: Callable
+    deps: tuple = ()
+    code: tuple = ()
+    params: object = None
+    inputs: tuple = ()
+    kind: str = "files"
+    persist: bool = True
+
+
+def _jsonable(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if isinstance(value, Path):
+        return value.as_posix()
+    return repr(value)
+
+
+def _source(obj) -> str:
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return getattr(obj, "__qualname__", type(obj).__qualname__)
+
+
+def _sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _stat(path: Path) -> tuple[int, int]:
+    st = path.stat()
+    return st.st_size, st.st_mtime_ns
+
+
+def _atomic_write_json(path: Path, obj) -> None:
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=1, sort_keys=True)
+    tmp.replace(path)
+
+
+def _expand(paths, out_dir: Path) -> list[Path]:
+    """Chemins renvoyés par une étape "files" -> fichiers (dossiers parcourus récursivement)."""
+    files = []
+    for p in paths:
+        p = Path(p) if Path(p).is_absolute() else out_dir / p
+        files += sorted(q for q in p.rglob("*") if q.is_file()) if p.is_dir() else [p]
+    return files
+
+
+class Pipeline:
+    """
+    Exécute un graphe d'étapes dans `out_dir` avec un cache dans `cache_dir`.
+    Les étapes "files" sont les cibles ; les étapes "frame" ne sont évaluées (ou relues
+    du cache) que si une étape qui en dépend doit être recalculée. Les étapes prêtes
+    au même niveau du graphe s'exécutent en parallèle si workers > 1.
+    """
+
+    def __init__(self, stages: list[Stage], out_dir: Path, cache_dir: Path, workers: int = 1,
+                 force: bool = False):
+        self.stages = {s.name: s for s in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Noms d'étapes en double")
+        self.out_dir = Path(out_dir)
+        self.cache_dir = Path(cache_dir)
+        self.workers = workers
+        self.force = force
+        self.order = self._toposort()
+        self._digests = self._load_digests()
+        self.keys = {}
+        for name in self.order:
+            self.keys[name] = self._key(self.stages[name])
+        self._values = {}
+
+    # --- graphe ---
+    def _toposort(self) -> list[str]:
+        order, state = [], {}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Cycle dans le graphe d'étapes : {' -> '.join(path + [name])}")
+            if name not in self.stages:
+                raise ValueError(f"Dépendance inconnue : {name} (requise par {path[-1]})")
+            state[name] = "visiting"
+            for dep in self.stages[name].deps:
+                visit(dep, path + [name])
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    def _levels(self, names: list[str]) -> list[list[str]]:
+        depth = {}
+        for name in self.order:
+            depth[name] = 1 + max((depth[d] for d in self.stages[name].deps), default=-1)
+        levels = {}
+        for name in names:
+            levels.setdefault(depth[name], []).append(name)
+        return [levels[d] for d in sorted(levels)]
+
+    # --- clés ---
+    def _load_digests(self) -> dict:
+        # hash des fichiers d'entrée mémorisés par (taille, mtime) : pas de relecture si inchangés
+        try:
+            with open(self.cache_dir / DIGESTS_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _digest(self, path: Path) -> str:
+        path = Path(path).resolve()
+        size, mtime = _stat(path)
+        known = self._digests.get(path.as_posix())
+        if known is not None and known[:2] == [size, mtime]:
+            return known[2]
+        digest = _sha256(path)
+        self._digests[path.as_posix()] = [size, mtime, digest]
+        return digest
+
+    def _key(self, s: Stage) -> str:
+        spec = {
+            "pipeline": PIPELINE_VERSION,
+            "libs": [pd.__version__, np.__version__, pa.__version__],
+            "name": s.name,
+            "kind": s.kind,
+            "code": hashlib.sha256("\n".join(_source(c) for c in (s.fn, *s.code)).encode()).hexdigest(),
+            "params": s.params,
+            "inputs": [self._digest(p) for p in s.inputs],
+            "deps": [self.keys[d] for d in s.deps],
+        }
+        payload = json.dumps(spec, sort_keys=True, default=_jsonable, ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+    def _entry(self, name: str, suffix: str) -> Path:
+        return self.cache_dir / name / f"{self.keys[name]}{suffix}"
+
+    # --- cache ---
+    def _outputs_intact(self, name: str) -> bool:
+        """Sorties enregistrées pour la clé courante toujours présentes et identiques (sha256)."""
+        entry = self._entry(name, ".json")
+        try:
+            with open(entry, "r", encoding="utf-8") as f:
+                outputs = json.load(f)["outputs"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return False
+        changed = False
+        for rel, (size, mtime, digest) in outputs.items():
+            path = self.out_dir / rel
+            if not path.is_file():
+                return False
+            stat = list(_stat(path))
+            if stat != [size, mtime]:
+                if _sha256(path) != digest:
+                    return False
+                outputs[rel] = stat + [digest]
+                changed = True
+        if changed:
+            _atomic_write_json(entry, {"outputs": outputs})
+        os.utime(entry)
+        return True
+
+    def _record_outputs(self, name: str, paths) -> None:
+        outputs = {}
+        for path in _expand(paths, self.out_dir):
+            outputs[path.relative_to(self.out_dir).as_posix()] = list(_stat(path)) + [_sha256(path)]
+        entry = self._entry(name, ".json")
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        _atomic_write_json(entry, {"outputs": outputs})
+        self._prune(name)
+
+    def _prune(self, name: str) -> None:
+        entries = sorted((self.cache_dir / name).iterdir(), key=lambda p: p.stat().st_mtime_ns)
+        for old in entries[:-KEEP_ENTRIES]:
+            old.unlink(missing_ok=True)
+
+    # --- évaluation ---
+    def _value(self, name: str):
+        """Valeur d'une étape "frame" : mémoire, sinon cache parquet, sinon calcul."""
+        if name in self._values:
+            return self._values[name]
+        s = self.stages[name]
+        entry = self._entry(name, ".parquet")
+        with timed_stage(name) as info:
+            if s.persist and not self.force and entry.exists():
+                value = pq.read_table(entry).to_pandas()
+                os.utime(entry)
+                info["cached"] = True
+            else:
+                value = s.fn(*self._args(s))
+                if s.persist:
+                    entry.parent.mkdir(parents=True, exist_ok=True)
+                    tmp = entry.with_suffix(".tmp")
+                    pq.write_table(pa.Table.from_pandas(value, preserve_index=False), tmp)
+                    tmp.replace(entry)
+                    self._prune(name)
+            info["rows"] = len(value)
+        self._values[name] = value
+        return value
+
+    def _args(self, s: Stage) -> list:
+        return [self._value(d) for d in s.deps if self.stages[d].kind == "frame"]
+
+    def _run_files(self, name: str) -> None:
+        s = self.stages[name]
+        with timed_stage(name):
+            paths = s.fn(*self._args(s))
+        self._record_outputs(name, paths)
+
+    def run(self) -> dict:
+        """Exécute les étapes "files" dont la clé ou les sorties ont changé ; renvoie leur statut."""
+        targets = [n for n in self.order if self.stages[n].kind == "files"]
+        status = {}
+        for name in targets:
+            if not self.force and self._outputs_intact(name):
+                status[name] = "cache"
+        for level in self._levels([n for n in targets if n not in status]):
+            # valeurs "frame" résolues avant le parallélisme (chaque DataFrame calculé une fois)
+            for name in level:
+                self._args(self.stages[name])
+            run_tasks([lambda n=n: self._run_files(n) for n in level], self.workers)
+            status.update({n: "run" for n in level})
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        _atomic_write_json(self.cache_dir / DIGESTS_FILE, self._digests)
+        for name in targets:
+            print(f"[etl] {name}: {'à jour (cache)' if status[name] == 'cache' else 'recalculé'}"
+                  f" [{self.keys[name]}]")
+        return {n: status[n] for n in targets}
@@ -0,0 +1,243 @@
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+import base64
+import hashlib
+import json
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# ---------- classements : index triés pré-calculés + pagination par curseur ----------
+# Pour chaque métrique de RANK_METRICS et chaque dimension de RANK_INDEX_DIMS, l'ETL écrit la
+# permutation des lignes de la table propre triée par (membre, valeur décroissante, ligne) :
+# un segment trié par membre (ex. académie = Lyon), plus un index "all" sur toute la table.
+# Une requête prend le segment du filtre le plus sélectif, reprend après le curseur par
+# recherche dichotomique et parcourt le segment par blocs en appliquant les autres filtres
+# et le seuil de n : top-K et page suivante en O(log n + K / sélectivité), sans tri.
+#   clean/<génération>/_rank_keys.arrow         : codes des dimensions, n et métriques par ligne
+#   clean/<génération>/_rank.<métrique>.arrow   : une colonne int32 de lignes par dimension
+# Les numéros de ligne sont ceux de _clean.arrow : les index vivent dans la même génération.
+
+RANK_METRICS = [
+    "taux_dinsertion",
+    "taux_d_emploi",
+    "emplois_stables",
+    "salaire_net_median_des_emplois_a_temps_plein",
+    "nombre_de_reponses",
+]
+RANK_INDEX_DIMS = ["annee", "academie", "domaine", "discipline"]
+# dimensions filtrables (codes par ligne) ; situation : filtrée sans index (2 valeurs)
+RANK_FILTER_DIMS = RANK_INDEX_DIMS + ["situation"]
+RANK_WEIGHT = "nombre_de_reponses"
+KEYS_FILE = "_rank_keys.arrow"
+# lignes examinées par bloc lors du parcours d'un segment (au moins 2 x limit)
+BLOCK_ROWS = 256
+
+
+def _index_file(metric: str) -> str:
+    return f"_rank.{metric}.arrow"
+
+
+def _codes(column) -> tuple[list, np.ndarray]:
+    """Membres triés d'une colonne et code de chaque ligne (-1 si valeur manquante)."""
+    column = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    unique = pc.unique(column).drop_null()
+    members = pc.take(unique, pc.array_sort_indices(unique))
+    codes = pc.index_in(column, value_set=members).fill_null(-1).to_numpy(zero_copy_only=False)
+    return members.to_pylist(), codes.astype(np.int32)
+
+
+def _float(column) -> np.ndarray:
+    column = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    return pc.fill_null(column.cast(pa.float64()), np.nan).to_numpy(zero_copy_only=False)
+
+
+def _sorted_rows(values: np.ndarray, codes: np.ndarray | None, n_members: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Lignes triées par (code, valeur décroissante, ligne) hors NaN, et début de chaque segment.
+    Membre manquant (code -1) : lignes gardées en tête, hors de tout segment (même longueur
+    pour toutes les dimensions d'une métrique).
+    """
+    rows = np.flatnonzero(~np.isnan(values))
+    if codes is None:
+        rows = rows[np.argsort(-values[rows], kind="stable")]
+        return rows.astype(np.int32), np.array([0, len(rows)], dtype=np.int64)
+    rows = rows[np.lexsort((-values[rows], codes[rows]))]
+    offsets = np.searchsorted(codes[rows], np.arange(n_members + 1), side="left")
+    return rows.astype(np.int32), offsets.astype(np.int64)
+
+
+def filters_key(filters: dict, min_n: float | None) -> str:
+    """Empreinte des filtres normalisés (codes triés par dimension) et de min_n, liée au curseur."""
+    norm = [[dim, np.unique(filters[dim]).tolist()] for dim in sorted(filters)]
+    raw = json.dumps([norm, min_n], separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+def encode_cursor(generation: str, metric: str, descending: bool, filters: str, value: float, row: int,
+                  offset: int) -> str:
+    raw = json.dumps([generation, metric, descending, filters, value, row, offset], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        generation, metric, descending, filters, value, row, offset = json.loads(raw)
+        return [generation, metric, bool(descending), str(filters), float(value), int(row), int(offset)]
+    except (ValueError, TypeError):
+        raise ValueError(f"curseur invalide: {token!r}")
+
+
+class RankIndex:
+    """
+    Index de classement d'une génération de la table propre.
+    keys : dimension / métrique -> tableau par ligne ; members : dimension -> membres triés ;
+    orders : métrique -> dimension ("all" inclus) -> (lignes triées, début des segments).
+    """
+
+    def __init__(self, keys: dict, members: dict, orders: dict, generation: str = ""):
+        self.keys = keys
+        self.members = members
+        self.orders = orders
+        self.generation = generation
+        self._lookup = {d: {v: i for i, v in enumerate(m)} for d, m in members.items()}
+
+    @classmethod
+    def build(cls, table: pa.Table, generation: str = "") -> "RankIndex":
+        """Index calculé sur une table Arrow (ordre des lignes = ordre de `table`)."""
+        keys, members = {}, {}
+        for dim in RANK_FILTER_DIMS:
+            if dim in table.column_names:
+                members[dim], keys[dim] = _codes(table[dim])
+        for col in dict.fromkeys(RANK_METRICS + [RANK_WEIGHT]):
+            if col in table.column_names:
+                keys[col] = _float(table[col])
+        orders = {}
+        for metric in RANK_METRICS:
+            if metric not in keys:
+                continue
+            orders[metric] = {"all": _sorted_rows(keys[metric], None, 1)}
+            for dim in RANK_INDEX_DIMS:
+                if dim in members:
+                    orders[metric][dim] = _sorted_rows(keys[metric], keys[dim], len(members[dim]))
+        return cls(keys, members, orders, generation)
+
+    def write(self, gen_dir: Path) -> list[Path]:
+        """Fichiers Arrow IPC non compressés (mappés par le serveur) dans le dossier de la génération."""
+        from etl.dataset import write_ipc
+        gen_dir = Path(gen_dir)
+        meta = {b"members": json.dumps(self.members, ensure_ascii=False).encode()}
+        keys = pa.table({k: pa.array(v) for k, v in self.keys.items()}).replace_schema_metadata(meta)
+        paths = [write_ipc(keys, gen_dir / KEYS_FILE)]
+        for metric, dims in self.orders.items():
+            offsets = {dim: off.tolist() for dim, (_, off) in dims.items()}
+            table = pa.table({dim: pa.array(rows) for dim, (rows, _) in dims.items()})
+            table = table.replace_schema_metadata({b"offsets": json.dumps(offsets).encode()})
+            paths.append(write_ipc(table, gen_dir / _index_file(metric)))
+        return paths
+
+    @classmethod
+    def open(cls, gen_dir: Path) -> "RankIndex | None":
+        """Index mappé d'une génération (None si l'ETL ne l'a pas écrit)."""
+        from etl.dataset import map_ipc
+        gen_dir = Path(gen_dir)
+        if not (gen_dir / KEYS_FILE).exists():
+            return None
+        table = map_ipc(gen_dir / KEYS_FILE)
+        members = json.loads(table.schema.metadata[b"members"])
+        keys = {name: table[name].chunk(0).to_numpy() for name in table.column_names}
+        orders = {}
+        for metric in RANK_METRICS:
+            path = gen_dir / _index_file(metric)
+            if not path.exists():
+                continue
+            t = map_ipc(path)
+            offsets = json.loads(t.schema.metadata[b"offsets"])
+            orders[metric] = {dim: (t[dim].chunk(0).to_numpy(), np.asarray(offsets[dim], dtype=np.int64))
+                              for dim in t.column_names}
+        return cls(keys, members, orders, gen_dir.name)
+
+    # --- requêtes ---
+    def allowed(self, dim: str, values) -> np.ndarray:
+        """Codes des membres demandés (valeurs inconnues ignorées)."""
+        lookup = self._lookup[dim]
+        if dim == "annee":
+            values = [int(v) for v in values]
+        return np.array(sorted(lookup[v] for v in values if v in lookup), dtype=np.int32)
+
+    def year_codes(self, lo=None, hi=None) -> np.ndarray:
+        years = self.members.get("annee", [])
+        return np.array([i for i, y in enumerate(years)
+                         if (lo is None or y >= lo) and (hi is None or y <= hi)], dtype=np.int32)
+
+    def _walk(self, rows, start, end, descending, need, checks):
+        """Jusqu'à `need` lignes du segment [start, end) qui passent les filtres, dans l'ordre demandé."""
+        found, block = [], max(BLOCK_ROWS, 2 * need)
+        total = 0
+        while total < need and start < end:
+            if descending:
+                chunk = rows[start:min(start + block, end)]
+                start += len(chunk)
+            else:
+                chunk = rows[max(end - block, start):end][::-1]
+                end -= len(chunk)
+            mask = np.ones(len(chunk), dtype=bool)
+            for arr, test in checks:
+                mask &= test(arr[chunk])
+            hit = chunk[mask][:need - total]
+            found.append(hit)
+            total += len(hit)
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int32)
+
+    def query(self, metric: str, filters: dict, min_n: float | None = None, limit: int = 50,
+              descending: bool = True, after: tuple | None = None) -> tuple[np.ndarray, bool]:
+        """
+        Lignes classées par `metric` (égalités : numéro de ligne) qui passent `filters`
+        (dimension -> codes autorisés) et n >= min_n ; `after` = (valeur, ligne) du dernier
+        élément de la page précédente. Retourne (lignes, page suivante existante).
+        """
+        values = self.keys[metric]
+        dims = self.orders[metric]
+        if any(len(codes) == 0 for codes in filters.values()):
+            return np.empty(0, dtype=np.int32), False
+
+        # segment(s) du filtre le plus sélectif parmi les dimensions indexées
+        best, segments = "all", [(0, len(dims["all"][0]))]
+        for dim, codes in filters.items():
+            if dim in dims:
+                off = dims[dim][1]
+                segs = [(int(off[c]), int(off[c + 1])) for c in codes]
+                if sum(e - s for s, e in segs) < sum(e - s for s, e in segments):
+                    best, segments = dim, segs
+        rows = dims[best][0]
+
+        checks = [(self.keys[dim], lambda a, c=codes: np.isin(a, c))
+                  for dim, codes in filters.items() if dim != best]
+        if min_n:
+            checks.append((self.keys[RANK_WEIGHT], lambda a: a >= min_n))
+
+        def sort_key(i):
+            r = int(rows[i])
+            return (-float(values[r]), r)
+
+        need = limit + 1
+        found = []
+        for start, end in segments:
+            if after is not None:
+                # reprise après (valeur, ligne) : clé (-valeur, ligne) croissante dans le segment
+                pos = (bisect_right if descending else bisect_left)(
+                    range(start, end), (-after[0], after[1]), key=sort_key) + start
+                start, end = (pos, end) if descending else (start, pos)
+            found.append(self._walk(rows, start, end, descending, need, checks))
+
+        hits = np.concatenate(found) if found else np.empty(0, dtype=np.int32)
+        if len(segments) > 1:
+            order = np.lexsort((hits, -values[hits]))
+            hits = hits[order if descending else order[::-1]]
+        return hits[:limit], len(hits) > limit
+
+
+def write_rank_index(table: pa.Table, gen_dir: Path) -> list[Path]:
+    """Index de classement de la génération (appelé avec la table écrite dans _clean.arrow)."""
+    return RankIndex.build(table, Path(gen_dir).name).write(gen_dir)
@@ -0,0 +1,192 @@
+import gzip
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from functools import wraps
+
+from flask import Response, jsonify, request
+
+from etl.instrument import REGISTRY, phase
+
+try:  # compression brotli optionnelle (pip install brotli)
+    import brotli
+except ImportError:
+    brotli = None
+
+CACHE_CONTROL = "public, max-age=60"
+# ?format= des réponses tabulaires (liste de lignes) :
+#   json     : lignes [{"annee": 2015, ...}, ...] (défaut) ;
+#   columnar : {"length": n, "columns": {"annee": [...], ...}} (tableaux prêts à tracer) ;
+#   arrow    : flux Arrow IPC typé (une table, autres champs de la réponse en métadonnées JSON).
+FORMATS = ("json", "columnar", "arrow")
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+# stores de cached_json, pour les purger lors d'un changement de version
+_stores = []
+
+
+@dataclass(frozen=True)
+class PreparedResponse:
+    """Corps JSON sérialisé une fois + variantes compressées + ETag fort."""
+    body: bytes
+    gzip: bytes
+    br: bytes | None
+    etag: str
+    mimetype: str = "application/json"
+
+
+def response_format() -> str:
+    """Valeur de ?format= (ValueError si inconnue)."""
+    fmt = request.args.get("format") or "json"
+    if fmt not in FORMATS:
+        raise ValueError(f"format inconnu: {fmt!r} ({', '.join(FORMATS)})")
+    return fmt
+
+
+def to_columns(rows: list[dict]) -> dict:
+    """Lignes -> une liste de valeurs par colonne (ordre d'apparition des clés, absentes = null)."""
+    names = dict.fromkeys(k for row in rows for k in row)
+    return {"length": len(rows), "columns": {k: [row.get(k) for row in rows] for k in names}}
+
+
+def to_arrow(rows: list[dict], metadata: dict | None = None) -> bytes:
+    """Lignes -> flux Arrow IPC (types déduits par colonne) ; voir table_to_arrow."""
+    import pyarrow as pa
+
+    names = dict.fromkeys(k for row in rows for k in row)
+    return table_to_arrow(pa.table({k: pa.array([row.get(k) for row in rows]) for k in names}), metadata)
+
+
+def table_to_arrow(table, metadata: dict | None = None) -> bytes:
+    """
+    Table Arrow -> flux Arrow IPC, types de la table conservés (texte répété en dictionnaire) ;
+    `metadata` en JSON dans le schéma (remplace celles de la table).
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    def column(arr):
+        arr = arr.combine_chunks() if isinstance(arr, pa.ChunkedArray) else arr
+        if ((pa.types.is_string(arr.type) or pa.types.is_large_string(arr.type))
+                and 2 * pc.count_distinct(arr).as_py() <= len(arr)):
+            arr = arr.dictionary_encode()
+        return arr
+
+    table = pa.table([column(c) for c in table.columns], names=table.column_names)
+    table = table.replace_schema_metadata(
+        {k: json.dumps(v, ensure_ascii=False) for k, v in (metadata or {}).items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _encode(payload, fmt: str, rows_key: str | None) -> tuple[bytes, str]:
+    """Corps et type MIME ; `rows_key` : champ de `payload` (dict) qui porte les lignes."""
+    if fmt != "json":
+        rows = payload.get(rows_key) if rows_key is not None and isinstance(payload, dict) else payload
+        if not (isinstance(rows, list) and all(isinstance(row, dict) for row in rows)):
+            raise ValueError(f"format={fmt} : réponse non tabulaire (format=json seulement)")
+        others = {k: v for k, v in payload.items() if k != rows_key} if rows_key is not None else None
+        if fmt == "arrow":
+            return to_arrow(rows, others), ARROW_MIMETYPE
+        payload = {**others, rows_key: to_columns(rows)} if rows_key is not None else to_columns(rows)
+    body = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return body, "application/json"
+
+
+def prepare(payload, fmt: str = "json", rows_key: str | None = None) -> PreparedResponse:
+    """Sérialisation au format `fmt` (ValueError si la réponse n'est pas tabulaire)."""
+    with phase("serialize"):
+        body, mimetype = _encode(payload, fmt, rows_key)
+        return PreparedResponse(
+            body=body,
+            gzip=gzip.compress(body, compresslevel=6, mtime=0),
+            br=brotli.compress(body, quality=9) if brotli is not None else None,
+            etag=hashlib.sha256(body).hexdigest()[:32],
+            mimetype=mimetype,
+        )
+
+
+def send_payload(payload, fmt: str = "json", rows_key: str | None = None) -> Response:
+    """Réponse d'une vue non mise en cache (lignes, classement) : sérialisée à chaque requête, sans compression."""
+    if fmt == "json":
+        return jsonify(payload)
+    with phase("serialize"):
+        body, mimetype = _encode(payload, fmt, rows_key)
+    return Response(body, mimetype=mimetype)
+
+
+def send_prepared(prepared: PreparedResponse) -> Response:
+    """Réponse conditionnelle (304 si If-None-Match) et négociation br > gzip > identité."""
+    accept = request.accept_encodings
+    if prepared.br is not None and accept["br"]:
+        data, encoding, etag = prepared.br, "br", f"{prepared.etag}-br"
+    elif accept["gzip"]:
+        data, encoding, etag = prepared.gzip, "gzip", f"{prepared.etag}-gz"
+    else:
+        data, encoding, etag = prepared.body, None, prepared.etag
+
+    # comparaison faible (RFC 9110) : W/"<etag>" renvoyé par un proxy après recompression vaut 304
+    if request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(data, mimetype=prepared.mimetype)
+        if encoding is not None:
+            resp.headers["Content-Encoding"] = encoding
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = CACHE_CONTROL
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+
+def cached_json(version_fn, query_args: tuple = ()):
+    """
+    Décorateur de vue : la vue retourne un objet Python, sérialisé/compressé une seule fois
+    par version de données (`version_fn()`), par valeur des `query_args` et par ?format=, puis
+    servi depuis un dict. Une vue qui retourne déjà une réponse Flask (erreur...) n'est pas mise en cache.
+    """
+    def decorator(view):
+        store = {}
+        lock = threading.Lock()
+        _stores.append((store, lock))
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                fmt = response_format()
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            version = version_fn()
+            query = tuple(request.args.get(name) for name in query_args)
+            key = (version, args, tuple(sorted(kwargs.items())), query, fmt)
+            prepared = store.get(key)
+            REGISTRY.inc("cache_hits_total" if prepared is not None else "cache_misses_total", cache="prepared")
+            if prepared is None:
+                result = view(*args, **kwargs)
+                if isinstance(result, (Response, tuple)):
+                    return result
+                try:
+                    prepared = prepare(result, fmt)
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
+                if version_fn() != version:
+                    # bascule de données pendant le calcul : on ne met pas en cache
+                    return send_prepared(prepared)
+                with lock:
+                    # une seule version active : on purge les anciennes
+                    for old in [k for k in store if k[0] != key[0]]:
+                        del store[old]
+                    store[key] = prepared
+            return send_prepared(prepared)
+
+        return wrapper
+    return decorator
+
+
+def clear_prepared() -> None:
+    """Vide toutes les réponses pré-sérialisées (changement de version des données)."""
+    for store, lock in _stores:
+        with lock:
+            store.clear()
@@ -1,25 +1,137 @@
 from pathlib import Path
-from etl.extract import extract
-from etl.transform import transform
-from etl.load import load
-from etl.load import build_by_region
-build_by_region()
+import argparse
+import etl.aggregate
+import etl.bootstrap
+import etl.cube
+import etl.dataset
+import etl.endpoints
+import etl.extract
+import etl.factors
+import etl.geo
+import etl.ranking
+import etl.transform
+from etl.extract import extract, NULL_VALUES
+from etl.transform import transform, NUMERIC_COLS, DROP_COLS, ALIASES
+from etl.load import (ACADEMY_TO_REGION, REGION_METRICS, ROLLUP_INTERVALS, ROLLUPS, check_data, region_rollup,
+                      with_intervals, write_by_region, write_cube, write_cube_files, write_rollup)
+from etl.dataset import write_clean_dataset, PARTITION_COLS, CLEAN_DIR, CURRENT_FILE
+from etl.geo import build_regions_geo, GEO_LEVELS
+from etl.endpoints import write_endpoints
+from etl.factors import write_factors, FACTOR_COLS, FACTOR_SLICES
+from etl.manifest import read_manifest, write_manifest
+from etl.instrument import stage_report
+from etl.parallel import resolve_workers
+from etl.pipeline import Pipeline, Stage
+from etl.stream import stream_etl, CHUNK_BYTES
 
 
-def main():
+def etl_stages(raw_path: Path, out_dir: Path, geojson_path: Path, workers: int = 1) -> list[Stage]:
+    """
+    Graphe de l'ETL : extract -> transform -> clean / rollup.* / cube / by_region / factors,
+    by_region -> regions_geo, cube + rollup.by_academie|by_domaine -> api.
+    Chaque étape déclare le code et la définition qui font sa clé.
+    """
+    def transformed(df):
+        data = transform(df, workers=workers)
+        check_data(data)
+        return data
+
+    def clean(data):
+        gen_dir = write_clean_dataset(data, out_dir, PARTITION_COLS)
+        return [out_dir / CLEAN_DIR / CURRENT_FILE, gen_dir]
+
+    def rollup_stage(name, spec):
+        return Stage(f"rollup.{name}", lambda data: [write_rollup(data, out_dir, name, spec)],
+                     deps=("transform",), code=(etl.aggregate, etl.bootstrap, with_intervals, write_rollup),
+                     params=spec)
+
+    return [
+        # pas de persistance : extract() a déjà son cache typé, clé = hash du CSV
+        Stage("extract", lambda: extract(raw_path, typed=True), kind="frame", persist=False,
+              code=(etl.extract,), inputs=(raw_path,),
+              params={"null_values": NULL_VALUES, "numeric": NUMERIC_COLS, "drop": DROP_COLS, "aliases": ALIASES}),
+        Stage("transform", transformed, deps=("extract",), kind="frame", code=(etl.transform, check_data)),
+        # dataset propre + index de classement de la génération (etl/ranking.py)
+        Stage("clean", clean, deps=("transform",), code=(etl.dataset, etl.ranking), params=PARTITION_COLS),
+        *[rollup_stage(name, spec) for name, spec in ROLLUPS.items()],
+        Stage("cube", lambda data: write_cube(data, out_dir), deps=("transform",),
+              code=(etl.cube, write_cube, write_cube_files), params=ACADEMY_TO_REGION),
+        Stage("by_region", lambda data: [write_by_region(data, out_dir)], deps=("transform",),
+              code=(etl.aggregate, etl.bootstrap, with_intervals, write_by_region, region_rollup),
+              params={"regions": ACADEMY_TO_REGION, "metrics": REGION_METRICS, "intervals": ROLLUP_INTERVALS}),
+        Stage("factors", lambda data: [write_factors(data, out_dir)], deps=("transform",),
+              code=(etl.aggregate, etl.factors), params={"cols": FACTOR_COLS, "slices": FACTOR_SLICES}),
+        # Géométries des régions : niveaux de détail + propriétés by_region pré-jointes
+        Stage("regions_geo", lambda: list(build_regions_geo(geojson_path, out_dir / "by_region.json", out_dir,
+                                                             workers=workers).values()),
+              deps=("by_region",), code=(etl.geo,), inputs=(geojson_path,), params=GEO_LEVELS),
+        # sorties pré-calculées des endpoints statiques (relit le cube, by_academie.json et by_domaine.json écrits)
+        Stage("api", lambda: write_endpoints(out_dir), deps=("cube", "rollup.by_academie", "rollup.by_domaine"),
+              code=(etl.endpoints,)),
+    ]
+
+
+def main(workers: int | None = None, force: bool = False, stream: bool = False,
+         inputs: list | None = None, chunk_bytes: int = CHUNK_BYTES, rank_index: bool = True):
+    # workers : None -> ETL_WORKERS (défaut 1, série) ; 0 -> un worker par cœur
+    # force : ignore le cache des étapes (tout est recalculé)
+    # stream : ETL en flux (etl/stream.py), mémoire bornée, un ou plusieurs fichiers bruts `inputs`
+    # rank_index=False (flux) : pas d'index de classement, seule étape en O(lignes)
+    workers = resolve_workers(workers)
     project_root = Path(__file__).resolve().parents[1]
     raw_path = project_root / "data" / "raw" / "fr-esr-insertion_professionnelle-master.csv"
     out_dir  = project_root / "data" / "processed"
+    cache_dir = project_root / "data" / "cache" / "stages"
+    geojson_path = project_root / "web" / "static" / "geo" / "regions.geojson"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    inputs = [Path(p) for p in inputs] if inputs else [raw_path]
+
+    if stream:
+        # pas de cache d'étapes : tout est relu en flux à chaque exécution
+        stream_etl(inputs, out_dir, geojson_path, chunk_bytes=chunk_bytes, workers=workers, rank_index=rank_index)
+        write_manifest(out_dir, etl=stage_report())
+        print(f"✅ ETL OK (flux, {len(inputs)} fichier(s), blocs de {chunk_bytes >> 20} Mo)")
+    else:
+        pipeline = Pipeline(etl_stages(inputs[0], out_dir, geojson_path, workers), out_dir, cache_dir,
+                            workers=workers, force=force)
+        status = pipeline.run()
 
-    df = extract(raw_path)
-    data = transform(df)
-    load(data, out_dir)
+        # mesures des étapes jointes au manifest (exposées par /metrics côté serveur) ;
+        # étapes servies par le cache : mesures de leur dernière exécution
+        previous = (read_manifest(out_dir) or {}).get("etl") or {}
+        etl = {name: previous[name] for name in pipeline.order if name in previous}
+        etl.update(stage_report())
+        write_manifest(out_dir, etl=etl)
 
-    print("✅ ETL OK")
-    print(" - clean:", out_dir / "clean.parquet")
+        print(f"✅ ETL OK ({sum(s == 'run' for s in status.values())}/{len(status)} étapes recalculées)")
+    print(" - clean:", out_dir / "clean" / "CURRENT")
     print(" - by_year:", out_dir / "by_year.json")
     print(" - by_domaine:", out_dir / "by_domaine.json")
     print(" - by_academie:", out_dir / "by_academie.json")
+    print(" - regions_geo:", out_dir / "regions_<low|medium|high>.topo.json")
+    print(" - api:", out_dir / "api" / "<endpoint>.json")
+    print(" - factors:", out_dir / "api" / "factors.json")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Pipeline ETL")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="workers parallèles (défaut : ETL_WORKERS ou 1 ; 0 = un par cœur)")
+    parser.add_argument("--force", action="store_true",
+                        help="ignore le cache des étapes et recalcule tout")
+    parser.add_argument("--stream", action="store_true",
+                        help="ETL en flux : fichiers lus par blocs, mémoire bornée (etl/stream.py)")
+    parser.add_argument("--inputs", nargs="+", default=None,
+                        help="fichiers CSV bruts (défaut : le master ; plusieurs : --stream requis)")
+    parser.add_argument("--chunk-mb", type=int, default=CHUNK_BYTES >> 20,
+                        help="taille des blocs lus en mode --stream, en Mo")
+    parser.add_argument("--no-rank-index", action="store_true",
+                        help="mode --stream : pas d'index de /api/ranking (mémoire constante, "
+                             "index calculé par le serveur au chargement)")
+    args = parser.parse_args()
+    if args.no_rank_index and not args.stream:
+        parser.error("--no-rank-index : seulement avec --stream")
+    if args.inputs and len(args.inputs) > 1 and not args.stream:
+        parser.error("plusieurs fichiers --inputs : seulement avec --stream")
+    if args.chunk_mb <= 0:
+        parser.error("--chunk-mb doit être positif")
+    main(args.workers, args.force, args.stream, args.inputs, args.chunk_mb << 20, not args.no_rank_index)
@@ -0,0 +1,314 @@
+from pathlib import Path
+import codecs
+import math
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pv
+
+from etl.bootstrap import StreamIntervals
+from etl.cube import build_cube, merge_cube, rollup, SKETCH_STEPS
+from etl.dataset import write_clean_stream, PARTITION_COLS, SORT_COLS
+from etl.endpoints import write_endpoints
+from etl.extract import NULL_VALUES, raw_schema, _header
+from etl.factors import (cell_moments, dump_factors, merge_moments, moment_center, moments_report,
+                         FACTOR_COLS, FACTOR_SLICES)
+from etl.geo import build_regions_geo
+from etl.instrument import stage
+from etl.load import ACADEMY_TO_REGION, REGION_METRICS, ROLLUP_INTERVALS, ROLLUPS, check_data, write_cube_files
+from etl.transform import transform, rate_scale, _parse_num, ALIASES, NUMERIC_COLS, RATE_COLS
+
+# ---------- ETL en flux : fichiers bruts lus par blocs, mémoire bornée ----------
+# Pour des entrées plus grandes que la mémoire, ou plusieurs fichiers à réunir (master, licence
+# pro, millésimes : colonnes réunies par nom, absentes = nulles). Deux lectures en flux :
+#   1) scan : colonnes numériques seulement -> diviseur de chaque taux (en % si max > 1.5) et
+#      seuil de insertion_ok (quantile 0.75 de taux_dinsertion, ValueSketch) ;
+#   2) blocs de CHUNK_BYTES : transform avec ces paramètres globaux, bloc ajouté à la génération
+#      du dataset propre, puis replié dans les états partiels, tous fusionnables par somme :
+#        cube (sommes pondérées + histogrammes des médianes, merge_cube),
+#        moments des facteurs (merge_moments), répliques bootstrap (StreamIntervals).
+# Rollups, by_region, cube et factors.json sont calculés à la fin depuis ces états, dont la taille
+# dépend des cardinalités (années, académies, pas de salaire...), pas du nombre de lignes ;
+# histogrammes bootstrap limités à MAX_BINS pas par groupe (etl/bootstrap.py).
+# Écarts au chemin en mémoire (etl/run.py) :
+#   moyennes, effectifs, corrélations : ordre des sommes flottantes (~1e-12 relatif) ;
+#   médianes et leurs intervalles : valeur arrondie au pas de SKETCH_STEPS (<= pas / 2, exact
+#   sur les données actuelles ; intervalles : <= pas doublé si la plage dépasse MAX_BINS pas) ; seuil de insertion_ok : exact tant que taux_dinsertion a moins
+#   de MAX_DISTINCT valeurs distinctes, sinon <= pas / 2 du sketch ;
+#   dataset propre : lignes triées par bloc, pas globalement ; index de classement calculés
+#   sur _clean.arrow mappé (seule étape en O(lignes) : ~70 octets par ligne ; rank_index=False
+#   pour s'en passer, le serveur les calcule alors au chargement de la version).
+
+# octets de CSV par bloc : la mémoire de travail (bloc, transform, lots de répliques bootstrap)
+# en dépend, pas la taille de l'entrée (~650 Mo mesurés avec 16 Mo, de 30x à 100x le master)
+CHUNK_BYTES = 16 << 20
+MAX_DISTINCT = 1 << 16
+# REGION_METRICS sur les colonnes d'origine (le cube garde leurs noms)
+REGION_CUBE_METRICS = {
+    name: (op, {"salaire": "salaire_net_median_des_emplois_a_temps_plein"}.get(col, col), *param)
+    for name, (op, col, *param) in REGION_METRICS.items()
+}
+
+
+class ValueSketch:
+    """
+    Effectif par valeur distincte, fusionnable (merge). Au-delà de `max_distinct` valeurs, elles
+    sont arrondies à un pas qui double jusqu'à repasser sous la limite : erreur <= step / 2.
+    """
+
+    def __init__(self, max_distinct: int = MAX_DISTINCT):
+        self.max_distinct = max_distinct
+        self.values = np.empty(0)
+        self.counts = np.empty(0)
+        self.step = 0.0
+
+    def _round(self, x: np.ndarray) -> np.ndarray:
+        return np.round(x / self.step) * self.step if self.step else x
+
+    def _add(self, values: np.ndarray, counts: np.ndarray) -> None:
+        values, inverse = np.unique(np.concatenate([self.values, self._round(values)]), return_inverse=True)
+        self.values = values
+        self.counts = np.bincount(inverse, weights=np.concatenate([self.counts, counts]))
+        while len(self.values) > self.max_distinct:
+            self.step = self.step * 2 if self.step else (self.values[-1] - self.values[0]) / self.max_distinct
+            values, inverse = np.unique(self._round(self.values), return_inverse=True)
+            self.values, self.counts = values, np.bincount(inverse, weights=self.counts)
+
+    def add(self, x: np.ndarray) -> None:
+        values, counts = np.unique(x[~np.isnan(x)], return_counts=True)
+        self._add(values, counts.astype(np.float64))
+
+    def merge(self, other: "ValueSketch") -> None:
+        self.step = max(self.step, other.step)
+        self._add(other.values, other.counts)
+
+    def quantile(self, q: float, f=None) -> float:
+        """Quantile à interpolation linéaire de pandas / numpy des valeurs f(x) (f croissante)."""
+        n = int(self.counts.sum())
+        if n == 0:
+            return float("nan")
+        h = (n - 1) * q
+        lo = math.floor(h)
+        cum = np.cumsum(self.counts)
+        a, b = (self.values[np.searchsorted(cum, r, side="right")] for r in (lo, min(lo + 1, n - 1)))
+        if f is not None:
+            a, b = f(a), f(b)
+        t = h - lo
+        return float(a + (b - a) * t if t < 0.5 else b - (b - a) * (1 - t))
+
+
+# ---------- lecture en flux ----------
+def _columns(raw_path: Path) -> list[tuple[str, str]]:
+    """(nom brut, nom normalisé) des colonnes lues (mêmes règles que raw_schema / transform)."""
+    include, _ = raw_schema(_header(raw_path))
+    return [(raw, ALIASES.get(raw.strip(), raw.strip())) for raw in include]
+
+
+def _blocks(raw_path: Path, chunk_bytes: int):
+    """
+    Octets du fichier par blocs d'environ `chunk_bytes` coupés en fin de ligne, chacun précédé
+    de l'en-tête (au moins un bloc : l'en-tête seul pour un fichier sans lignes). Découpe faite
+    ici plutôt que par pv.open_csv, qui lit jusqu'à 32 blocs en avance (plusieurs centaines de
+    Mo) : un seul bloc brut en mémoire à la fois. Comme pour le lecteur Arrow par défaut, pas de
+    retour à la ligne dans les valeurs.
+    """
+    with open(raw_path, "rb") as f:
+        header = f.readline().removeprefix(codecs.BOM_UTF8)
+        block = f.read(chunk_bytes)
+        while True:
+            yield header + block + f.readline()
+            block = f.read(chunk_bytes)
+            if not block:
+                break
+
+
+def _parse(raw_path: Path, block: bytes, types: dict, names=None) -> pa.Table:
+    """Bloc de _blocks -> table ; types : nom normalisé -> type Arrow ; names : noms normalisés à lire."""
+    cols = [(raw, name) for raw, name in _columns(raw_path) if names is None or name in names]
+    return pv.read_csv(
+        pa.BufferReader(block),
+        read_options=pv.ReadOptions(encoding="utf8"),
+        parse_options=pv.ParseOptions(delimiter=";"),
+        convert_options=pv.ConvertOptions(
+            column_types={raw: types[name] for raw, name in cols if name in types},
+            include_columns=[raw for raw, _ in cols],
+            null_values=NULL_VALUES,
+            strings_can_be_null=True,
+            decimal_point=",",
+        ),
+    )
+
+
+def stream_schema(raw_paths: list, numeric_type=pa.float64()) -> pa.Schema:
+    """
+    Schéma commun des fichiers (noms normalisés, ordre d'apparition) : numériques en
+    `numeric_type`, autres colonnes typées sur le premier bloc de chaque fichier (texte si
+    les fichiers ne s'accordent pas ou si la colonne y est vide).
+    """
+    types = {}
+    for raw_path in raw_paths:
+        cols = _columns(raw_path)
+        numeric = {name: numeric_type for _, name in cols if name in NUMERIC_COLS}
+        blocks = _blocks(raw_path, CHUNK_BYTES)
+        inferred = _parse(raw_path, next(blocks), numeric).schema
+        blocks.close()
+        for (_, name), field in zip(cols, inferred):
+            t = numeric.get(name, field.type)
+            if name not in types or pa.types.is_null(types[name]):
+                types[name] = t
+            elif not pa.types.is_null(t) and t != types[name]:
+                types[name] = pa.string()
+    return pa.schema([(name, pa.string() if pa.types.is_null(t) else t) for name, t in types.items()])
+
+
+def read_chunks(raw_paths: list, schema: pa.Schema, chunk_bytes: int = CHUNK_BYTES, names=None):
+    """Blocs des fichiers bout à bout, en tables au `schema` commun (restreint à `names`)."""
+    if names is not None:
+        schema = pa.schema([f for f in schema if f.name in names])
+    types = {f.name: f.type for f in schema}
+    for raw_path in raw_paths:
+        renames = dict(_columns(raw_path))
+        for block in _blocks(raw_path, chunk_bytes):
+            table = _parse(raw_path, block, types, schema.names)
+            table = table.rename_columns([renames[c] for c in table.column_names])
+            yield pa.table({f.name: table[f.name].cast(f.type) if f.name in table.column_names
+                            else pa.nulls(len(table), f.type) for f in schema}, schema=schema)
+
+
+def _floats(column) -> np.ndarray:
+    """Colonne numérique (typée, ou texte si lecture de repli) -> float64."""
+    if pa.types.is_floating(column.type) or pa.types.is_integer(column.type):
+        return column.to_numpy(zero_copy_only=False).astype(np.float64)
+    return _parse_num(column.to_pandas()).astype(np.float64)
+
+
+def scan(raw_paths: list, schema: pa.Schema, chunk_bytes: int = CHUNK_BYTES) -> dict:
+    """
+    Première lecture, colonnes numériques seulement : diviseur de chaque taux (décidé sur le
+    maximum de toutes les lignes, comme transform sur la table entière) et seuil de insertion_ok.
+    """
+    rates = [c for c in RATE_COLS if c in schema.names]
+    maxima = {c: -np.inf for c in rates}
+    sketch, rows = ValueSketch(), 0
+    for table in read_chunks(raw_paths, schema, chunk_bytes, names=rates):
+        rows += len(table)
+        for c in rates:
+            x = _floats(table[c])
+            if not np.isnan(x).all():
+                maxima[c] = max(maxima[c], np.nanmax(x))
+        if "taux_dinsertion" in table.column_names:
+            sketch.add(_floats(table["taux_dinsertion"]))
+    scales = {c: rate_scale(m) if np.isfinite(m) else 1.0 for c, m in maxima.items()}
+    s = scales.get("taux_dinsertion", 1.0)
+    seuil = sketch.quantile(0.75, lambda v: min(max(v / s, 0.0), 1.0))
+    return {"rows": rows, "scales": scales, "seuil": None if math.isnan(seuil) else seuil,
+            "seuil_erreur": sketch.step / 2}
+
+
+# ---------- ETL complète ----------
+def stream_etl(raw_paths, out_dir: Path, geojson_path: Path | None = None, chunk_bytes: int = CHUNK_BYTES,
+               partition_cols=PARTITION_COLS, workers: int = 1, rank_index: bool = True) -> list[Path]:
+    """
+    Mêmes sorties que l'ETL en mémoire (dataset propre, rollups, cube, by_region, regions_geo,
+    factors, api) en lisant `raw_paths` par blocs de `chunk_bytes` ; le manifest reste à l'appelant.
+    rank_index=False : pas d'index de classement (seule étape en O(lignes)), mémoire constante.
+    """
+    raw_paths = [Path(p) for p in ([raw_paths] if isinstance(raw_paths, (str, Path)) else raw_paths)]
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    with stage("stream.scan") as info:
+        try:
+            schema = stream_schema(raw_paths)
+            params = scan(raw_paths, schema, chunk_bytes)
+        except pa.ArrowInvalid as e:
+            # même repli que extract : numériques lus en texte, convertis par transform
+            print(f"⚠️ WARNING: lecture typée impossible ({e}), repli sur colonnes texte")
+            schema = stream_schema(raw_paths, numeric_type=pa.string())
+            params = scan(raw_paths, schema, chunk_bytes)
+        info["rows"] = params["rows"]
+
+    # intervalles bootstrap : un flux de répliques par jeu de paramètres, partagé par ses rollups
+    boots = {}
+    for name, spec in ROLLUPS.items():
+        ci = spec.get("intervals")
+        if ci:
+            key = tuple(sorted((k, v) for k, v in ci.items() if k != "metrics"))
+            boots.setdefault(key, {})[name] = (spec["by"], {m: spec["metrics"][m] for m in ci["metrics"]})
+    boots = {key: StreamIntervals(groupings, steps=SKETCH_STEPS, **dict(key)) for key, groupings in boots.items()}
+    region_params = {k: v for k, v in ROLLUP_INTERVALS.items() if k != "metrics"}
+    region_boot = StreamIntervals(
+        {"by_region": ("region", {m: REGION_CUBE_METRICS[m] for m in ROLLUP_INTERVALS["metrics"]})},
+        steps=SKETCH_STEPS, **region_params)
+    state = {"cube": None, "moments": None, "center": None, "clean_schema": None, "rows": 0}
+    factor_cols, factor_by = [], []
+
+    def chunks():
+        nonlocal factor_cols, factor_by
+        for table in read_chunks(raw_paths, schema, chunk_bytes):
+            data = transform(table.to_pandas(), workers=workers, scales=params["scales"], seuil=params["seuil"],
+                             verbose=False)
+            if not len(data):
+                continue
+            check_data(data)
+            state["rows"] += len(data)
+
+            # états partiels (lignes dans l'ordre de lecture : mêmes répliques bootstrap qu'en mémoire)
+            state["cube"] = merge_cube(state["cube"], build_cube(data, ACADEMY_TO_REGION))
+            for boot in boots.values():
+                boot.update(data)
+            region = data["academie"].map(ACADEMY_TO_REGION)
+            region_boot.update(data.assign(region=region)[region.notna().to_numpy()])
+            if state["center"] is None:
+                factor_cols = [c for c in FACTOR_COLS if c in data.columns]
+                factor_by = [d for d in FACTOR_SLICES if d in data.columns]
+                state["center"] = moment_center(data, factor_cols)
+            state["moments"] = merge_moments(state["moments"],
+                                             cell_moments(data, factor_by, factor_cols, center=state["center"]))
+
+            sort_cols = [c for c in list(partition_cols) + SORT_COLS if c in data.columns]
+            clean = pa.Table.from_pandas(data.sort_values(sort_cols, kind="stable"), preserve_index=False)
+            if state["clean_schema"] is None:
+                # numériques toujours en float64 (un bloc entièrement entier ne change pas le type)
+                state["clean_schema"] = pa.schema([
+                    f.with_type(pa.float64()) if f.name in NUMERIC_COLS else f for f in clean.schema
+                ], metadata=clean.schema.metadata)
+            yield from clean.cast(state["clean_schema"]).to_batches()
+
+    with stage("stream.chunks") as info:
+        batches = chunks()
+        first = next(batches, None)
+        if first is None:
+            raise ValueError(f"Aucune ligne exploitable dans {', '.join(map(str, raw_paths))}")
+
+        def all_batches():
+            yield first
+            yield from batches
+
+        gen_dir = write_clean_stream(all_batches(), state["clean_schema"], out_dir, partition_cols,
+                                     rank_index=rank_index)
+        info["rows"] = state["rows"]
+
+    with stage("stream.outputs"):
+        cells, sketch = state["cube"]
+        paths = [gen_dir]
+        for name, spec in ROLLUPS.items():
+            out = rollup(cells, sketch, spec["by"], spec["metrics"])
+            for boot in boots.values():
+                if name in boot.groupings:
+                    out = out.merge(boot.result(name), on=spec["by"], how="left")
+            out = out.sort_values(spec["sort"], ascending=spec["ascending"])
+            paths.append(out_dir / f"{name}.json")
+            out.to_json(paths[-1], orient="records", force_ascii=False)
+
+        by_region = rollup(cells, sketch, "region", REGION_CUBE_METRICS)
+        by_region = by_region.merge(region_boot.result("by_region"), on="region", how="left")
+        paths.append(out_dir / "by_region.json")
+        by_region.sort_values("taux_dinsertion_moy", ascending=False).to_json(paths[-1], orient="records",
+                                                                             force_ascii=False)
+        paths += write_cube_files(cells, sketch, out_dir)
+        paths.append(dump_factors(moments_report(*state["moments"], factor_cols, factor_by), out_dir))
+        if geojson_path is not None and Path(geojson_path).exists():
+            paths += list(build_regions_geo(geojson_path, out_dir / "by_region.json", out_dir,
+                                            workers=workers).values())
+        paths += write_endpoints(out_dir)
+    return paths
@@ -0,0 +1,226 @@
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# ---------- générateur de données synthétiques (benchmarks) ----------
+# Reproduit le schéma de fr-esr-insertion_professionnelle-master.csv :
+# mêmes colonnes (y compris DROP_COLS), séparateur ";", virgule décimale,
+# taux en pourcentage, sentinelle "ns" avec les proportions observées sur le fichier réel.
+# scale=1 -> volume du fichier réel ; les dimensions d'analyse gardent leur cardinalité,
+# seul le nombre d'établissements grandit avec l'échelle.
+
+BASE_ROWS = 10_856
+BASE_ETABLISSEMENTS = 90
+
+RAW_COLUMNS = [
+    "annee", "diplome", "numero_de_l_etablissement", "etablissement", "etablissementactuel",
+    "code_de_l_academie", "academie", "code_du_domaine", "domaine",
+    "code_de_la_discipline", "discipline", "situation",
+    "nombre_de_reponses", "taux_de_reponse", "poids_de_la_discipline",
+    "taux_dinsertion", "taux_d_emploi", "taux_d_emploi_salarie_en_france",
+    "emplois_cadre_ou_professions_intermediaires", "emplois_stables", "emplois_a_temps_plein",
+    "salaire_net_median_des_emplois_a_temps_plein", "salaire_brut_annuel_estime",
+    "de_diplomes_boursiers", "taux_de_chomage_regional", "salaire_net_mensuel_median_regional",
+    "emplois_cadre", "emplois_exterieurs_a_la_region_de_luniversite", "femmes",
+    "salaire_net_mensuel_regional_1er_quartile", "salaire_net_mensuel_regional_3eme_quartile",
+    "cle_etab", "cle_disc", "id_paysage", "remarque",
+]
+
+# année -> poids relatif (2010-2011 moins couvertes)
+YEARS = {2010: 0.5, 2011: 0.6, **{y: 1.0 for y in range(2012, 2021)}}
+
+ACADEMIES = {
+    "A01": "Paris", "A02": "Aix-Marseille", "A03": "Besançon", "A04": "Bordeaux",
+    "A06": "Clermont-Ferrand", "A07": "Dijon", "A08": "Grenoble", "A09": "Lille",
+    "A10": "Lyon", "A11": "Montpellier", "A12": "Nancy-Metz", "A13": "Poitiers",
+    "A14": "Rennes", "A15": "Strasbourg", "A16": "Toulouse", "A17": "Nantes",
+    "A18": "Orléans-Tours", "A19": "Reims", "A20": "Amiens", "A22": "Limoges",
+    "A23": "Nice", "A24": "Créteil", "A25": "Versailles", "A27": "Corse",
+    "A28": "La Réunion", "A32": "Guadeloupe", "A33": "Guyane", "A70": "Normandie",
+}
+
+DOMAINES = {
+    "DEG": "Droit, économie et gestion",
+    "LLA": "Lettres, langues, arts",
+    "SHS": "Sciences humaines et sociales",
+    "STS": "Sciences, technologies et santé",
+    "MEEF": "Masters enseignement",
+}
+
+# code discipline -> (libellé, code domaine)
+DISCIPLINES = {
+    "disc01": ("Ensemble formations juridiques, économiques et de gestion", "DEG"),
+    "disc02": ("Droit", "DEG"),
+    "disc03": ("Économie", "DEG"),
+    "disc04": ("Gestion", "DEG"),
+    "disc05": ("Autres formations juridiques, économiques et de gestion", "DEG"),
+    "disc06": ("Lettres, langues, arts", "LLA"),
+    "disc07": ("Ensemble sciences humaines et sociales", "SHS"),
+    "disc08": ("Histoire-géographie", "SHS"),
+    "disc09": ("Psychologie", "SHS"),
+    "disc10": ("Information communication", "SHS"),
+    "disc11": ("Autres sciences humaines et sociales", "SHS"),
+    "disc12": ("Ensemble sciences, technologies et santé", "STS"),
+    "disc13": ("Sciences de la vie et de la terre", "STS"),
+    "disc14": ("Sciences fondamentales", "STS"),
+    "disc15": ("Sciences de l'ingénieur", "STS"),
+    "disc16": ("Informatique", "STS"),
+    "disc17": ("Autres sciences, technologies et santé", "STS"),
+    "disc18": ("Masters enseignement", "MEEF"),
+    "disc19": ("Masters enseignement : premier degré", "MEEF"),
+    "disc20": ("Masters enseignement : second degré, CPE...", "MEEF"),
+}
+
+SITUATIONS = ["18 mois après le diplôme", "30 mois après le diplôme"]
+
+# colonne -> proportion de "ns" (fichier réel)
+NS_RATES = {
+    "taux_d_emploi": 0.90,
+    "taux_d_emploi_salarie_en_france": 0.90,
+    "emplois_cadre_ou_professions_intermediaires": 0.10,
+    "emplois_stables": 0.08,
+    "emplois_a_temps_plein": 0.09,
+    "salaire_net_median_des_emplois_a_temps_plein": 0.24,
+    "salaire_brut_annuel_estime": 0.22,
+    "de_diplomes_boursiers": 0.01,
+    "taux_de_chomage_regional": 0.01,
+    "salaire_net_mensuel_median_regional": 0.01,
+    "emplois_cadre": 0.14,
+    "emplois_exterieurs_a_la_region_de_luniversite": 0.12,
+    "femmes": 0.05,
+    "salaire_net_mensuel_regional_1er_quartile": 0.11,
+    "salaire_net_mensuel_regional_3eme_quartile": 0.11,
+}
+ACADEMIE_MISSING_RATE = 0.033
+
+# colonne -> (décimales, pas d'arrondi) ; défaut : entier
+NUMBER_FORMATS = {
+    "salaire_net_median_des_emplois_a_temps_plein": (0, 10),
+    "salaire_brut_annuel_estime": (0, 100),
+    "taux_de_chomage_regional": (1, 1),
+    "salaire_net_mensuel_median_regional": (0, 10),
+    "salaire_net_mensuel_regional_1er_quartile": (0, 10),
+    "salaire_net_mensuel_regional_3eme_quartile": (0, 10),
+}
+
+
+def _labels(codes: np.ndarray, labels) -> pd.Categorical:
+    """Colonne texte sans matérialiser n chaînes (code -1 -> champ vide dans le CSV)."""
+    return pd.Categorical.from_codes(codes, categories=list(labels))
+
+
+def _fmt(values: np.ndarray, decimals: int = 0, step: int = 1, ns_mask=None) -> pd.Categorical:
+    """Nombres -> texte du CSV source (virgule décimale, arrondi au pas `step`, "ns" sur ns_mask)."""
+    scaled = np.rint(values * 10 ** decimals / step).astype(np.int64) * step
+    # peu de valeurs distinctes : on ne formate que celles-ci
+    uniq, codes = np.unique(scaled, return_inverse=True)
+    if decimals == 0:
+        text = uniq.astype(str)
+    else:
+        ent, dec = np.divmod(uniq, 10 ** decimals)
+        text = np.char.add(np.char.add(ent.astype(str), ","), np.char.zfill(dec.astype(str), decimals))
+    text = list(text) + ["ns"]
+    if ns_mask is not None:
+        codes = np.where(ns_mask, len(text) - 1, codes)
+    return _labels(codes, text)
+
+
+def _pct(rng, n, center, spread, lo=0.0, hi=100.0) -> np.ndarray:
+    return np.clip(rng.normal(center, spread, n), lo, hi)
+
+
+def generate_raw(scale: float = 1.0, seed: int = 0) -> pd.DataFrame:
+    """DataFrame texte au format du CSV brut (BASE_ROWS * scale lignes)."""
+    rng = np.random.default_rng(seed)
+    n = max(1, int(round(BASE_ROWS * scale)))
+
+    years = np.array(list(YEARS))
+    p_year = np.array(list(YEARS.values()))
+    annee = rng.choice(years, n, p=p_year / p_year.sum())
+
+    # établissements : rattachés à une académie, nombre proportionnel à l'échelle
+    n_etab = max(BASE_ETABLISSEMENTS, int(round(BASE_ETABLISSEMENTS * scale)))
+    acad_codes = np.array(list(ACADEMIES))
+    etab_acad = rng.permutation(np.r_[  # chaque académie a au moins un établissement
+        np.arange(len(acad_codes)), rng.integers(0, len(acad_codes), n_etab - len(acad_codes))
+    ])
+    etab = rng.integers(0, n_etab, n)
+
+    disc_codes = np.array(list(DISCIPLINES))
+    disc = rng.integers(0, len(disc_codes), n)
+    meef = np.array([DISCIPLINES[c][1] == "MEEF" for c in disc_codes])[disc]
+
+    acad = np.where(rng.random(n) < ACADEMIE_MISSING_RATE, -1, etab_acad[etab])
+
+    # effets par établissement / discipline : des écarts réalistes entre groupes
+    etab_effect = rng.normal(0, 4, n_etab)[etab]
+    disc_effect = rng.normal(0, 5, len(disc_codes))[disc]
+    acad_effect = rng.normal(0, 0.15, len(acad_codes))[etab_acad[etab]]
+
+    situation = rng.integers(0, 2, n)
+    late = situation == 1
+    reponses = np.minimum(24 + rng.lognormal(np.log(50), 1.1, n), 13_587)
+    salaire = np.clip(rng.normal(1900, 250, n) + 20 * disc_effect + 60 * late, 1280, 3150)
+    salaire_reg = 1830 * (1 + acad_effect / 3) + 15 * (annee - 2010)
+
+    values = {
+        "nombre_de_reponses": reponses,
+        "taux_de_reponse": _pct(rng, n, 72, 10, 25, 100),
+        "poids_de_la_discipline": np.where(meef, 100, _pct(rng, n, 20, 15, 2, 100)),
+        "taux_dinsertion": _pct(rng, n, 88 + 4 * late + etab_effect, 7, 6, 100),
+        "taux_d_emploi": _pct(rng, n, 88, 6, 54, 100),
+        "taux_d_emploi_salarie_en_france": _pct(rng, n, 80, 8, 35, 100),
+        "emplois_cadre_ou_professions_intermediaires": _pct(rng, n, 85, 12, 3, 100),
+        "emplois_stables": _pct(rng, n, 70, 15, 12, 100),
+        "emplois_a_temps_plein": _pct(rng, n, 94, 6, 37, 100),
+        "salaire_net_median_des_emplois_a_temps_plein": salaire,
+        "salaire_brut_annuel_estime": salaire * 15.6,
+        "de_diplomes_boursiers": _pct(rng, n, 31, 10, 0, 66),
+        "taux_de_chomage_regional": np.clip(rng.normal(8.5, 2, n), 5.7, 20.1),
+        "salaire_net_mensuel_median_regional": salaire_reg,
+        "emplois_cadre": _pct(rng, n, 62, 20, 1, 100),
+        "emplois_exterieurs_a_la_region_de_luniversite": _pct(rng, n, 43, 18, 2, 100),
+        "femmes": _pct(rng, n, 62 + 15 * meef, 15, 2, 100),
+        "salaire_net_mensuel_regional_1er_quartile": salaire_reg * 0.8,
+        "salaire_net_mensuel_regional_3eme_quartile": salaire_reg * 1.2,
+    }
+    numeric = {
+        col: _fmt(v, *NUMBER_FORMATS.get(col, (0, 1)), ns_mask=rng.random(n) < NS_RATES.get(col, 0.0))
+        for col, v in values.items()
+    }
+
+    etab_names = [f"Établissement {i:04d}" for i in range(n_etab)]
+    acad_names = [ACADEMIES[c] for c in acad_codes]
+    dom_codes = list(DOMAINES)
+    disc_dom_idx = np.array([dom_codes.index(DISCIPLINES[c][1]) for c in disc_codes])[disc]
+    df = pd.DataFrame({
+        "annee": annee,
+        "diplome": _labels(meef.astype(np.int8), ["MASTER LMD", "MASTER ENS"]),
+        "numero_de_l_etablissement": _labels(etab, [f"0{1_000_000 + i}" for i in range(n_etab)]),
+        "etablissement": _labels(etab, etab_names),
+        "etablissementactuel": _labels(etab, etab_names),
+        "code_de_l_academie": _labels(acad, acad_codes),
+        "academie": _labels(acad, acad_names),
+        "code_du_domaine": _labels(disc_dom_idx, dom_codes),
+        "domaine": _labels(disc_dom_idx, DOMAINES.values()),
+        "code_de_la_discipline": _labels(disc, disc_codes),
+        "discipline": _labels(disc, [v[0] for v in DISCIPLINES.values()]),
+        "situation": _labels(situation, SITUATIONS),
+        **numeric,
+        "cle_etab": _labels(np.zeros(n, dtype=np.int8), ["x"]),
+        "cle_disc": _labels(np.zeros(n, dtype=np.int8), ["x"]),
+        "id_paysage": _labels(np.full(n, -1, dtype=np.int8), []),
+        "remarque": _labels(np.full(n, -1, dtype=np.int8), []),
+    })
+    return df[RAW_COLUMNS]
+
+
+def write_raw_csv(path: Path, scale: float = 1.0, seed: int = 0) -> Path:
+    """Écrit le CSV synthétique (réutilisé s'il existe déjà pour ce chemin)."""
+    path = Path(path)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        generate_raw(scale, seed).to_csv(tmp, sep=";", index=False, encoding="utf-8")
+        tmp.replace(path)
+    return path
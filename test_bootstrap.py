@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl.bootstrap import BLOCK_ROWS, StreamIntervals, _bounds, _replicate_weights, intervals
+
+N_BOOT = 40
+
+
+@pytest.fixture(scope="module")
+def df():
+    rng = np.random.default_rng(0)
+    n = 3000
+    x = rng.normal(0.9, 0.05, n)
+    x[rng.random(n) < 0.1] = np.nan
+    return pd.DataFrame({
+        "g": rng.choice(["a", "b", "c", "d"], n),
+        "x": x,
+        # salaires sur le pas de 10 : histogrammes exacts dans StreamIntervals
+        "s": rng.integers(150, 260, n) * 10.0,
+        "w": rng.integers(0, 60, n).astype(float),
+    })
+
+
+def naive(df, col, q, weighted):
+    """Boucle réplique par réplique, groupe par groupe (mêmes poids de Poisson)."""
+    poisson = _replicate_weights(0, 0, N_BOOT, 0, len(df)).astype(float)
+    groups = sorted(df["g"].unique())
+    stats = np.full((N_BOOT, len(groups)), np.nan)
+    x = df[col].to_numpy()
+    base = df["w"].to_numpy() if weighted else np.ones(len(df))
+    for r in range(N_BOOT):
+        for j, g in enumerate(groups):
+            m = (df["g"] == g).to_numpy() & ~np.isnan(x) & (base > 0)
+            xs, ws = x[m], poisson[r, m] * base[m]
+            if ws.sum() <= 0:
+                continue
+            if q is None:
+                stats[r, j] = (xs * ws).sum() / ws.sum()
+            else:
+                order = np.argsort(xs, kind="stable")
+                cum = np.cumsum(ws[order])
+                stats[r, j] = xs[order][np.searchsorted(cum, q * cum[-1], side="left")]
+    return _bounds(stats, 0.95)
+
+
+@pytest.mark.parametrize("name, spec, q, weighted", [
+    ("moy", ("wmean", "x"), None, True),
+    ("moy", ("mean", "x"), None, False),
+    ("med", ("wmedian", "s"), 0.5, True),
+    ("q90", ("wquantile", "s", 0.9), 0.9, True),
+])
+def test_intervals_match_naive_loop(df, name, spec, q, weighted):
+    got = intervals(df, "g", {name: spec}, weight="w", n_boot=N_BOOT)
+    lo, hi = naive(df, spec[1], q, weighted)
+    np.testing.assert_allclose(got[f"{name}_ic_bas"], lo, rtol=1e-12)
+    np.testing.assert_allclose(got[f"{name}_ic_haut"], hi, rtol=1e-12)
+
+
+@pytest.mark.parametrize("block", [13, 500, 3000])
+def test_stream_intervals_match_intervals(df, block):
+    metrics = {"moy": ("wmean", "x"), "med": ("wmedian", "s")}
+    exact = intervals(df, "g", metrics, weight="w", n_boot=N_BOOT)
+    acc = StreamIntervals({"g": ("g", metrics)}, weight="w", n_boot=N_BOOT, steps={"s": 10})
+    for start in range(0, len(df), block):
+        acc.update(df.iloc[start:start + block])
+    pd.testing.assert_frame_equal(acc.result("g"), exact, check_exact=False, rtol=1e-12)
+
+
+def test_replicate_weights_independent_of_slicing():
+    full = _replicate_weights(0, 3, 4, 0, 2 * BLOCK_ROWS + 100)
+    for start, stop in [(5, BLOCK_ROWS + 7), (BLOCK_ROWS - 1, BLOCK_ROWS + 1), (2 * BLOCK_ROWS, 2 * BLOCK_ROWS + 100)]:
+        np.testing.assert_array_equal(_replicate_weights(0, 3, 4, start, stop), full[:, start:stop])
+    # réplique r du lot [r0, r0 + b) = réplique r0 + r d'un autre lot
+    np.testing.assert_array_equal(_replicate_weights(0, 5, 2, 0, 50), full[2:4, :50])
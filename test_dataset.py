@@ -0,0 +1,37 @@
+import pytest
+
+from etl.dataset import CLEAN_DIR, _new_generation, current_generation, read_clean_table, write_clean_dataset
+from etl.extract import extract
+from etl.synthetic import write_raw_csv
+from etl.transform import transform
+
+
+@pytest.fixture(scope="module")
+def data(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("dataset")
+    raw_path = write_raw_csv(tmp / "raw" / "m.csv", 0.01, seed=0)
+    return transform(extract(raw_path, typed=True, cache_dir=tmp / "cache"))
+
+
+def test_generation_names_sort_in_creation_order(tmp_path):
+    names = [_new_generation(tmp_path).name for _ in range(50)]
+    assert names == sorted(names)
+
+
+def test_purge_keeps_published_generation(tmp_path, data):
+    # générations publiées dans la même seconde : la dernière reste celle de CURRENT
+    for _ in range(4):
+        gen_dir = write_clean_dataset(data, tmp_path, keep=2)
+        assert current_generation(tmp_path) == gen_dir and gen_dir.is_dir()
+    assert len([p for p in (tmp_path / CLEAN_DIR).iterdir() if p.is_dir()]) == 2
+    # dossier au nom plus grand que la génération publiée (horloge reculée, ancien format) : CURRENT survit
+    (tmp_path / CLEAN_DIR / "99999999T999999-zzzzzz").mkdir()
+    gen_dir = write_clean_dataset(data, tmp_path, keep=1)
+    assert current_generation(tmp_path) == gen_dir and gen_dir.is_dir()
+
+
+def test_strict_columns(tmp_path, data):
+    write_clean_dataset(data, tmp_path)
+    assert read_clean_table(tmp_path, columns=["annee", "foo"]).column_names == ["annee"]
+    with pytest.raises(ValueError, match="foo"):
+        read_clean_table(tmp_path, columns=["annee", "foo"], strict=True)
@@ -0,0 +1,23 @@
+import json
+
+from etl.extract import extract
+from etl.load import load
+from etl.synthetic import write_raw_csv
+from etl.transform import transform
+
+
+def test_by_domaine_carries_rollup_intervals(tmp_path):
+    raw_path = write_raw_csv(tmp_path / "raw" / "m.csv", 0.05, seed=1)
+    out = tmp_path / "processed"
+    load(transform(extract(raw_path, typed=True, cache_dir=tmp_path / "cache")), out)
+    served = json.load(open(out / "api" / "by_domaine.json"))
+    rollup = {r["domaine"]: r for r in json.load(open(out / "by_domaine.json"))}
+    genre = {r["domaine"]: r for r in json.load(open(out / "api" / "genre_by_domaine.json"))}
+    assert served and {r["domaine"] for r in served} == set(rollup)
+    for r in served:
+        for m in ("taux_dinsertion_moy", "salaire_median"):
+            for bound in ("_ic_bas", "_ic_haut"):
+                assert r[m + bound] == rollup[r["domaine"]][m + bound]
+            # valeurs du cube inchangées : mêmes estimateurs que les autres pages par domaine
+            assert r[m] == genre[r["domaine"]][m]
+        assert "salaire_moyen" in r
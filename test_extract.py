@@ -0,0 +1,21 @@
+import etl.extract as extract_mod
+from etl.extract import extract
+from etl.synthetic import write_raw_csv
+
+
+def test_cache_key_follows_schema_and_null_values(tmp_path, monkeypatch):
+    raw_path = write_raw_csv(tmp_path / "raw" / "m.csv", 0.01, seed=0)
+    cache_dir = tmp_path / "cache"
+    extract(raw_path, typed=True, cache_dir=cache_dir)
+    extract(raw_path, typed=True, cache_dir=cache_dir)
+    assert len(list(cache_dir.glob("*.parquet"))) == 1
+
+    # sentinelle ajoutée : nouvelle entrée de cache, sans version à incrémenter à la main
+    monkeypatch.setattr(extract_mod, "NULL_VALUES", extract_mod.NULL_VALUES + ["nd"])
+    extract(raw_path, typed=True, cache_dir=cache_dir)
+    assert len(list(cache_dir.glob("*.parquet"))) == 2
+
+    # colonne numérique retirée : raw_schema change, la clé aussi
+    monkeypatch.setattr(extract_mod, "NUMERIC_COLS", extract_mod.NUMERIC_COLS[1:])
+    extract(raw_path, typed=True, cache_dir=cache_dir)
+    assert len(list(cache_dir.glob("*.parquet"))) == 3
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl.factors import TARGET, cell_moments, factor_report, merge_moments, moment_center, moments_report
+
+
+@pytest.fixture(scope="module")
+def df():
+    rng = np.random.default_rng(1)
+    n = 4000
+    a = rng.normal(0, 1, n)
+    out = pd.DataFrame({
+        "annee": rng.integers(2015, 2019, n),
+        "domaine": rng.choice(["D1", "D2", "D3"], n),
+        TARGET: 0.9 + 0.03 * a + rng.normal(0, 0.02, n),
+        "salaire": 2000 + 150 * a + rng.normal(0, 100, n),
+        "boursiers": rng.uniform(0, 1, n),
+        "nombre_de_reponses": rng.integers(0, 80, n).astype(float),
+    })
+    out.loc[rng.random(n) < 0.15, "salaire"] = np.nan
+    out.loc[rng.random(n) < 0.05, TARGET] = np.nan
+    return out
+
+
+COLS = [TARGET, "salaire", "boursiers"]
+
+
+def naive(part: pd.DataFrame, col: str) -> tuple[float, float, float]:
+    """Corrélation, pente et poids sur les lignes où col et la cible sont renseignées."""
+    m = part[[col, TARGET]].notna().all(axis=1) & (part["nombre_de_reponses"] > 0)
+    x, y, w = part.loc[m, col], part.loc[m, TARGET], part.loc[m, "nombre_de_reponses"]
+    cov = np.cov(x, y, aweights=w, bias=True)
+    return cov[0, 1] / np.sqrt(cov[0, 0] * cov[1, 1]), cov[0, 1] / cov[0, 0], w.sum()
+
+
+def check(report, df):
+    slices = {"all": [(df, report["slices"]["all"][0])]}
+    for dim in ("annee", "domaine"):
+        slices[dim] = [(df[df[dim] == entry[dim]], entry) for entry in report["slices"][dim]]
+    for entries in slices.values():
+        for part, entry in entries:
+            for f in entry["facteurs"]:
+                corr, slope, n = naive(part, f["variable"])
+                assert f["correlation"] == pytest.approx(corr, abs=5e-4)
+                assert f["pente"] == pytest.approx(slope, rel=1e-5)
+                assert f["n"] == pytest.approx(n, rel=1e-11)
+
+
+def test_factor_report_matches_pairwise_regression(df):
+    check(factor_report(df, COLS), df)
+
+
+def test_merged_block_moments_match_report(df):
+    # moments de blocs disjoints (même centre) fusionnés : même rapport que la table entière
+    by, center = ["annee", "domaine"], moment_center(df, COLS)
+    moments = None
+    for start in range(0, len(df), 1500):
+        moments = merge_moments(moments, cell_moments(df.iloc[start:start + 1500], by, COLS, center=center))
+    merged = moments_report(*moments, COLS, by)
+    assert merged == factor_report(df, COLS)
@@ -0,0 +1,76 @@
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from etl.extract import extract
+from etl.ranking import RANK_FILTER_DIMS, RANK_INDEX_DIMS, RANK_WEIGHT, RankIndex, filters_key
+from etl.synthetic import write_raw_csv
+from etl.transform import transform
+
+
+@pytest.fixture(scope="module")
+def table(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("ranking")
+    raw_path = write_raw_csv(tmp / "raw" / "m.csv", 1.0, seed=3)
+    data = transform(extract(raw_path, typed=True, cache_dir=tmp / "cache"))
+    return pa.Table.from_pandas(data, preserve_index=False)
+
+
+def naive(index: RankIndex, metric, filters, min_n, descending):
+    """Classement de référence : filtre puis tri complet (valeur décroissante, ligne)."""
+    values = index.keys[metric]
+    mask = ~np.isnan(values)
+    for dim, codes in filters.items():
+        mask &= np.isin(index.keys[dim], codes)
+    if min_n:
+        mask &= index.keys[RANK_WEIGHT] >= min_n
+    rows = np.flatnonzero(mask)
+    rows = rows[np.lexsort((rows, -values[rows]))]
+    return rows if descending else rows[::-1]
+
+
+def test_random_queries_match_naive_sort(table):
+    index = RankIndex.build(table)
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        metric = rng.choice(list(index.orders))
+        filters = {}
+        for dim in rng.choice(RANK_FILTER_DIMS, size=rng.integers(0, 3), replace=False):
+            members = index.members[dim]
+            picked = rng.choice(len(members), size=rng.integers(1, min(3, len(members)) + 1), replace=False)
+            filters[dim] = index.allowed(dim, [members[i] for i in picked])
+        min_n = [None, 0, 20, 100][rng.integers(4)]
+        descending = bool(rng.integers(2))
+        limit = int(rng.integers(1, 60))
+        expected = naive(index, metric, filters, min_n, descending)
+
+        # pages successives reprises après (valeur, ligne) de la dernière ligne
+        got, after = [], None
+        while True:
+            rows, more = index.query(metric, filters, min_n, limit, descending, after)
+            got.extend(rows.tolist())
+            if not more or len(got) >= 3 * limit:
+                break
+            after = (float(index.keys[metric][rows[-1]]), int(rows[-1]))
+        n = len(got)
+        assert got == expected[:n].tolist(), (metric, filters, min_n, descending, limit)
+        assert more == (len(expected) > n)
+
+
+def test_index_round_trip(table, tmp_path):
+    built = RankIndex.build(table, tmp_path.name)
+    built.write(tmp_path)
+    opened = RankIndex.open(tmp_path)
+    assert opened.members == built.members
+    for metric in built.orders:
+        for dim in ["all"] + RANK_INDEX_DIMS:
+            np.testing.assert_array_equal(opened.orders[metric][dim][0], built.orders[metric][dim][0])
+
+
+def test_filters_key_binds_filters_and_min_n():
+    codes = np.array([2, 1], dtype=np.int32)
+    key = filters_key({"academie": codes}, 30.0)
+    assert key == filters_key({"academie": np.array([1, 2, 2])}, 30.0)
+    assert key != filters_key({"academie": codes}, 31.0)
+    assert key != filters_key({"domaine": codes}, 30.0)
+    assert key != filters_key({}, 30.0)
@@ -0,0 +1,33 @@
+from pathlib import Path
+import sys
+
+import pytest
+from flask import Flask
+
+# module du serveur web (importé comme app.py le fait, depuis son dossier)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "web"))
+from responses import prepare, send_prepared  # noqa: E402
+
+app = Flask(__name__)
+PREPARED = prepare([{"annee": 2020, "n": 1.0}])
+
+
+@app.route("/data")
+def data():
+    return send_prepared(PREPARED)
+
+
+@pytest.mark.parametrize("encoding, suffix", [("gzip", "-gz"), ("identity", "")])
+@pytest.mark.parametrize("template", ['"{}"', 'W/"{}"', '"autre", W/"{}"', "*"])
+def test_if_none_match_weak_comparison(encoding, suffix, template):
+    client = app.test_client()
+    etag = PREPARED.etag + suffix
+    resp = client.get("/data", headers={"Accept-Encoding": encoding, "If-None-Match": template.format(etag)})
+    assert resp.status_code == 304
+    assert resp.headers["ETag"] == f'"{etag}"'
+    assert "Accept-Encoding" in resp.headers["Vary"]
+
+
+def test_if_none_match_other_etag():
+    resp = app.test_client().get("/data", headers={"Accept-Encoding": "identity", "If-None-Match": 'W/"autre"'})
+    assert resp.status_code == 200 and resp.get_json() == [{"annee": 2020, "n": 1.0}]
@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl.bootstrap import MAX_BINS, StreamIntervals, intervals
+from etl.extract import extract
+from etl.load import load
+from etl.stream import stream_etl
+from etl.transform import transform
+
+ROLLUP_FILES = ["by_year.json", "by_domaine.json", "by_academie.json"]
+
+
+def _rows(path):
+    payload = json.load(open(path))
+    return pd.DataFrame(payload if isinstance(payload, list) else payload.get("rows", payload))
+
+
+def test_stream_text_fallback_matches_memory(tmp_path, fallback_csv):
+    # lecture typée impossible ("> 95") : repli texte dans le scan et les blocs
+    mem, flux = tmp_path / "mem", tmp_path / "flux"
+    load(transform(extract(fallback_csv, typed=True, cache_dir=tmp_path / "cache")), mem)
+    stream_etl([fallback_csv], flux, chunk_bytes=8 << 10, rank_index=False)
+    for name in ROLLUP_FILES:
+        a, b = _rows(mem / name), _rows(flux / name)
+        assert list(a.columns) == list(b.columns) and len(a) == len(b), name
+        num = a.select_dtypes("number").columns
+        pd.testing.assert_frame_equal(a.drop(columns=num), b.drop(columns=num), check_dtype=False)
+        # médianes et intervalles : arrondis au pas des histogrammes (exacts ici, 10 EUR au pire)
+        np.testing.assert_allclose(b[num].to_numpy(float), a[num].to_numpy(float), rtol=1e-9, atol=10)
+
+
+def test_stream_intervals_bounded_range():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"g": rng.integers(0, 3, 6000).astype(str), "x": rng.lognormal(7, 1.5, 6000),
+                       "w": rng.integers(1, 50, 6000).astype(float)})
+    df.loc[5, "x"] = np.inf
+    metrics = {"med": ("wmedian", "x")}
+    acc = StreamIntervals({"g": ("g", metrics)}, weight="w", steps={"x": 10})
+    for start in range(0, len(df), 1000):
+        acc.update(df.iloc[start:start + 1000])
+    plan = acc.groupings["g"]["plans"]["med"]
+    assert plan["state"][2] <= MAX_BINS
+    assert plan["step"] > 10
+    # erreur de l'histogramme grossi : au plus un pas final
+    exact = intervals(df[np.isfinite(df["x"])], "g", metrics, weight="w")
+    got = acc.result("g")
+    for col in ("med_ic_bas", "med_ic_haut"):
+        np.testing.assert_allclose(got[col], exact[col], atol=plan["step"])
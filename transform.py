@@ -1,5 +1,10 @@
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from etl.instrument import rss_bytes
+from etl.parallel import pmap
 
 # Colonnes numériques à convertir (si présentes)
 NUMERIC_COLS = [
@@ -50,8 +55,22 @@ DROP_COLS = [
     "numero_de_l_etablissement",
 ]
 
-def _to_num(series: pd.Series) -> pd.Series:
-    """Convertit en numérique en gérant virgules + 'ns'."""
+# Aliases pour gérer les variations de noms (IMPORTANT pour taux d'emploi)
+ALIASES = {
+    "taux_emploi": "taux_d_emploi",
+    "taux d emploi": "taux_d_emploi",
+    "taux d'emploi": "taux_d_emploi",
+    "taux d’emploi": "taux_d_emploi",
+}
+
+# Nombre valide après normalisation (espaces et "+" devant un chiffre retirés, virgule -> point), infinis
+# compris comme pd.to_numeric ; sinon NaN (errors="coerce")
+_NUMBER_RE = r"^(-?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?|[+-]?(?i:inf|infinity))$"
+_INT_RE = r"^-?\d+$"
+
+
+def _to_num_legacy(series: pd.Series) -> pd.Series:
+    """Conversion pandas historique (repli si la colonne n'est pas convertible en tableau Arrow)."""
     return pd.to_numeric(
         series.astype(str)
               .str.strip()
@@ -60,6 +79,64 @@ def _to_num(series: pd.Series) -> pd.Series:
         errors="coerce",
     )
 
+
+def _parse_num(series: pd.Series) -> np.ndarray:
+    """
+    Texte brut -> tableau numpy, par kernels Arrow appliqués directement aux buffers de la colonne
+    (aucune colonne texte pandas intermédiaire). Mêmes résultats que _to_num_legacy, y compris
+    le type : int64 si toutes les valeurs sont des entiers présents (aucune nulle), float64 sinon.
+    """
+    try:
+        arr = pa.array(series, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return _to_num_legacy(series).to_numpy()
+    if not pa.types.is_string(arr.type) and not pa.types.is_large_string(arr.type):
+        return _to_num_legacy(series).to_numpy()
+    # "+" retiré seulement devant un chiffre ou "." (le cast int64 ne l'accepte pas) : "+-3", "+" restent invalides
+    arr = pc.replace_substring_regex(pc.replace_substring(pc.utf8_trim_whitespace(arr), ",", "."),
+                                     r"^\+([\d.])", r"\1")
+    valid = pc.match_substring_regex(arr, _NUMBER_RE)
+    # pc.all ignore les nulles : une seule cellule nulle et la colonne passe en float64 (NaN)
+    if arr.null_count == 0 and pc.all(pc.match_substring_regex(arr, _INT_RE), min_count=0).as_py():
+        try:
+            return pc.cast(arr, pa.int64()).to_numpy(zero_copy_only=False)
+        except pa.ArrowInvalid:
+            pass  # hors de int64 : flottants, comme pd.to_numeric
+    values = pc.cast(pc.if_else(valid, arr, pa.scalar(None, arr.type)), pa.float64())
+    return values.to_numpy(zero_copy_only=False)
+
+
+def _to_num(series: pd.Series) -> pd.Series:
+    """Convertit en numérique en gérant virgules + 'ns'."""
+    # Déjà typée (extract typé) : rien à re-parser
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    return pd.Series(_parse_num(series), index=series.index, name=series.name, copy=False)
+
+
+def rate_scale(max_value: float) -> float:
+    """Diviseur d'une colonne de taux d'après son maximum : 100 si en % (max > 1.5), sinon 1."""
+    return 100.0 if max_value == max_value and max_value > 1.5 else 1.0
+
+
+def _standardize_rate(values: np.ndarray, owned: bool, scale: float | None = None) -> np.ndarray:
+    """
+    Version tableau de _standardize_rate_col : modifie `values` sur place quand le tableau
+    nous appartient (float64 inscriptible), sinon une seule copie.
+    scale : diviseur imposé (ETL en flux : décidé sur le fichier entier, pas sur le bloc).
+    """
+    if not (owned and values.dtype == np.float64 and values.flags.writeable):
+        if values.dtype.kind != "f" and scale is None:
+            return _standardize_rate_col(pd.Series(values)).to_numpy()
+        values = values.astype(np.float64, copy=True)
+    if scale is None:
+        scale = rate_scale(np.nanmax(values)) if not np.isnan(values).all() else 1.0
+    if scale != 1.0:
+        np.divide(values, scale, out=values)
+    np.clip(values, 0, 1, out=values)
+    return values
+
+
 def _standardize_rate_col(s: pd.Series) -> pd.Series:
     """
     Si la colonne est en % (max > 1.5), on divise par 100.
@@ -72,48 +149,68 @@ def _standardize_rate_col(s: pd.Series) -> pd.Series:
             s = s / 100.0
     return s.clip(lower=0, upper=1)
 
-def transform(df: pd.DataFrame) -> pd.DataFrame:
-    data = df.copy()
-
-    # 1) Normalisation des noms de colonnes (évite espaces cachés)
-    data.columns = [c.strip() for c in data.columns]
+def transform(df: pd.DataFrame, workers: int = 1, scales: dict | None = None,
+              seuil: float | None = None, verbose: bool = True) -> pd.DataFrame:
+    """
+    Nettoyage sans copie défensive : l'entrée n'est jamais modifiée, les colonnes inchangées
+    sont partagées avec elle et chaque colonne numérique est produite une seule fois
+    (parsing vectorisé Arrow, taux standardisés sur place). Le DataFrame de sortie est
+    assemblé en une fois ; pic mémoire ~ entrée + colonnes converties.
+    workers > 1 : colonnes numériques converties en parallèle (résultat identique).
+    scales / seuil : diviseur de chaque taux et seuil de insertion_ok calculés sur l'ensemble
+    des données (ETL en flux, etl/stream.py : `df` n'est qu'un bloc) ; par défaut, sur `df`.
+    """
+    in_bytes = int(df.memory_usage(index=False).sum())
+    rss0 = peak = rss_bytes() or 0
 
-    # 2) Aliases pour gérer les variations de noms (IMPORTANT pour taux d'emploi)
-    ALIASES = {
-        "taux_emploi": "taux_d_emploi",
-        "taux d emploi": "taux_d_emploi",
-        "taux d'emploi": "taux_d_emploi",
-        "taux d’emploi": "taux_d_emploi",
-    }
+    # 1-3) Noms normalisés, aliases et colonnes inutiles : une seule passe sur les noms
+    names = [c.strip() for c in df.columns]
     for k, v in ALIASES.items():
-        if k in data.columns and v not in data.columns:
-            data = data.rename(columns={k: v})
-
-    # 3) Drop colonnes inutiles
-    for c in DROP_COLS:
-        if c in data.columns:
-            data = data.drop(columns=c)
+        if k in names and v not in names:
+            names[names.index(k)] = v
+    keep = [(raw, name) for raw, name in zip(df.columns, names) if name not in DROP_COLS]
 
-    # 4) Conversion numérique
-    for c in NUMERIC_COLS:
-        if c in data.columns:
-            data[c] = _to_num(data[c])
+    # 4-5) Conversion numérique + standardisation des taux : une tâche par colonne,
+    #      en parallèle si workers > 1 (threads : kernels Arrow hors GIL, colonnes partagées)
+    def convert(item):
+        raw, name = item
+        series = df[raw]
+        owned = not pd.api.types.is_numeric_dtype(series)
+        values = _parse_num(series) if owned else series.to_numpy()
+        if name in RATE_COLS:
+            values = _standardize_rate(values, owned, (scales or {}).get(name))
+        if owned:  # temporaires Arrow rendus au système colonne par colonne
+            pa.default_memory_pool().release_unused()
+        return values, rss_bytes() or 0
 
-    # 5) Standardisation des taux dans [0,1]
-    for c in RATE_COLS:
-        if c in data.columns:
-            data[c] = _standardize_rate_col(data[c])
+    numeric = [(raw, name) for raw, name in keep if name in NUMERIC_COLS]
+    converted = dict(zip([name for _, name in numeric], pmap(convert, numeric, workers)))
+    columns = {}
+    for raw, name in keep:
+        if name in converted:
+            columns[name], rss = converted[name]
+            peak = max(peak, rss)
+        else:
+            columns[name] = df[raw].array
 
     # 6) Filtrage minimum (on a besoin d'un taux d'insertion exploitable)
-    if "taux_dinsertion" in data.columns:
-        data = data.dropna(subset=["taux_dinsertion"])
+    index = df.index
+    if "taux_dinsertion" in columns:
+        mask = pd.notna(np.asarray(columns["taux_dinsertion"]))
+        if not mask.all():
+            columns = {name: col[mask] for name, col in columns.items()}
+            index = index[mask]
+    data = pd.DataFrame(columns, index=index, copy=False)
 
     # 7) Variable binaire (optionnelle)
     if "taux_dinsertion" in data.columns and len(data) > 0:
-        seuil = data["taux_dinsertion"].quantile(0.75)
+        if seuil is None:
+            seuil = data["taux_dinsertion"].quantile(0.75)
         data["insertion_ok"] = (data["taux_dinsertion"] >= seuil).astype(int)
     else:
         data["insertion_ok"] = 0
+    if not verbose:
+        return data
 
     # 8) DEBUG PRO : comprendre pourquoi taux_d_emploi devient null
     print("✅ DEBUG transform")
@@ -125,4 +222,8 @@ def transform(df: pd.DataFrame) -> pd.DataFrame:
     else:
         print(" - ❌ taux_d_emploi ABSENT (check nom exact dans CSV)")
 
+    peak = max(peak, rss_bytes() or 0)
+    out_bytes = int(data.memory_usage(index=False).sum())
+    print(f" - mémoire: entrée {in_bytes / 2**20:.1f} Mo, sortie {out_bytes / 2**20:.1f} Mo, "
+          f"pic RSS +{(peak - rss0) / 2**20:.1f} Mo")
     return data
\ No newline at end of file